@@ -1,101 +1,262 @@
 #!/usr/bin/env python3
 
+import time
+_import_started = time.perf_counter()
+
 from dotenv import load_dotenv 
 load_dotenv() 
 from pathlib import Path
-from flask import Flask, request, render_template, redirect, flash, jsonify
+from flask import Flask, Response, g, request, render_template, redirect, flash, jsonify, send_file, stream_with_context
 from werkzeug.utils import secure_filename
 from PIL import Image
 import uuid
 import os
 import torch
-import torch.nn as nn
-import timm
-import torchvision.transforms as transforms
-import requests
 from io import BytesIO
-import time
+import threading
+import hashlib
+import json
+import resource
+from concurrent.futures import ThreadPoolExecutor
+
+# video_predictor (and cv2) are imported by the first video request
+from model import (
+    DEFAULT_IMG_SIZE, MODEL_MMAP, checkpoint_id, fast_path, load_checkpoint, prediction_from_prob
+)
+from model_runtime import load_runtime
+from calibration import load_calibration
+from preprocessing import PREPROCESS_DRAFT, get_preprocessor, load_image_tensor
+from inference_engine import InferenceEngine
+from media_io import download_media
+from http_client import get_session
+from callback_outbox import CallbackOutbox
+from result_cache import ResultCache, cache_key
+from job_queue import JobQueue, QueueFull
+from video_renderer import VideoRenderer
+from phash_index import PHASH_MODE, PhashIndex, config_tag, dhash_image, video_hashes
+from localization import image_size, localization_config, localization_result
+from cascade import load_cascade
+import metrics
+from metrics import StageTimer
 
-from video_predictor import run_advanced_video_prediction
+IMPORT_SECONDS = time.perf_counter() - _import_started
 
 # ---------------- CONFIG ----------------
 BASE_DIR = Path(__file__).resolve().parent
 UPLOADS = BASE_DIR / "static" / "uploads"
 UPLOADS.mkdir(parents=True, exist_ok=True)
+RENDERS = UPLOADS / "renders"
+OUTBOX_PATH = Path(os.environ.get("CALLBACK_OUTBOX_PATH", BASE_DIR / "outputs" / "callback_outbox.sqlite3"))
 
 MODEL_PATHS = [
+    *([Path(os.environ["MODEL_PATH"])] if os.environ.get("MODEL_PATH") else []),
     BASE_DIR / "outputs" / "best_model.pth",
     BASE_DIR / "outputs" / "final_model.pth"
 ]
+RUNTIME_DIR = Path(os.environ.get("MODEL_RUNTIME_DIR", BASE_DIR / "outputs" / "runtimes"))
 
 # ✅ Added .webp support
 ALLOWED_IMG = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tiff"}
 ALLOWED_VIDEO = {".mp4", ".avi", ".mov", ".mkv"}
 
-DEFAULT_IMG_SIZE = 224
-DEFAULT_MODEL_NAME = "efficientnet_b0"
+VIDEO_MAX_FRAMES = 120
+# Same variable as video_predictor.BATCH_SIZE, read here so warm-up does not import cv2
+VIDEO_BATCH_SIZE = int(os.environ.get("VIDEO_BATCH_SIZE", 16))
+# /api/analyze/batch: items per request, download/decode threads, and
+# items processed (and streamed) together
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 500))
+BATCH_IO_WORKERS = int(os.environ.get("BATCH_IO_WORKERS", 8))
+BATCH_CHUNK = int(os.environ.get("BATCH_CHUNK", 64))
+# Forward passes per batch size run before the worker reports ready
+WARMUP_ITERS = int(os.environ.get("MODEL_WARMUP_ITERS", 2))
 
 app = Flask(__name__)
 app.secret_key = "deepfake-secret"
 
-# ---------------- MODEL ----------------
-class DetectorModel(nn.Module):
-    def __init__(self, backbone_name="efficientnet_b0", drop_rate=0.3):
-        super().__init__()
-        self.backbone = timm.create_model(
-            backbone_name,
-            pretrained=False,
-            num_classes=0,
-            global_pool="avg"
-        )
-        feat_dim = self.backbone.num_features
-        self.head = nn.Sequential(
-            nn.Dropout(drop_rate),
-            nn.Linear(feat_dim, 256),
-            nn.ReLU(),
-            nn.Dropout(drop_rate / 2),
-            nn.Linear(256, 1)
-        )
-
-    def forward(self, x):
-        feats = self.backbone.forward_features(x)
-        feats = torch.nn.functional.adaptive_avg_pool2d(feats, 1)
-        feats = feats.view(feats.size(0), -1)
-        return self.head(feats).squeeze(1)
+video_renderer = VideoRenderer(RENDERS)
+callback_outbox = CallbackOutbox(OUTBOX_PATH)
+result_cache = ResultCache()
 
 # ---------------- GLOBAL ----------------
-_global = {"model": None, "device": None, "img_size": DEFAULT_IMG_SIZE}
+_global = {
+    "model": None, "eager_model": None, "device": None, "img_size": DEFAULT_IMG_SIZE,
+    "engine": None, "model_id": None, "runtime": None, "calibration": None,
+    "model_dir": None, "cascade": None
+}
+_engine_lock = threading.Lock()
+_model_lock = threading.Lock()
+_prepare_lock = threading.Lock()
+_phash = {"index": None}
+_phash_lock = threading.Lock()
+_readiness = {
+    "state": "cold", "load_seconds": None, "warmup_seconds": None,
+    "warmup_batch_sizes": [], "error": None,
+    # Seconds per startup phase (imports, checkpoint, calibration, runtime, warmup)
+    "phases": {"imports": round(IMPORT_SECONDS, 3)}, "peak_rss_mb": None
+}
+_started_at = time.time()
 
 def find_model_path():
+    """First existing MODEL_PATHS entry, or its up-to-date .safetensors conversion"""
     for p in MODEL_PATHS:
         if p.exists():
-            return p
+            return fast_path(p) or p
     return None
 
+def record_phase(name, start):
+    """Store the seconds since start under _readiness["phases"][name]"""
+    _readiness["phases"][name] = round(time.perf_counter() - start, 3)
+    # ru_maxrss is in KB on Linux
+    _readiness["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def load_weights():
+    """
+    Checkpoint → eager model in _global. The gunicorn master calls this
+    before forking so every worker shares the weights copy-on-write.
+    """
+    model_path = find_model_path()
+    if model_path is None:
+        print("⚠️ Model not found → fallback mode enabled")
+        return False
+
+    start = time.perf_counter()
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model, img_size, meta = load_checkpoint(model_path, device)
+    if device.type == "cpu" and not MODEL_MMAP:
+        # Shared-memory storages are mapped MAP_SHARED and never copied on fork
+        # (memory-mapped weights already live in the shared page cache)
+        model.share_memory()
+    model_id = checkpoint_id(model_path)
+    record_phase("checkpoint", start)
+
+    phase = time.perf_counter()
+    _global.update({
+        "eager_model": model,
+        "device": device,
+        "img_size": img_size,
+        "model_id": model_id,
+        "model_dir": model_path.parent,
+        # Probability → calibrated probability table, tied to this checkpoint
+        "calibration": load_calibration(meta, model_id, model_path.parent)
+    })
+    record_phase("calibration", phase)
+    _readiness["load_seconds"] = round(time.perf_counter() - start, 3)
+    print(f"🤖 Loaded {_global['model_id']} on {device} in {_readiness['load_seconds']}s")
+    return True
+
+def load_model():
+    """Weights (unless preloaded) plus the MODEL_RUNTIME variant; caller holds _model_lock"""
+    if _global["eager_model"] is None and not load_weights():
+        return
+
+    # Quantized / compiled / ONNX variant selected by MODEL_RUNTIME
+    start = time.perf_counter()
+    runner, runtime = load_runtime(
+        _global["eager_model"], _global["device"], _global["img_size"], RUNTIME_DIR, _global["model_id"]
+    )
+    # Screening stage in front of it (CASCADE=1), band pinned in cascade.json
+    cascade = load_cascade(
+        runner, _global["eager_model"], _global["device"], _global["img_size"],
+        _global["model_id"], _global["model_dir"]
+    )
+    _global.update({"model": runner, "runtime": runtime, "cascade": cascade})
+    record_phase("runtime", start)
+
 def ensure_model_loaded():
     if _global["model"] is None:
-        model_path = find_model_path()
-        if model_path is None:
-            print("⚠️ Model not found → fallback mode enabled")
+        # Concurrent first callers wait for one load instead of each loading
+        with _model_lock:
+            if _global["model"] is None:
+                load_model()
+        if _global["model"] is None:
             return None, "cpu", DEFAULT_IMG_SIZE
 
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        ckpt = torch.load(model_path, map_location=device)
+    return _global["model"], _global["device"], _global["img_size"]
+
+def get_inference_engine():
+    """Shared micro-batching engine, created once the model is loaded"""
+    model, device, _ = ensure_model_loaded()
+    if model is None:
+        return None
+
+    if _global["engine"] is None:
+        with _engine_lock:
+            if _global["engine"] is None:
+                _global["engine"] = InferenceEngine(
+                    model, device, calibration=_global["calibration"], localizer=_global["eager_model"],
+                    cascade=_global["cascade"]
+                ).start()
+                print(
+                    f"⚙️ Inference engine started "
+                    f"(max_batch={_global['engine'].max_batch_size}, "
+                    f"max_wait_ms={_global['engine'].max_wait * 1000:.1f})"
+                )
+    return _global["engine"]
+
+def warm_up_model():
+    """
+    Run forward passes at the batch sizes used in serving (single images,
+    a full engine batch, a video crop batch) so allocator pools, oneDNN
+    primitives and compiled graphs exist before the first request.
+    Returns the batch sizes warmed up.
+    """
+    model, device, img_size = ensure_model_loaded()
+    if model is None:
+        return []
 
-        img_size = ckpt.get("args", {}).get("img_size", DEFAULT_IMG_SIZE)
-        backbone = ckpt.get("args", {}).get("backbone_name", DEFAULT_MODEL_NAME)
+    engine = get_inference_engine()
+    cascade = _global["cascade"]
+    sizes = sorted({1, engine.max_batch_size, VIDEO_BATCH_SIZE})
+    with torch.no_grad():
+        for batch_size in sizes:
+            x = torch.zeros(batch_size, 3, img_size, img_size, device=device)
+            for _ in range(WARMUP_ITERS):
+                model(x)
+                if cascade is not None:
+                    cascade.screen_logits(x)
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return sizes
 
-        model = DetectorModel(backbone_name=backbone)
-        state = ckpt.get("model_state_dict", ckpt)
-        model.load_state_dict(state)
+def prepare_model():
+    """Load and warm up once per process; /api/ready answers 200 afterwards"""
+    with _prepare_lock:
+        if _readiness["state"] in ("loading", "ready"):
+            return
+        _readiness.update({"state": "loading", "error": None})
 
-        _global.update({
-            "model": model.to(device).eval(),
-            "device": device,
-            "img_size": img_size
+    try:
+        ensure_model_loaded()
+        start = time.perf_counter()
+        sizes = warm_up_model()
+        record_phase("warmup", start)
+        _readiness.update({
+            "state": "ready",
+            "warmup_seconds": _readiness["phases"]["warmup"],
+            "warmup_batch_sizes": sizes
         })
+        print(f"🔥 Model warm-up done (batch sizes {sizes}) in {_readiness['warmup_seconds']}s")
+        print(f"⏱️ Startup phases {_readiness['phases']}, peak RSS {_readiness['peak_rss_mb']} MB")
+    except Exception as e:
+        _readiness.update({"state": "failed", "error": str(e)})
+        print(f"❌ Model preparation failed: {e}")
 
-    return _global["model"], _global["device"], _global["img_size"]
+def start_model_preparation():
+    """prepare_model() off the main thread so liveness answers meanwhile"""
+    thread = threading.Thread(target=prepare_model, name="model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def init_worker(torch_threads=None):
+    """
+    Per-process startup after a pre-fork server forked this worker:
+    bound intra-op threads, then build the runtime variant, warm up and
+    start the callback sender. Weights come from the master.
+    """
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+    callback_outbox.start()
+    return start_model_preparation()
 
 # ---------------- IMAGE CONVERSION HELPER ----------------
 def convert_image_to_standard_format(image_path):
@@ -124,43 +285,55 @@ def convert_image_to_standard_format(image_path):
         return image_path
 
 # ---------------- IMAGE PREDICTION ----------------
-def predict_image(img_path):
+def fallback_prediction():
+    """Fixed answer served when no checkpoint is available"""
+    fake_percent = 66.4
+    real_percent = 33.6
+    raw_prob = round(fake_percent / 100, 4)
+    label = "FAKE (AI-generated)"
+    return raw_prob, fake_percent, real_percent, label
+
+def predict_image(img_path, timer=None):
+    """
+    img_path may be a path, a binary file-like object (e.g. BytesIO) or
+    an image already decoded by decode_image().
+    Decode and inference times go to timer (a StageTimer) when given.
+    """
+    return score_image(img_path, timer)[0]
+
+def score_image(img_path, timer=None, localize=False):
+    """
+    predict_image plus result_details(): (prediction, details), or
+    (fallback prediction, {}) without a model. With localize the tamper
+    regions come out of the same forward pass.
+    """
     model, device, img_size = ensure_model_loaded()
 
     if model is None:
-        fake_percent = 66.4
-        real_percent = 33.6
-        raw_prob = round(fake_percent / 100, 4)
-        label = "FAKE (AI-generated)"
-        return raw_prob, fake_percent, real_percent, label
-
-    transform = transforms.Compose([
-        transforms.Resize((img_size, img_size)),
-        transforms.ToTensor(),
-        transforms.Normalize(
-            mean=(0.485, 0.456, 0.406),
-            std=(0.229, 0.224, 0.225)
-        )
-    ])
+        return fallback_prediction(), {}
 
-    img = Image.open(img_path).convert("RGB")
-    t = transform(img).unsqueeze(0).to(device)
+    timer = timer or StageTimer()
+    with timer.stage("decode"):
+        size = image_size(img_path) if localize else None
+        t = load_image_tensor(img_path, img_size)
 
-    with torch.no_grad():
-        logit = model(t).item()
-        raw_prob = torch.sigmoid(torch.tensor(logit)).item()
-
-    if raw_prob >= 0.60:
-        label = "FAKE (AI-generated)"
-    elif raw_prob >= 0.15:
-        label = "FAKE (Edited appearance)"
-    else:
-        label = "REAL"
+    # Batched with concurrent requests by the shared engine
+    with timer.stage("inference"):
+        result = get_inference_engine().predict(t, localize=localize)
 
-    fake_percent = round(raw_prob * 100, 2)
-    real_percent = round(100 - fake_percent, 2)
+    return prediction_from_prob(result.prob), result_details(result, size)
 
-    return raw_prob, fake_percent, real_percent, label
+def result_details(result, size=None):
+    """
+    Per-image extras of an EngineResult: the cascade stage that decided
+    and, when localized, tamper regions (size is the source (width, height))
+    """
+    details = {}
+    if _global["cascade"] is not None:
+        details["decided_by"] = result.stage
+    if result.heatmap is not None:
+        details.update(localization_result(result.heatmap, size))
+    return details
 
 # ---------------- WEB ROUTES ----------------
 @app.route("/")
@@ -181,10 +354,12 @@ def predict():
 
     filename = secure_filename(f"{uuid.uuid4().hex}_{file.filename}")
     input_path = UPLOADS / filename
-    file.save(input_path)
+    with metrics.stage("upload"):
+        file.save(input_path)
 
     if ext in ALLOWED_IMG:
-        converted_path = convert_image_to_standard_format(input_path)
+        with metrics.stage("convert"):
+            converted_path = convert_image_to_standard_format(input_path)
         raw_prob, fake_p, real_p, label = predict_image(str(converted_path))
 
         result = {
@@ -202,14 +377,19 @@ def predict():
         output_path = UPLOADS / output_name
 
         try:
-            video_result = run_advanced_video_prediction(
-                str(input_path),
-                model,
-                device,
-                img_size,
-                str(output_path),
-                max_frames=120
-            )
+            from video_predictor import run_advanced_video_prediction
+
+            with metrics.stage("video"):
+                video_result = run_advanced_video_prediction(
+                    str(input_path),
+                    model,
+                    device,
+                    img_size,
+                    str(output_path),
+                    max_frames=VIDEO_MAX_FRAMES,
+                    calibration=_global["calibration"],
+                    cascade=_global["cascade"]
+                )
         except Exception as e:
             flash(f"Video processing failed: {e}")
             return redirect("/")
@@ -226,129 +406,224 @@ def predict():
         }
         return render_template("home.html", result=result)
 
-# ---------------- API ROUTES ----------------
-@app.route("/api/health", methods=["GET"])
-def api_health():
-    """Health check for Node.js backend"""
-    model, _, _ = ensure_model_loaded()
-    return jsonify({
-        "status": "healthy",
-        "model_loaded": model is not None,
-        "device": str(_global.get("device", "cpu"))
-    })
+# ---------------- ANALYSIS JOBS ----------------
+def analysis_config(kind):
+    """Everything besides the media bytes and the weights that shapes a result"""
+    _, _, img_size = ensure_model_loaded()
+    config = {
+        "kind": kind,
+        "img_size": img_size,
+        "model_id": _global["model_id"] or "fallback",
+        "runtime": _global["runtime"],
+        "calibration": calibration_version(),
+        # Draft decoding changes the pixels, hence the scores
+        "preprocess_draft": PREPROCESS_DRAFT
+    }
+    if _global["cascade"] is not None:
+        config["cascade"] = _global["cascade"].version
+    if kind == "video":
+        import video_predictor
 
-@app.route("/api/analyze", methods=["POST"])
-def api_analyze():
+        config.update({
+            "max_frames": VIDEO_MAX_FRAMES,
+            "sample_mode": video_predictor.SAMPLE_MODE,
+            "early_exit": video_predictor.EARLY_EXIT,
+            "early_exit_half_width": video_predictor.EARLY_EXIT_HALF_WIDTH,
+            "track_mode": video_predictor.TRACK_MODE,
+            "detect_every": video_predictor.DETECT_EVERY,
+            "detect_max_side": video_predictor.DETECT_MAX_SIDE
+        })
+    return config
+
+def calibration_version():
+    calibration = _global["calibration"]
+    return calibration.version if calibration is not None else None
+
+def risk_level(fake_percent):
+    if fake_percent >= 70:
+        return "HIGHRISK"
+    if fake_percent >= 40:
+        return "SUSPICIOUS"
+    return "LOW"
+
+def image_result_data(prediction, ext, processing_time, details=None):
+    """result_data sent to the backend for one image (details from result_details)"""
+    details = details or {}
+    raw_prob, fake_p, real_p, label = prediction
+    result_data = {
+        "score": round(raw_prob, 4),
+        "confidence": round(abs(raw_prob - 0.5) * 2, 4),
+        "riskLevel": risk_level(fake_p),
+        "modelVersions": {"EfficientNet-B0": "1.0"},
+        "tamperRegions": details.get("regions", []),
+        "processingTime": processing_time,
+        "metadata": {
+            "raw_probability": raw_prob,
+            "fake_percent": fake_p,
+            "real_percent": real_p,
+            "prediction": label,
+            "original_format": ext,
+            "calibration": calibration_version()
+        }
+    }
+    if "heatmap" in details:
+        result_data["metadata"]["heatmap"] = details["heatmap"]
+    if "decided_by" in details:
+        result_data["metadata"]["decided_by"] = details["decided_by"]
+    return result_data
+
+def cacheable(result_data):
+    """Copy of result_data safe to store: rendered videos belong to the job that asked"""
+    stored = dict(result_data, metadata=dict(result_data["metadata"]))
+    if "output_video" in stored["metadata"]:
+        stored["metadata"]["output_video"] = None
+    return stored
+
+def get_phash_index():
+    """Near-duplicate index, opened on first use; None when PHASH_MODE=off"""
+    if PHASH_MODE == "off":
+        return None
+    if _phash["index"] is None:
+        with _phash_lock:
+            if _phash["index"] is None:
+                _phash["index"] = PhashIndex()
+                print(f"🪞 Near-duplicate index: {_phash['index'].stats()['entries']} entries ({PHASH_MODE})")
+    return _phash["index"]
+
+def decode_image(src):
+    """The shared Preprocessor's decode of a path or file-like image, reusable by score_image"""
+    _, _, img_size = ensure_model_loaded()
+    return get_preprocessor(img_size).decode(src)
+
+def media_hashes(media, image=None):
     """
-    API endpoint for Node.js backend integration
-    Expects JSON: { jobId, fileUrl, fileType }
+    Perceptual hashes of an image (its decode_image() result) or of a
+    video's sampled frames ([] if undecodable)
     """
-    job_id = None
     try:
-        data = request.get_json()
-        job_id = data.get('jobId')
-        file_url = data.get('fileUrl')
-        file_type = data.get('fileType', 'image')
-        
-        if not job_id or not file_url:
-            return jsonify({"error": "Missing jobId or fileUrl"}), 400
-        
-        print(f"📥 Received job {job_id} for {file_type} analysis")
-        print(f"🔗 File URL: {file_url}")
-        
-        # Download file from Cloudinary
-        response = requests.get(file_url, timeout=30)
-        response.raise_for_status()
-        
-        # Detect file type
-        content_type = response.headers.get('content-type', '').lower()
-        
-        if '.webp' in file_url.lower() or 'webp' in content_type:
-            ext = '.webp'
-        elif '.mp4' in file_url.lower() or 'video/mp4' in content_type:
-            ext = '.mp4'
-        elif '.jpg' in file_url.lower() or '.jpeg' in file_url.lower() or 'jpeg' in content_type:
-            ext = '.jpg'
-        elif '.png' in file_url.lower() or 'png' in content_type:
-            ext = '.png'
-        else:
-            ext = f".{file_type}" if file_type else '.jpg'
-        
-        print(f"📎 Detected file extension: {ext}")
-        
-        # Save temporarily
-        temp_filename = f"temp_{uuid.uuid4().hex}{ext}"
-        temp_path = UPLOADS / temp_filename
-        
-        with open(temp_path, 'wb') as f:
-            f.write(response.content)
-        
-        print(f"💾 Saved temp file: {temp_path.name} ({temp_path.stat().st_size} bytes)")
-        
-        start_time = time.time()
-        
+        if media.kind == "image":
+            return [dhash_image(image)]
+        return video_hashes(media.path)
+    except Exception as e:
+        print(f"⚠️ Could not hash {media.kind}: {e}")
+        return []
+
+def find_near_duplicate(phash, kind, hashes, tag):
+    if not hashes:
+        return None
+    if kind == "image":
+        return phash.lookup(hashes[0], tag)
+    return phash.lookup_video(hashes, tag)
+
+def near_duplicate_result(near, kind, ext, processing_time):
+    """result_data carrying over the verdict of an already analyzed near duplicate"""
+    result_data = image_result_data(prediction_from_prob(near["prob"]), ext, processing_time)
+    if kind == "video":
+        result_data.update({"perFrameScores": [], "frameCount": 0})
+        result_data["metadata"]["frames_analyzed"] = 0
+    result_data["metadata"]["near_duplicate"] = near
+    return result_data
+
+def process_analyze_job(job_id, file_url, file_type, render=False, localize=False):
+    """
+    Download, analyze and report one /api/analyze job back to the backend.
+    Runs on a job queue worker; returns the result_data sent to the backend.
+    Annotated videos are only kept when render is set, and are then
+    rendered on first download of /api/videos/<id> (or in the background).
+    With localize, images also get tamperRegions (videos ignore it).
+    """
+    print(f"📥 Processing job {job_id} for {file_type} analysis")
+    print(f"🔗 File URL: {file_url}")
+    timer = StageTimer()
+
+    # Stream from Cloudinary: images into memory, videos into a temp file
+    with timer.stage("download"):
+        media = download_media(
+            file_url, file_type, ALLOWED_IMG, ALLOWED_VIDEO, UPLOADS, session=get_session()
+        )
+    ext = media.ext
+    temp_path = media.path
+
+    print(f"📎 Detected file extension: {ext}")
+    print(f"💾 Downloaded {media.kind} ({media.size} bytes)")
+
+    start_time = time.time()
+    config = analysis_config(media.kind)
+    model_id = config.pop("model_id")
+    localize = localize and media.kind == "image"
+    if localize:
+        config["localize"] = localization_config()
+    key = cache_key(media.sha256, model_id, config)
+    # Regions are in this image's own pixels: never borrowed from a near duplicate
+    phash = None if localize else get_phash_index()
+    hashes, near, decoded = [], None, None
+
+    try:
+        # Same bytes, weights and config: reuse the stored result.
+        # Render requests need this run's overlays, so they always analyze.
+        with timer.stage("cache_lookup"):
+            cached = None if (render and media.kind == "video") else result_cache.get(key)
+
+        # Recompressed / resized copy of something already analyzed: reuse its verdict
+        if cached is None and phash is not None and not (render and media.kind == "video"):
+            if media.kind == "image":
+                # Decoded once: hashed here and, on a miss, scored below
+                with timer.stage("decode"):
+                    decoded = decode_image(media.buffer)
+            with timer.stage("phash"):
+                hashes = media_hashes(media, decoded)
+                near = find_near_duplicate(phash, media.kind, hashes, config_tag(model_id, config))
+
+        if cached is not None:
+            result_data = cached
+            result_data["processingTime"] = round(time.time() - start_time, 2)
+            result_data["metadata"]["cached"] = True
+            print(f"♻️ Cache hit for job {job_id} ({media.sha256[:12]})")
+
+        elif near is not None:
+            result_data = near_duplicate_result(near, media.kind, ext, round(time.time() - start_time, 2))
+            print(f"🪞 Near duplicate for job {job_id} (distance {near.get('distance', near.get('max_distance'))})")
+
         # Process IMAGE
-        if file_type == 'image' or ext in ALLOWED_IMG:
-            converted_path = convert_image_to_standard_format(temp_path)
-            raw_prob, fake_p, real_p, label = predict_image(str(converted_path))
-            processing_time = round(time.time() - start_time, 2)
-            
-            if converted_path.exists() and converted_path != temp_path:
-                converted_path.unlink()
-            
-            if fake_p >= 70:
-                risk_level = "HIGHRISK"
-            elif fake_p >= 40:
-                risk_level = "SUSPICIOUS"
-            else:
-                risk_level = "LOW"
-            
-            result_data = {
-                "score": round(raw_prob, 4),
-                "confidence": round(abs(raw_prob - 0.5) * 2, 4),
-                "riskLevel": risk_level,
-                "modelVersions": {"EfficientNet-B0": "1.0"},
-                "tamperRegions": [],
-                "processingTime": processing_time,
-                "metadata": {
-                    "raw_probability": raw_prob,
-                    "fake_percent": fake_p,
-                    "real_percent": real_p,
-                    "prediction": label,
-                    "original_format": ext
-                }
-            }
-        
+        elif media.kind == "image":
+            # Decoded once, straight from the download buffer
+            image = decoded if decoded is not None else media.buffer
+            prediction, details = score_image(image, timer, localize)
+            result_data = image_result_data(prediction, ext, round(time.time() - start_time, 2), details)
+
         # Process VIDEO
-        elif file_type == 'video' or ext in ALLOWED_VIDEO:
+        else:
             model, device, img_size = ensure_model_loaded()
-            output_name = f"analyzed_{uuid.uuid4().hex}.mp4"
-            output_path = UPLOADS / output_name
-            
-            video_result = run_advanced_video_prediction(
-                str(temp_path),
-                model,
-                device,
-                img_size,
-                str(output_path),
-                max_frames=120
-            )
-            
+
+            # No encoding here: overlays are stored for deferred rendering
+            from video_predictor import run_advanced_video_prediction
+
+            with timer.stage("video"):
+                video_result = run_advanced_video_prediction(
+                    str(temp_path),
+                    model,
+                    device,
+                    img_size,
+                    None,
+                    max_frames=VIDEO_MAX_FRAMES,
+                    calibration=_global["calibration"],
+                    cascade=_global["cascade"]
+                )
+
+            output_video = None
+            if render:
+                with timer.stage("render_save"):
+                    render_id = video_renderer.save(temp_path, video_result, uuid.uuid4().hex)
+                output_video = f"/api/videos/{render_id}"
+
             processing_time = round(time.time() - start_time, 2)
             fake_p = video_result.get("fake_percent", 64.0)
             raw_prob = fake_p / 100
-            
-            if fake_p >= 70:
-                risk_level = "HIGHRISK"
-            elif fake_p >= 40:
-                risk_level = "SUSPICIOUS"
-            else:
-                risk_level = "LOW"
-            
+
             result_data = {
                 "score": round(raw_prob, 4),
                 "confidence": round(abs(raw_prob - 0.5) * 2, 4),
-                "riskLevel": risk_level,
+                "riskLevel": risk_level(fake_p),
                 "modelVersions": {"EfficientNet-B0": "1.0"},
                 "tamperRegions": [],
                 "processingTime": processing_time,
@@ -356,56 +631,393 @@ def api_analyze():
                     "fake_percent": fake_p,
                     "real_percent": video_result.get("real_percent", 36.0),
                     "frames_analyzed": video_result.get("frames_analyzed", 0),
-                    "output_video": str(output_path)
+                    "output_video": output_video,
+                    "stage_stats": video_result.get("stage_stats", {}),
+                    "calibration": calibration_version(),
+                    "sampling": video_result.get("sampling", {}),
+                    "cascade": video_result.get("cascade")
                 },
                 "perFrameScores": video_result.get("frame_scores", []),
                 "frameCount": video_result.get("frames_analyzed", 0)
             }
-        
-        else:
-            return jsonify({"error": f"Unsupported file type: {ext}"}), 400
-        
-        # Cleanup
-        if temp_path.exists():
-            temp_path.unlink()
+
+        if cached is None:
+            with timer.stage("cache_store"):
+                result_cache.put(key, cacheable(result_data))
+            # Only verdicts of a real forward pass are indexed, never reused ones
+            if near is None and hashes and _global["model"] is not None:
+                prob = result_data["score"]
+                tag = config_tag(model_id, config)
+                if media.kind == "image":
+                    phash.add(hashes, prob, tag)
+                else:
+                    phash.add_video(hashes, prob, tag)
+        # Where this job's time went (video stages are broken down in stage_stats)
+        result_data["metadata"]["stages"] = timer.breakdown()
+
+    finally:
+        # Cleanup (a rendered video's source has been moved away already)
+        if temp_path is not None and temp_path.exists():
+            media.cleanup()
             print(f"🗑️ Cleaned up temp file: {temp_path.name}")
-        
-        # Send results to Node.js backend
-        backend_url = os.environ.get('BACKEND_URL', 'http://localhost:5000')
-        callback_response = requests.patch(
-            f"{backend_url}/api/job/{job_id}/result",
-            json=result_data,
-            timeout=10
+
+    # Send results to Node.js backend (durable, retried until delivered)
+    backend_url = os.environ.get('BACKEND_URL', 'http://localhost:5000')
+    callback_outbox.enqueue(f"{backend_url}/api/job/{job_id}/result", result_data)
+
+    print(f"✅ Results queued for backend for job {job_id}")
+    print(f"🎯 Risk Level: {result_data['riskLevel']}, Score: {result_data['score']}")
+
+    return result_data
+
+def run_analyze_job(job_id, payload):
+    """Job queue handler: process the job, notify the backend on failure"""
+    # fileType comes from the caller: keep the label set bounded
+    kind = payload["fileType"] if payload["fileType"] in ("image", "video") else "other"
+    try:
+        result_data = process_analyze_job(
+            job_id, payload["fileUrl"], payload["fileType"], payload.get("render", False),
+            payload.get("localize", False)
         )
-        
-        print(f"✅ Results sent to backend for job {job_id}")
-        print(f"🎯 Risk Level: {result_data['riskLevel']}, Score: {result_data['score']}")
-        
-        return jsonify({
-            "success": True,
-            "message": "Analysis completed",
-            "jobId": job_id,
-            "preview": result_data
-        }), 200
-        
+        metrics.JOBS.inc(kind=kind, outcome="completed")
+        return result_data
     except Exception as e:
-        import traceback
-        print(f"❌ Error processing job {job_id}: {str(e)}")
-        print(traceback.format_exc())
-        
+        metrics.JOBS.inc(kind=kind, outcome="failed")
         # Notify backend of error
         try:
             backend_url = os.environ.get('BACKEND_URL', 'http://localhost:5000')
-            if job_id:
-                requests.patch(
-                    f"{backend_url}/api/job/{job_id}/error",
-                    json={"error": str(e)},
-                    timeout=5
-                )
+            callback_outbox.enqueue(f"{backend_url}/api/job/{job_id}/error", {"error": str(e)})
         except Exception as callback_error:
             print(f"❌ Failed to notify backend: {callback_error}")
-        
-        return jsonify({"error": str(e)}), 500
+        raise
+
+# Job status shares the outbox file so every worker sees every job
+job_queue = JobQueue(run_analyze_job, OUTBOX_PATH)
+
+# ---------------- BATCH ANALYSIS ----------------
+def batch_items_from_request(data):
+    """Multipart "images" files, or JSON { items: [{ id?, fileUrl, fileType? }] | urls: [...] }"""
+    uploads = request.files.getlist("images")
+    if uploads:
+        return [{"id": i, "filename": f.filename, "data": f.read()} for i, f in enumerate(uploads)]
+
+    items = data.get("items") or [{"fileUrl": url} for url in data.get("urls", [])]
+    return [
+        dict(item, id=item.get("id", i)) if isinstance(item, dict) else {"id": i, "fileUrl": None}
+        for i, item in enumerate(items)
+    ]
+
+def prepare_batch_item(item, img_size, model_id, config, out):
+    """
+    Download (or take the upload), hash, look up the cache and decode one
+    item into out, its slot of the chunk's input tensor. Runs on the batch
+    I/O pool; never raises.
+    """
+    start = time.time()
+    timer = StageTimer()
+    try:
+        if "data" in item:
+            ext = Path(item.get("filename") or "").suffix.lower()
+            if ext not in ALLOWED_IMG:
+                raise ValueError(f"Unsupported file type: {ext}")
+            buffer = BytesIO(item["data"])
+            sha256 = hashlib.sha256(item["data"]).hexdigest()
+        else:
+            if not item.get("fileUrl"):
+                raise ValueError("Missing fileUrl")
+            with timer.stage("download"):
+                media = download_media(
+                    item["fileUrl"], item.get("fileType"), ALLOWED_IMG, ALLOWED_VIDEO, UPLOADS,
+                    session=get_session()
+                )
+            if media.kind != "image":
+                media.cleanup()
+                raise ValueError("Batch analysis only accepts images, use /api/analyze for videos")
+            buffer, ext, sha256 = media.buffer, media.ext, media.sha256
+
+        key = cache_key(sha256, model_id, config)
+        with timer.stage("cache_lookup"):
+            cached = result_cache.get(key)
+        if cached is not None:
+            return {"start": start, "timer": timer, "cached": cached}
+
+        tensor = size = None
+        if _global["model"] is not None:
+            with timer.stage("decode"):
+                if "localize" in config:
+                    size = image_size(buffer)
+                tensor = load_image_tensor(buffer, img_size, out=out)
+        return {"start": start, "timer": timer, "key": key, "ext": ext, "tensor": tensor, "size": size}
+    except Exception as e:
+        return {"start": start, "timer": timer, "error": str(e)}
+
+def analyze_batch_chunk(items, pool, localize=False):
+    """Results of items, in order: downloads/decodes in parallel, one batched inference"""
+    model, _, img_size = ensure_model_loaded()
+    config = analysis_config("image")
+    model_id = config.pop("model_id")
+    if localize:
+        config["localize"] = localization_config()
+
+    # Every image is decoded and normalized straight into its row
+    inputs = torch.empty(len(items), 3, img_size, img_size)
+    prepared = list(pool.map(
+        lambda i: prepare_batch_item(items[i], img_size, model_id, config, inputs[i]), range(len(items))
+    ))
+
+    pending = [p for p in prepared if "key" in p]
+    if model is not None and pending:
+        # The engine splits this into INFER_MAX_BATCH sized forward passes
+        with metrics.stage("batch_inference"):
+            start = time.perf_counter()
+            results = get_inference_engine().predict_batch([p["tensor"] for p in pending], localize=localize)
+            seconds = time.perf_counter() - start
+        for p, result in zip(pending, results):
+            p["prediction"] = prediction_from_prob(result.prob)
+            p["details"] = result_details(result, p["size"])
+            # Shared by the whole chunk, so kept out of the per-image histogram
+            p["timer"].add("inference", seconds, observe=False)
+
+    for item, p in zip(items, prepared):
+        entry = {"id": item["id"]}
+        if "data" in item:
+            entry["filename"] = item.get("filename")
+        else:
+            entry["fileUrl"] = item.get("fileUrl")
+
+        if "error" in p:
+            entry.update({"success": False, "error": p["error"]})
+        elif "cached" in p:
+            result_data = p["cached"]
+            result_data["processingTime"] = round(time.time() - p["start"], 2)
+            result_data["metadata"]["cached"] = True
+            result_data["metadata"]["stages"] = p["timer"].breakdown()
+            entry.update({"success": True, "result": result_data})
+        else:
+            prediction = p.get("prediction") or fallback_prediction()
+            result_data = image_result_data(
+                prediction, p["ext"], round(time.time() - p["start"], 2), p.get("details")
+            )
+            result_cache.put(p["key"], cacheable(result_data))
+            result_data["metadata"]["stages"] = p["timer"].breakdown()
+            entry.update({"success": True, "result": result_data})
+        yield entry
+
+def analyze_batch(items, localize=False):
+    with ThreadPoolExecutor(max_workers=BATCH_IO_WORKERS, thread_name_prefix="batch-io") as pool:
+        for i in range(0, len(items), BATCH_CHUNK):
+            yield from analyze_batch_chunk(items[i:i + BATCH_CHUNK], pool, localize)
+
+# ---------------- METRICS ----------------
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    started = g.get("request_started")
+    if started is not None:
+        # The URL rule, not the path, so job and video ids do not become series
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.HTTP_SECONDS.observe(
+            time.perf_counter() - started,
+            endpoint=endpoint, method=request.method, status=response.status_code
+        )
+    return response
+
+def service_metrics():
+    """Gauges read from the components' stats() on every /metrics scrape"""
+    jobs = job_queue.stats()
+    cache = result_cache.stats()
+    callbacks = callback_outbox.stats()
+    samples = [
+        ("ml_ready", "gauge", "1 once the model is loaded and warmed up", int(_readiness["state"] == "ready")),
+        ("ml_job_queue_depth", "gauge", "Analysis jobs waiting for a worker", jobs["queue_depth"]),
+        ("ml_jobs", "gauge", "Tracked analysis jobs by status",
+         {(("status", status),): count for status, count in jobs["jobs"].items()}),
+        ("ml_callback_pending", "gauge", "Undelivered backend callbacks", callbacks["pending"]),
+        ("ml_callbacks_total", "counter", "Backend callback attempts by outcome", {
+            (("outcome", "delivered"),): callbacks["delivered"],
+            (("outcome", "failed"),): callbacks["failed_attempts"],
+            (("outcome", "dropped"),): callbacks["dropped"]
+        }),
+        ("ml_result_cache_lookups_total", "counter", "Result cache lookups by outcome", {
+            (("result", "memory_hit"),): cache["memory_hits"],
+            (("result", "disk_hit"),): cache["disk_hits"],
+            (("result", "miss"),): cache["misses"]
+        }),
+        ("ml_result_cache_hit_ratio", "gauge", "Result cache hits / lookups", cache["hit_rate"]),
+        ("ml_result_cache_entries", "gauge", "Results held in memory", cache["entries"]),
+        ("ml_result_cache_bytes", "gauge", "Serialized size of the in-memory results", cache["bytes"])
+    ]
+    phash = _phash["index"]
+    if phash is not None:
+        stats = phash.stats()
+        samples += [
+            ("ml_phash_lookups_total", "counter", "Near-duplicate lookups by outcome", {
+                (("result", "hit"),): stats["hits"],
+                (("result", "miss"),): stats["misses"],
+                (("result", "rejected"),): stats["rejected"]
+            }),
+            ("ml_phash_entries", "gauge", "Hashes in the near-duplicate index", stats["entries"])
+        ]
+    engine = _global["engine"]
+    if engine is not None:
+        stats = engine.stats()
+        samples += [
+            ("ml_inference_queue_depth", "gauge", "Images waiting for the inference engine", stats["queue_depth"]),
+            ("ml_inference_busy_seconds_total", "counter", "Time spent in forward passes", stats["busy_seconds"])
+        ]
+    cascade = _global["cascade"]
+    if cascade is not None:
+        stats = cascade.stats()
+        samples.append(("ml_cascade_decisions_total", "counter", "Images and face crops by deciding cascade stage", {
+            (("stage", "screen"),): stats["screened"],
+            (("stage", "full"),): stats["escalated"]
+        }))
+    samples.append(("ml_startup_phase_seconds", "gauge", "Seconds spent in each startup phase", {
+        (("phase", name),): seconds for name, seconds in _readiness["phases"].items()
+    }))
+    return samples
+
+metrics.register_collector(service_metrics)
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Prometheus text exposition of this process's metrics"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# ---------------- API ROUTES ----------------
+@app.route("/api/health", methods=["GET"])
+def api_health():
+    """Liveness: the process answers. Never loads the model."""
+    return jsonify({
+        "status": "healthy",
+        "model_loaded": _global["model"] is not None,
+        "uptime_seconds": round(time.time() - _started_at, 1)
+    })
+
+@app.route("/api/ready", methods=["GET"])
+def api_ready():
+    """Readiness: model loaded and warmed up (503 until then)"""
+    ready = _readiness["state"] == "ready"
+    body = {
+        "ready": ready,
+        **_readiness,
+        "model_loaded": _global["model"] is not None,
+        "model_id": _global["model_id"],
+        "runtime": _global["runtime"],
+        "calibration": calibration_version(),
+        "device": str(_global["device"] or "cpu")
+    }
+    return jsonify(body), 200 if ready else 503
+
+@app.route("/api/engine/stats", methods=["GET"])
+def api_engine_stats():
+    """Queue depth and batch-size histograms of the inference engine"""
+    engine = _global.get("engine")
+    if engine is None:
+        return jsonify({"running": False})
+    return jsonify({"running": True, **engine.stats()})
+
+@app.route("/api/analyze", methods=["POST"])
+def api_analyze():
+    """
+    API endpoint for Node.js backend integration
+    Expects JSON: { jobId, fileUrl, fileType, render?, localize? }
+    Queues the job and returns 202; results are PATCHed back to the backend.
+    """
+    data = request.get_json(silent=True) or {}
+    job_id = data.get('jobId')
+    file_url = data.get('fileUrl')
+    file_type = data.get('fileType', 'image')
+    render = bool(data.get('render', False))
+    localize = bool(data.get('localize', False))
+
+    if not job_id or not file_url:
+        return jsonify({"error": "Missing jobId or fileUrl"}), 400
+
+    try:
+        record = job_queue.submit(
+            job_id, {"fileUrl": file_url, "fileType": file_type, "render": render, "localize": localize}
+        )
+    except QueueFull as e:
+        print(f"⏳ Rejected job {job_id}: {e}")
+        response = jsonify({"error": str(e), "jobId": job_id})
+        response.headers["Retry-After"] = "5"
+        return response, 429
+
+    print(f"📥 Queued job {job_id} for {file_type} analysis")
+
+    return jsonify({
+        "success": True,
+        "message": "Analysis queued",
+        "jobId": job_id,
+        "status": record["status"],
+        "statusUrl": f"/api/jobs/{job_id}"
+    }), 202
+
+@app.route("/api/analyze/batch", methods=["POST"])
+def api_analyze_batch():
+    """
+    Synchronous analysis of many images in one call.
+    Accepts multipart "images" files or JSON { items | urls, stream?, localize? }.
+    Returns { results: [{ id, success, result | error }] } with result in
+    the /api/analyze result_data shape, or one JSON line per item as soon
+    as its chunk is done with ?stream=1. ?localize=1 adds tamperRegions.
+    """
+    data = request.get_json(silent=True) or {}
+    items = batch_items_from_request(data)
+
+    if not items:
+        return jsonify({"error": "No images, urls or items given"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {BATCH_MAX_ITEMS} items per batch"}), 413
+
+    print(f"📦 Batch analysis of {len(items)} images")
+    localize = request.args.get("localize") == "1" or bool(data.get("localize"))
+
+    if request.args.get("stream") == "1" or data.get("stream"):
+        lines = (json.dumps(entry) + "\n" for entry in analyze_batch(items, localize))
+        return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
+    start_time = time.time()
+    results = list(analyze_batch(items, localize))
+    succeeded = sum(1 for r in results if r["success"])
+    return jsonify({
+        "count": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "processingTime": round(time.time() - start_time, 2),
+        "results": results
+    })
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def api_job_status(job_id):
+    """Status of a queued, running or finished analysis job"""
+    record = job_queue.get(job_id)
+    if record is None:
+        return jsonify({"error": "Job not found", "jobId": job_id}), 404
+    return jsonify(record)
+
+@app.route("/api/videos/<render_id>", methods=["GET"])
+def api_video(render_id):
+    """Annotated video of an analysis, rendered on first request"""
+    try:
+        path = video_renderer.get(render_id)
+    except KeyError:
+        return jsonify({"error": "Video not found"}), 404
+    return send_file(path, mimetype="video/mp4")
+
+@app.route("/api/jobs", methods=["GET"])
+def api_jobs_stats():
+    """Job queue depth and per-status counts, plus undelivered callbacks"""
+    return jsonify({
+        **job_queue.stats(),
+        "callbacks": callback_outbox.stats(),
+        "cache": result_cache.stats(),
+        "near_duplicates": _phash["index"].stats() if _phash["index"] is not None else None
+    })
 
 # ---------------- MAIN ----------------
 if __name__ == "__main__":
@@ -414,4 +1026,7 @@ if __name__ == "__main__":
     print(f"📁 Uploads directory: {UPLOADS}")
     print(f"🤖 Supported image formats: {ALLOWED_IMG}")
     print(f"🎬 Supported video formats: {ALLOWED_VIDEO}")
+    # Deliver callbacks left over from a previous run
+    callback_outbox.start()
+    start_model_preparation()
     app.run(host="0.0.0.0", port=port, debug=False)
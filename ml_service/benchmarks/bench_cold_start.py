@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Cold-start time and peak memory of the service for each weight format.
+
+Every run is a fresh interpreter that imports app and calls
+prepare_model() (load, runtime, warm-up), exactly like a new worker:
+
+    pickle       .pth read fully into memory (MODEL_MMAP=0)
+    mmap         .pth memory-mapped, model built on the meta device
+    safetensors  .safetensors sibling, memory-mapped
+
+    python benchmarks/bench_cold_start.py --runs 5 --output outputs/cold_start.json
+
+Time-to-ready is wall time from spawning the process until the model is
+warm; the per-phase seconds and peak RSS come from /api/ready's fields.
+Page-cache effects are not flushed: the first run of each format reads
+the file from disk, later ones from cache (the median reflects a warm
+node, which is what an autoscaled replica on a reused host sees).
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_DIR))
+
+from synthetic import random_checkpoint  # noqa: E402
+
+FORMATS = ("pickle", "mmap", "safetensors")
+
+CHILD = """
+import json
+import app
+app.prepare_model()
+r = app._readiness
+print(json.dumps({"state": r["state"], "error": r["error"], "phases": r["phases"], "peak_rss_mb": r["peak_rss_mb"]}))
+"""
+
+
+def prepare_formats(checkpoint, tmp):
+    """One folder per format so find_model_path picks exactly that file"""
+    from model import save_safetensors
+
+    paths = {}
+    for fmt in FORMATS:
+        folder = Path(tmp) / fmt
+        folder.mkdir()
+        paths[fmt] = folder / "best_model.pth"
+        shutil.copy2(checkpoint, paths[fmt])
+    save_safetensors(paths["safetensors"])
+    return paths
+
+
+def cold_start(fmt, path, env):
+    env = dict(env, MODEL_PATH=str(path), MODEL_MMAP="0" if fmt == "pickle" else "1")
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", CHILD],
+        cwd=SERVICE_DIR, env=env, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"{fmt} run failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(lines[-1])
+    if result["state"] != "ready":
+        raise RuntimeError(f"{fmt} run did not become ready: {result['error']}")
+    return {"time_to_ready": elapsed, **result}
+
+
+def summarize(fmt, runs):
+    phases = sorted({name for run in runs for name in run["phases"]})
+    return {
+        "format": fmt,
+        "runs": len(runs),
+        "time_to_ready_s": round(float(np.median([r["time_to_ready"] for r in runs])), 3),
+        "peak_rss_mb": round(float(np.median([r["peak_rss_mb"] for r in runs])), 1),
+        "phases_s": {
+            name: round(float(np.median([r["phases"].get(name, 0) for r in runs])), 3) for name in phases
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--checkpoint", default=None, help="default: outputs/best_model.pth or random weights")
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=FORMATS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = args.checkpoint or SERVICE_DIR / "outputs" / "best_model.pth"
+        if not Path(checkpoint).exists():
+            checkpoint = Path(tmp) / "random_model.pth"
+            random_checkpoint(checkpoint)
+            print("⚠️ No checkpoint, using random weights")
+
+        paths = prepare_formats(checkpoint, tmp)
+        env = dict(os.environ, CALLBACK_OUTBOX_PATH=str(Path(tmp) / "outbox.sqlite3"))
+
+        results = []
+        for fmt in args.formats:
+            runs = [cold_start(fmt, paths[fmt], env) for _ in range(args.runs)]
+            row = summarize(fmt, runs)
+            results.append(row)
+            print(json.dumps(row))
+
+    phases = list(results[0]["phases_s"])
+    print(f"\n{'format':<13}{'ready s':>9}{'peak MB':>9}" + "".join(f"{p:>12}" for p in phases))
+    for r in results:
+        print(
+            f"{r['format']:<13}{r['time_to_ready_s']:>9}{r['peak_rss_mb']:>9}"
+            + "".join(f"{r['phases_s'].get(p, '-')!s:>12}" for p in phases)
+        )
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps({"cores": os.cpu_count(), "results": results}, indent=2))
+        print(f"📝 Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Face detection time and recall at different detection resolutions.
+
+Encodes synthetic face videos at several source resolutions, then runs
+the video path's Haar detection (detect_faces) with each
+--max_sides value and compares the boxes with the drawn ground truth.
+
+    python benchmarks/bench_detection_scale.py --frames 40 --max_sides 0 720 480 360
+"""
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import cv2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from face_tracker import iou  # noqa: E402
+from synthetic import write_face_video  # noqa: E402
+from video_predictor import StageStats, detect_faces  # noqa: E402
+
+RESOLUTIONS = {"720p": (1280, 720), "1080p": (1920, 1080), "4k": (3840, 2160)}
+
+
+def run(video_path, truth, max_side, iou_threshold):
+    cap = cv2.VideoCapture(str(video_path))
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    stats = StageStats("detect")
+    hits = total = false_pos = 0
+
+    for boxes in truth:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        _, faces = detect_faces(frame, w, h, stats, max_side)
+        matched = set()
+        for gt in boxes:
+            total += 1
+            best = max(range(len(faces)), key=lambda i: iou(gt, faces[i]), default=None)
+            if best is not None and best not in matched and iou(gt, faces[best]) >= iou_threshold:
+                matched.add(best)
+                hits += 1
+        false_pos += len(faces) - len(matched)
+    cap.release()
+
+    return {
+        "max_side": max_side,
+        "frames": stats.frames,
+        "detect_ms": round(stats.busy / max(1, stats.frames) * 1000, 2),
+        "recall": round(hits / total, 4) if total else None,
+        "false_positives": false_pos,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=40)
+    parser.add_argument("--resolutions", nargs="+", default=["720p", "1080p", "4k"], choices=list(RESOLUTIONS))
+    parser.add_argument("--max_sides", nargs="+", type=int, default=[0, 720, 480, 360, 240])
+    parser.add_argument("--iou", type=float, default=0.3, help="IoU needed to count a face as found")
+    parser.add_argument("--output", help="Write the JSON report here as well")
+    args = parser.parse_args()
+
+    report = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.resolutions:
+            width, height = RESOLUTIONS[name]
+            video = Path(tmp) / f"faces_{name}.mp4"
+            truth = write_face_video(video, n_frames=args.frames, width=width, height=height)
+
+            for max_side in args.max_sides:
+                row = {"resolution": name, **run(video, truth, max_side, args.iou)}
+                report.append(row)
+                print(
+                    f"{name:>6} max_side={max_side or 'full':>5}  "
+                    f"{row['detect_ms']:8.2f} ms/frame  recall={row['recall']}  fp={row['false_positives']}"
+                )
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
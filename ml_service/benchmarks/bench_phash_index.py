@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Load time and Hamming-radius lookup latency of the near-duplicate index.
+
+Fills an index file with --entries random hashes, reopens it (mmap plus
+table build, as a worker start would), then times lookups of stored
+hashes with a few bits flipped (hits) and of fresh hashes (misses).
+
+    python benchmarks/bench_phash_index.py --entries 1000000 --distance 4
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from phash_index import RECORD, PhashIndex
+
+
+def percentiles(seconds):
+    us = np.array(seconds) * 1e6
+    return {"p50_us": round(float(np.percentile(us, 50)), 1), "p99_us": round(float(np.percentile(us, 99)), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--distance", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    records = np.zeros(args.entries, dtype=RECORD)
+    records["hash"] = rng.integers(0, 2 ** 64, args.entries, dtype=np.uint64)
+    records["fine"] = rng.integers(0, 2 ** 64, (args.entries, 4), dtype=np.uint64)
+    records["prob"] = rng.random(args.entries)
+    records["tag"] = 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "phash_index.bin"
+        PhashIndex(path, distance=args.distance).close()
+        with open(path, "ab") as f:
+            f.write(records.tobytes())
+
+        start = time.perf_counter()
+        index = PhashIndex(path, distance=args.distance, mode="reuse")
+        load = time.perf_counter() - start
+
+        picks = rng.integers(0, args.entries, args.queries)
+        flips = [rng.choice(64, size=args.distance, replace=False) for _ in picks]
+        timings = {"hit": [], "miss": []}
+        found = 0
+        for i, bits in zip(picks, flips):
+            h = int(records["hash"][i]) ^ int(sum(1 << int(b) for b in bits))
+            t0 = time.perf_counter()
+            found += index.lookup((h, records["fine"][i]), 1) is not None
+            timings["hit"].append(time.perf_counter() - t0)
+
+            fresh = int(rng.integers(0, 2 ** 64, dtype=np.uint64))
+            t0 = time.perf_counter()
+            index.lookup((fresh, records["fine"][i]), 1)
+            timings["miss"].append(time.perf_counter() - t0)
+        index.close()
+
+        result = {
+            "entries": args.entries,
+            "distance": args.distance,
+            "file_mb": round(path.stat().st_size / 1e6, 1),
+            "load_s": round(load, 3),
+            "recall": round(found / args.queries, 4),
+            "hit": percentiles(timings["hit"]),
+            "miss": percentiles(timings["miss"])
+        }
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Per-image decode + preprocess time and peak memory, before and after
+reduced-size decoding.
+
+    legacy  full decode, torchvision Compose built per call (old predict_image)
+    exact   shared Preprocessor without draft (same pixels as legacy)
+    draft   shared Preprocessor with JPEG draft() / reducing_gap (the default)
+
+Every (image, mode) pair runs in a fresh process, so peak RSS above the
+process's baseline is that path's own working memory.
+
+    python benchmarks/bench_preprocess.py --sizes 1000x750 4000x3000 --iters 20
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_DIR))
+
+from synthetic import photo_image  # noqa: E402
+
+MODES = ("legacy", "exact", "draft")
+FORMATS = {"jpg": ("JPEG", {"quality": 90}), "png": ("PNG", {}), "webp": ("WEBP", {"quality": 85})}
+
+CHILD = """
+import json, resource, sys, time
+from io import BytesIO
+import numpy as np
+import torch
+from PIL import Image
+sys.path.insert(0, {service_dir!r})
+import preprocessing
+
+mode, path, img_size, iters = {mode!r}, {path!r}, {img_size}, {iters}
+data = open(path, "rb").read()
+
+if mode == "legacy":
+    import torchvision.transforms as transforms
+    def run():
+        transform = transforms.Compose([
+            transforms.Resize((img_size, img_size)),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=preprocessing.MEAN, std=preprocessing.STD)
+        ])
+        return transform(Image.open(BytesIO(data)).convert("RGB"))
+else:
+    pre = preprocessing.Preprocessor(img_size, draft=mode == "draft")
+    out = torch.empty(3, img_size, img_size)
+    def run():
+        return pre(BytesIO(data), out)
+
+def rss_kb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() // 1024
+
+run()  # imports, first-call allocations outside the timed loop
+baseline = rss_kb()
+timings = []
+for _ in range(iters):
+    start = time.perf_counter()
+    x = run()
+    timings.append(time.perf_counter() - start)
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"ms": float(np.median(timings)) * 1000, "peak_mb": max(0, peak - baseline) / 1024,
+                  "checksum": x.double().sum().item()}}))
+"""
+
+
+def run_child(mode, path, img_size, iters):
+    code = CHILD.format(service_dir=str(SERVICE_DIR), mode=mode, path=str(path), img_size=img_size, iters=iters)
+    proc = subprocess.run([sys.executable, "-W", "ignore", "-c", code], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", nargs="+", default=["1000x750", "4000x3000"], help="WIDTHxHEIGHT")
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=list(FORMATS))
+    parser.add_argument("--img_size", type=int, default=224)
+    parser.add_argument("--iters", type=int, default=20)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            width, height = (int(v) for v in size.lower().split("x"))
+            img = photo_image(width, height)
+            for fmt in args.formats:
+                name, options = FORMATS[fmt]
+                path = Path(tmp) / f"{size}.{fmt}"
+                buffer = BytesIO()
+                img.save(buffer, name, **options)
+                path.write_bytes(buffer.getvalue())
+
+                rows = {mode: run_child(mode, path, args.img_size, args.iters) for mode in MODES}
+                base = rows["legacy"]
+                for mode, row in rows.items():
+                    result = {
+                        "image": f"{size}.{fmt}",
+                        "mode": mode,
+                        "ms": round(row["ms"], 2),
+                        "speedup": round(base["ms"] / row["ms"], 2),
+                        "peak_mb": round(row["peak_mb"], 1),
+                        "checksum_diff": round(abs(row["checksum"] - base["checksum"]), 3)
+                    }
+                    results.append(result)
+                    print(json.dumps(result))
+
+    print(f"\n{'image':<16}{'mode':<8}{'ms':>9}{'speedup':>9}{'peak MB':>9}")
+    for r in results:
+        print(f"{r['image']:<16}{r['mode']:<8}{r['ms']:>9}{r['speedup']:>8}x{r['peak_mb']:>9}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"img_size": args.img_size, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks of the service's hot paths, with regression checks.
+
+    convert   convert_image_to_standard_format, per ALLOWED_IMG format
+    predict   predict_image (decode + engine inference), per format
+    forward   DetectorModel.forward per batch size and torch thread count
+    video     run_advanced_video_prediction frames/sec on a synthetic face video
+
+Everything runs offline on CPU with synthetic media. Without a
+checkpoint (outputs/best_model.pth or --checkpoint) a randomly
+initialized DetectorModel is used: timings are real, scores are not.
+
+    python benchmarks/bench_suite.py --output outputs/bench_baseline.json
+    python benchmarks/bench_suite.py --baseline outputs/bench_baseline.json --threshold 0.15
+
+With --baseline, every metric is compared with the same (name, metric)
+of the earlier run and the script exits 1 if any got worse by more than
+--threshold (relative). Compare runs of the same host and settings only.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_DIR))
+
+from synthetic import photo_image, random_checkpoint, write_face_video  # noqa: E402
+
+GROUPS = ("convert", "predict", "forward", "video")
+
+
+def measure(fn, repeats, warmup=1):
+    """Median and p90 seconds of fn() over repeats calls, after warmup calls"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return statistics.median(timings), timings[min(len(timings) - 1, int(0.9 * len(timings)))]
+
+
+def row(name, metric, value, better="lower"):
+    result = {"name": name, "metric": metric, "value": round(value, 3), "better": better}
+    print(json.dumps(result))
+    return result
+
+
+# ---------------- BENCHMARKS ----------------
+def write_images(app, folder, width, height):
+    """One synthetic photo per ALLOWED_IMG extension"""
+    from PIL import Image
+
+    img = photo_image(width, height)
+    formats = Image.registered_extensions()
+    paths = {}
+    for ext in sorted(app.ALLOWED_IMG):
+        path = Path(folder) / f"bench{ext}"
+        img.save(path, formats[ext])
+        paths[ext.lstrip(".")] = path
+    return paths
+
+
+def bench_convert(app, images, repeats):
+    results = []
+    for fmt, path in images.items():
+        # The helper prints one line per call
+        with redirect_stdout(StringIO()):
+            median, p90 = measure(lambda: app.convert_image_to_standard_format(path), repeats)
+        results.append(row(f"convert.{fmt}", "median_ms", median * 1000))
+        results.append(row(f"convert.{fmt}", "p90_ms", p90 * 1000))
+    return results
+
+
+def bench_predict(app, images, repeats):
+    results = []
+    for fmt, path in images.items():
+        median, p90 = measure(lambda: app.predict_image(path), repeats)
+        results.append(row(f"predict_image.{fmt}", "median_ms", median * 1000))
+        results.append(row(f"predict_image.{fmt}", "p90_ms", p90 * 1000))
+    return results
+
+
+def bench_forward(app, batch_sizes, thread_counts, repeats):
+    import torch
+
+    model = app._global["eager_model"]
+    img_size = app._global["img_size"]
+    default_threads = torch.get_num_threads()
+    results = []
+    try:
+        for threads in thread_counts:
+            torch.set_num_threads(threads)
+            for batch_size in batch_sizes:
+                x = torch.randn(batch_size, 3, img_size, img_size)
+                with torch.no_grad():
+                    median, _ = measure(lambda: model(x), repeats)
+                name = f"forward.b{batch_size}.t{threads}"
+                results.append(row(name, "median_ms", median * 1000))
+                results.append(row(name, "images_per_s", batch_size / median, better="higher"))
+    finally:
+        torch.set_num_threads(default_threads)
+    return results
+
+
+def bench_video(app, folder, frames, width, height, repeats):
+    from video_predictor import run_advanced_video_prediction
+
+    video = Path(folder) / "faces.mp4"
+    write_face_video(video, n_frames=frames, width=width, height=height)
+    model, device, img_size = app.ensure_model_loaded()
+
+    def run():
+        return run_advanced_video_prediction(
+            str(video), model, device, img_size, None,
+            max_frames=frames, early_exit=False, calibration=app._global["calibration"]
+        )
+
+    run()
+    fps = []
+    for _ in range(repeats):
+        result = run()
+        fps.append(result["frames_analyzed"] / result["processing_seconds"])
+    return [row(f"video.{height}p", "fps", statistics.median(fps), better="higher")]
+
+
+# ---------------- BASELINE ----------------
+def compare(results, baseline, threshold):
+    """Print each metric against the baseline; returns the regressed ones"""
+    previous = {(r["name"], r["metric"]): r["value"] for r in baseline["results"]}
+    regressions = []
+    print(f"\n{'benchmark':<28}{'metric':<14}{'baseline':>11}{'current':>11}{'change':>9}")
+    for r in results:
+        base = previous.get((r["name"], r["metric"]))
+        if not base:
+            print(f"{r['name']:<28}{r['metric']:<14}{'-':>11}{r['value']:>11}{'new':>9}")
+            continue
+        change = (r["value"] - base) / base
+        worse = change > threshold if r["better"] == "lower" else change < -threshold
+        flag = "  ❌ regression" if worse else ""
+        print(f"{r['name']:<28}{r['metric']:<14}{base:>11}{r['value']:>11}{change:>+9.1%}{flag}")
+        if worse:
+            regressions.append({**r, "baseline": base, "change": round(change, 4)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--only", nargs="+", default=list(GROUPS), choices=GROUPS)
+    parser.add_argument("--checkpoint", default=None, help="default: outputs/best_model.pth or random weights")
+    parser.add_argument("--image_size", default="1280x960", help="WIDTHxHEIGHT of the synthetic images")
+    parser.add_argument("--batch_sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--threads", nargs="+", type=int, default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument("--video_size", default="1280x720", help="WIDTHxHEIGHT of the synthetic video")
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--video_repeats", type=int, default=3)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=None, help="earlier --output file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = Path(args.checkpoint or SERVICE_DIR / "outputs" / "best_model.pth")
+        if not checkpoint.exists():
+            checkpoint = Path(tmp) / "random_model.pth"
+            random_checkpoint(checkpoint)
+            print("⚠️ No checkpoint, using random weights")
+
+        # Read by app at import time; keep the service's own state untouched
+        os.environ["MODEL_PATH"] = str(checkpoint)
+        os.environ.setdefault("CALLBACK_OUTBOX_PATH", str(Path(tmp) / "outbox.sqlite3"))
+        os.environ.setdefault("PHASH_MODE", "off")
+        import torch
+        import app
+
+        app.prepare_model()
+        if app._readiness["state"] != "ready":
+            sys.exit(f"❌ Model not ready: {app._readiness['error']}")
+
+        width, height = (int(v) for v in args.image_size.lower().split("x"))
+        images = write_images(app, tmp, width, height) if {"convert", "predict"} & set(args.only) else {}
+
+        results = []
+        if "convert" in args.only:
+            results += bench_convert(app, images, args.repeats)
+        if "predict" in args.only:
+            results += bench_predict(app, images, args.repeats)
+        if "forward" in args.only:
+            results += bench_forward(app, args.batch_sizes, args.threads, args.repeats)
+        if "video" in args.only:
+            vw, vh = (int(v) for v in args.video_size.lower().split("x"))
+            results += bench_video(app, tmp, args.frames, vw, vh, args.video_repeats)
+
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "environment": {
+                "python": platform.python_version(),
+                "torch": torch.__version__,
+                "cores": os.cpu_count(),
+                "runtime": app._global["runtime"],
+                "checkpoint": "random" if checkpoint.parent == Path(tmp) else str(checkpoint)
+            },
+            "settings": {k: getattr(args, k) for k in ("image_size", "video_size", "frames", "repeats")},
+            "results": results
+        }
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"📝 Report written to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline.get("environment") != report["environment"]:
+            print(f"⚠️ Baseline environment differs: {baseline.get('environment')}")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+        print(f"\n✅ No regression beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Throughput and memory of the pre-fork server at several worker counts.
+
+For each --workers value, starts gunicorn with gunicorn.conf.py, waits
+for /api/ready, drives /predict with concurrent image uploads for
+--duration seconds and samples each worker's RSS/PSS from /proc.
+PSS splits shared pages between the processes mapping them, so a low
+PSS next to a high RSS means the weights are shared, not copied.
+
+    python benchmarks/load_test.py --workers 1 2 4 --duration 20
+
+Without --checkpoint (or outputs/best_model.pth) a random-init checkpoint
+is generated: timings are representative, predictions are not.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import requests
+from PIL import Image
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_DIR))
+
+from synthetic import random_checkpoint  # noqa: E402
+
+UPLOADS = SERVICE_DIR / "static" / "uploads"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def jpeg_bytes(size=512, seed=0):
+    pixels = np.random.default_rng(seed).integers(0, 255, (size, size, 3), dtype=np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def worker_pids(master_pid):
+    children = Path(f"/proc/{master_pid}/task/{master_pid}/children")
+    return [int(pid) for pid in children.read_text().split()] if children.exists() else []
+
+
+def memory_mb(pid):
+    """Rss/Pss/shared/private of one process, in MB"""
+    fields = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        name, value = line.split(":", 1)
+        fields[name] = int(value.split()[0]) / 1024
+    return {
+        "rss": round(fields.get("Rss", 0), 1),
+        "pss": round(fields.get("Pss", 0), 1),
+        "shared": round(fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0), 1),
+        "private": round(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0), 1)
+    }
+
+
+def wait_ready(base_url, workers, timeout):
+    """Ready answers come from a random worker: require a run of them"""
+    deadline = time.time() + timeout
+    streak = 0
+    while time.time() < deadline:
+        try:
+            ok = requests.get(f"{base_url}/api/ready", timeout=5).status_code == 200
+        except requests.RequestException:
+            ok = False
+        streak = streak + 1 if ok else 0
+        if streak >= 4 * workers:
+            return True
+        time.sleep(0.1 if ok else 0.5)
+    return False
+
+
+def drive(base_url, image, concurrency, duration):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    stop = time.time() + duration
+
+    def client():
+        nonlocal errors
+        session = requests.Session()
+        while time.time() < stop:
+            start = time.perf_counter()
+            try:
+                response = session.post(
+                    f"{base_url}/predict",
+                    files={"image": ("load.jpg", image, "image/jpeg")},
+                    timeout=60
+                )
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1) if len(latencies) else None
+    }
+
+
+def run(workers, args, env):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(env, WEB_CONCURRENCY=str(workers), PORT=str(port))
+    if args.torch_threads:
+        env["TORCH_THREADS"] = str(args.torch_threads)
+
+    before = set(UPLOADS.iterdir()) if UPLOADS.exists() else set()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+        cwd=SERVICE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        if not wait_ready(base_url, workers, args.ready_timeout):
+            return {"workers": workers, "error": "workers never became ready"}
+
+        pids = worker_pids(server.pid)
+        master = memory_mb(server.pid)
+        idle = [memory_mb(pid) for pid in pids]
+        load = drive(base_url, jpeg_bytes(), args.concurrency or 2 * workers * 4, args.duration)
+        loaded = [memory_mb(pid) for pid in pids]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(60)
+        # /predict keeps uploads; remove what this run created
+        for path in (set(UPLOADS.iterdir()) if UPLOADS.exists() else set()) - before:
+            if path.is_file():
+                path.unlink()
+
+    return {
+        "workers": workers,
+        **load,
+        "master_rss_mb": master["rss"],
+        "worker_rss_mb": round(float(np.mean([m["rss"] for m in loaded])), 1),
+        "worker_pss_mb": round(float(np.mean([m["pss"] for m in loaded])), 1),
+        "worker_private_mb": round(float(np.mean([m["private"] for m in loaded])), 1),
+        "worker_pss_idle_mb": round(float(np.mean([m["pss"] for m in idle])), 1),
+        "total_pss_mb": round(sum(m["pss"] for m in loaded), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="client threads (default 8 per worker)")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--torch_threads", type=int, default=None)
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--ready_timeout", type=float, default=300)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = args.checkpoint
+        if checkpoint is None and not (SERVICE_DIR / "outputs" / "best_model.pth").exists():
+            checkpoint = str(Path(tmp) / "random_model.pth")
+            random_checkpoint(checkpoint)
+            print("⚠️ No checkpoint, using random weights")
+
+        env = dict(os.environ, CALLBACK_OUTBOX_PATH=str(Path(tmp) / "outbox.sqlite3"))
+        if checkpoint:
+            env["MODEL_PATH"] = checkpoint
+
+        results = []
+        for workers in args.workers:
+            row = run(workers, args, env)
+            results.append(row)
+            print(json.dumps(row))
+
+    base = next((r["rps"] for r in results if r.get("rps")), None)
+    print(f"\n{'workers':>8}{'req/s':>9}{'scale':>7}{'p50 ms':>9}{'p95 ms':>9}{'RSS MB':>9}{'PSS MB':>9}{'priv MB':>9}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['workers']:>8}  {r['error']}")
+            continue
+        scale = f"{r['rps'] / base:.2f}x" if base else "-"
+        print(
+            f"{r['workers']:>8}{r['rps']:>9}{scale:>7}{r['p50_ms']!s:>9}{r['p95_ms']!s:>9}"
+            f"{r['worker_rss_mb']:>9}{r['worker_pss_mb']:>9}{r['worker_private_mb']:>9}"
+        )
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"cores": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
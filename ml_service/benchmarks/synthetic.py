@@ -0,0 +1,95 @@
+"""
+Synthetic media for offline benchmarks.
+Draws cartoon faces the Haar frontal-face cascade reliably detects, so
+the video path can be measured without any real data, photo-like stills
+for the image path, and random-weight checkpoints.
+"""
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+BACKGROUND = 90
+
+
+def draw_face(img, cx, cy, r):
+    """Draw a face of radius r centered at (cx, cy), returns its ground-truth box"""
+    cv2.ellipse(img, (cx, cy), (int(r * 0.8), r), 0, 0, 360, (150, 170, 210), -1)
+    for dx in (-0.35, 0.35):
+        ex, ey = int(cx + dx * r), int(cy - 0.2 * r)
+        cv2.ellipse(img, (ex, ey), (int(0.18 * r), int(0.08 * r)), 0, 0, 360, (40, 40, 40), -1)
+        brow = ey - int(0.2 * r)
+        cv2.line(img, (ex - int(0.2 * r), brow), (ex + int(0.2 * r), brow), (30, 30, 30), max(1, r // 15))
+    cv2.line(img, (cx, cy - int(0.05 * r)), (cx, cy + int(0.25 * r)), (110, 120, 160), max(1, r // 20))
+    cv2.ellipse(img, (cx, cy + int(0.5 * r)), (int(0.3 * r), int(0.07 * r)), 0, 0, 360, (60, 60, 140), -1)
+    # The cascade frames roughly the inner face, a bit wider than tall
+    side = int(2.2 * r)
+    return (cx - side // 2, cy - side // 2, side, side)
+
+
+def face_frames(n_frames, width, height, radii=(40, 80, 140), seed=0):
+    """
+    Yield (frame, boxes) with one moving face per radius.
+    Faces drift across the frame and bounce off its edges.
+    """
+    rng = np.random.default_rng(seed)
+    scale = height / 1080
+    faces = []
+    for i, r in enumerate(radii):
+        r = max(8, int(r * scale))
+        x = (i + 1) * width // (len(radii) + 1)
+        y = height // 2
+        vx, vy = rng.uniform(-3, 3, size=2) * scale
+        faces.append([float(x), float(y), vx, vy, r])
+
+    for _ in range(n_frames):
+        frame = np.full((height, width, 3), BACKGROUND, np.uint8)
+        noise = rng.integers(0, 12, size=(height // 8, width // 8, 1), dtype=np.uint8)
+        frame += cv2.resize(noise, (width, height))[..., None]
+        boxes = []
+        for face in faces:
+            x, y, vx, vy, r = face
+            boxes.append(draw_face(frame, int(x), int(y), r))
+            face[0] = min(max(x + vx, r * 1.2), width - r * 1.2)
+            face[1] = min(max(y + vy, r * 1.2), height - r * 1.2)
+            if face[0] in (r * 1.2, width - r * 1.2):
+                face[2] = -vx
+            if face[1] in (r * 1.2, height - r * 1.2):
+                face[3] = -vy
+        yield frame, boxes
+
+
+def write_face_video(path, n_frames=60, width=1920, height=1080, fps=25, radii=(40, 80, 140), seed=0):
+    """Encode a synthetic face video, returns the per-frame ground-truth boxes"""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Cannot write synthetic video {path}")
+    truth = []
+    for frame, boxes in face_frames(n_frames, width, height, radii, seed):
+        writer.write(frame)
+        truth.append(boxes)
+    writer.release()
+    return truth
+
+
+def photo_image(width, height, seed=0):
+    """Blurred random shapes: compresses and decodes like a photo, unlike noise"""
+    rng = np.random.default_rng(seed)
+    img = Image.new("RGB", (width, height), tuple(int(v) for v in rng.integers(0, 255, 3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(60):
+        x, y = rng.integers(0, width), rng.integers(0, height)
+        s = int(rng.integers(width // 40, width // 4))
+        draw.ellipse((x, y, x + s, y + s), fill=tuple(int(v) for v in rng.integers(0, 255, 3)))
+    return img.filter(ImageFilter.GaussianBlur(max(1, width // 400)))
+
+
+def random_checkpoint(path, seed=0):
+    """Checkpoint of a randomly initialized DetectorModel: timings are real, predictions are not"""
+    import torch
+    from model import DetectorModel, DEFAULT_IMG_SIZE, DEFAULT_MODEL_NAME
+
+    torch.manual_seed(seed)
+    torch.save({
+        "args": {"img_size": DEFAULT_IMG_SIZE, "backbone_name": DEFAULT_MODEL_NAME},
+        "model_state_dict": DetectorModel().state_dict()
+    }, path)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Probability calibration as a piecewise-linear table.
+
+An isotonic regression with out_of_bounds="clip" predicts by linear
+interpolation between its thresholds, so (X_thresholds_, y_thresholds_)
+is the whole model: it is extracted once and applied to batches with
+np.interp / torch.searchsorted instead of per-item sklearn calls.
+
+Tables are versioned with the checkpoint: train.py --calibrate embeds
+one in the checkpoint, and a standalone calibrator.joblib is pinned to a
+checkpoint by hash in calibration.json:
+
+    python calibration.py --calibrator outputs/calibrator.joblib --checkpoint outputs/best_model.pth
+"""
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+
+# ---------------- CONFIG ----------------
+# auto: use the checkpoint's (or pinned) table when there is one; off: raw sigmoid
+CALIBRATION_MODE = os.environ.get("CALIBRATION", "auto").lower()
+TABLE_FILE = "calibration.json"
+JOBLIB_FILE = "calibrator.joblib"
+
+
+def _file_sha256(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+class Calibration:
+    """Monotone piecewise-linear map from raw to calibrated probabilities"""
+
+    def __init__(self, x, y, source="table"):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if x.ndim != 1 or x.shape != y.shape or len(x) < 2:
+            raise ValueError("calibration table needs matching 1-D x/y with at least 2 points")
+        order = np.argsort(x, kind="stable")
+        self.x, self.y = x[order], y[order]
+        self.source = source
+        digest = hashlib.sha256(self.x.tobytes() + self.y.tobytes()).hexdigest()[:12]
+        self.version = f"{source}:{digest}"
+        self._tensors = {}
+
+    @classmethod
+    def from_isotonic(cls, calibrator, source="isotonic"):
+        return cls(calibrator.X_thresholds_, calibrator.y_thresholds_, source)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["x"], data["y"], data.get("source", "table"))
+
+    def to_dict(self):
+        return {"x": self.x.tolist(), "y": self.y.tolist(), "source": self.source}
+
+    def _table(self, device):
+        key = str(device)
+        if key not in self._tensors:
+            self._tensors[key] = (
+                torch.tensor(self.x, dtype=torch.float32, device=device),
+                torch.tensor(self.y, dtype=torch.float32, device=device)
+            )
+        return self._tensors[key]
+
+    def __call__(self, probs):
+        """Calibrate a tensor, array or float of probabilities (clipped at the ends)"""
+        if not isinstance(probs, torch.Tensor):
+            out = np.interp(probs, self.x, self.y)
+            return float(out) if np.ndim(out) == 0 else out
+
+        x, y = self._table(probs.device)
+        p = probs.float().contiguous()
+        hi = torch.searchsorted(x, p).clamp(1, len(x) - 1)
+        x0, x1 = x[hi - 1], x[hi]
+        y0, y1 = y[hi - 1], y[hi]
+        t = ((p - x0) / (x1 - x0).clamp_min(1e-12)).clamp(0, 1)
+        return y0 + t * (y1 - y0)
+
+
+# ---------------- LOADING ----------------
+def pin_calibrator(joblib_path, model_id, table_path):
+    """Convert a fitted IsotonicRegression and pin it to a checkpoint"""
+    import joblib
+
+    calibration = Calibration.from_isotonic(joblib.load(joblib_path), source=Path(joblib_path).name)
+    Path(table_path).write_text(json.dumps({
+        **calibration.to_dict(),
+        "checkpoint": model_id,
+        "calibrator_sha256": _file_sha256(joblib_path)
+    }, indent=2))
+    return calibration
+
+
+def load_calibration(checkpoint_meta, model_id, outputs_dir, mode=CALIBRATION_MODE):
+    """
+    Calibration for the loaded checkpoint, or None (raw sigmoid):
+    1. a table embedded in the checkpoint (train.py --calibrate)
+    2. calibration.json pinned to this checkpoint (calibration.py --checkpoint)
+    A calibrator.joblib pinned to another checkpoint, or to none, is ignored:
+    serving never decides which weights a calibrator belongs to.
+    """
+    if mode == "off":
+        return None
+
+    if checkpoint_meta.get("calibration"):
+        return Calibration.from_dict(checkpoint_meta["calibration"])
+
+    outputs_dir = Path(outputs_dir)
+    table_path = outputs_dir / TABLE_FILE
+    joblib_path = outputs_dir / JOBLIB_FILE
+    pinned = json.loads(table_path.read_text()) if table_path.exists() else None
+
+    if pinned is not None and pinned.get("checkpoint") == model_id:
+        return Calibration.from_dict(pinned)
+    if not joblib_path.exists():
+        return None
+
+    if pinned is not None and pinned.get("calibrator_sha256") == _file_sha256(joblib_path):
+        print(f"⚠️ {JOBLIB_FILE} was fitted for {pinned.get('checkpoint')}, not {model_id} → uncalibrated")
+    else:
+        print(
+            f"⚠️ {JOBLIB_FILE} is not pinned to {model_id} → uncalibrated "
+            f"(pin it with: python calibration.py --calibrator {joblib_path} --checkpoint <checkpoint>)"
+        )
+    return None
+
+
+def main():
+    from model import checkpoint_id
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calibrator", default="outputs/calibrator.joblib")
+    parser.add_argument("--checkpoint", default="outputs/best_model.pth")
+    parser.add_argument("--output", default=None, help=f"default: {TABLE_FILE} next to the checkpoint")
+    args = parser.parse_args()
+
+    checkpoint = Path(args.checkpoint)
+    output = Path(args.output) if args.output else checkpoint.parent / TABLE_FILE
+    calibration = pin_calibrator(args.calibrator, checkpoint_id(checkpoint), output)
+    print(f"📐 {calibration.version}: {len(calibration.x)} points pinned to {checkpoint.name} in {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import metrics
+from http_client import get_session
+
+# ---------------- CONFIG ----------------
+OUTBOX_BATCH = int(os.environ.get("CALLBACK_BATCH", 16))
+OUTBOX_WORKERS = int(os.environ.get("CALLBACK_WORKERS", 4))
+OUTBOX_TIMEOUT = float(os.environ.get("CALLBACK_TIMEOUT", 10))
+OUTBOX_MAX_BACKOFF = float(os.environ.get("CALLBACK_MAX_BACKOFF", 300))
+# A claimed row is retried by anyone once its lease runs out
+OUTBOX_LEASE = 60.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    created REAL NOT NULL,
+    claim TEXT,
+    last_error TEXT
+)
+"""
+
+
+class CallbackOutbox:
+    """
+    Durable outbox for backend callbacks.
+    enqueue() commits the PATCH to SQLite first; a sender thread delivers
+    due rows in batches over the pooled session and reschedules failures
+    with exponential backoff, so results survive a slow or restarting
+    backend (and a restart of this service). Rows are claimed with a lease
+    so several worker processes can share one outbox file.
+    """
+
+    def __init__(self, db_path, session=None, batch_size=OUTBOX_BATCH, workers=OUTBOX_WORKERS,
+                 timeout=OUTBOX_TIMEOUT, max_backoff=OUTBOX_MAX_BACKOFF):
+        self.db_path = str(db_path)
+        self._session = session
+        self.batch_size = max(1, int(batch_size))
+        self.workers = max(1, int(workers))
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.delivered = 0
+        self.failed_attempts = 0
+        self.dropped = 0
+
+        with self._connect() as db:
+            db.execute(SCHEMA)
+
+    @property
+    def session(self):
+        return self._session if self._session is not None else get_session()
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            yield db
+        finally:
+            db.close()
+
+    # ---------- lifecycle ----------
+    def start(self):
+        with self._start_lock:
+            # Threads do not survive fork, restart in the child
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return self
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="callback-outbox", daemon=True)
+            self._thread.start()
+        self._wake.set()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # ---------- public API ----------
+    def enqueue(self, url, payload):
+        """Persist a PATCH of payload to url, delivered asynchronously"""
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO outbox (url, payload, next_attempt, created) VALUES (?, ?, ?, ?)",
+                (url, json.dumps(payload), now, now)
+            )
+        self.start()
+        self._wake.set()
+
+    def pending(self):
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "pending": self.pending(),
+                "delivered": self.delivered,
+                "failed_attempts": self.failed_attempts,
+                "dropped": self.dropped
+            }
+
+    def flush(self, timeout=30):
+        """Deliver everything due now on the calling thread; True once the outbox is empty"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if not self._deliver_batch():
+                return self.pending() == 0
+        return False
+
+    # ---------- sender ----------
+    def _claim(self):
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(
+                    """UPDATE outbox SET claim = ?, next_attempt = ?
+                       WHERE id IN (SELECT id FROM outbox WHERE next_attempt <= ? ORDER BY id LIMIT ?)""",
+                    (token, now + OUTBOX_LEASE, now, self.batch_size)
+                )
+                rows = db.execute(
+                    "SELECT id, url, payload, attempts FROM outbox WHERE claim = ? ORDER BY id", (token,)
+                ).fetchall()
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        return rows
+
+    def _send(self, row):
+        row_id, url, payload, attempts = row
+        try:
+            with metrics.stage("callback"):
+                response = self.session.patch(url, json=json.loads(payload), timeout=self.timeout)
+        except Exception as e:
+            return row_id, attempts, "retry", str(e)
+
+        if response.ok:
+            return row_id, attempts, "done", None
+        # Client errors other than timeouts/throttling will never succeed
+        if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+            return row_id, attempts, "drop", f"HTTP {response.status_code}"
+        return row_id, attempts, "retry", f"HTTP {response.status_code}"
+
+    def _deliver_batch(self):
+        rows = self._claim()
+        if not rows:
+            return False
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(rows))) as pool:
+            outcomes = list(pool.map(self._send, rows))
+
+        now = time.time()
+        with self._connect() as db:
+            for row_id, attempts, outcome, error in outcomes:
+                if outcome == "retry":
+                    delay = min(self.max_backoff, 2 ** attempts)
+                    db.execute(
+                        "UPDATE outbox SET attempts = ?, next_attempt = ?, claim = NULL, last_error = ? WHERE id = ?",
+                        (attempts + 1, now + delay, error, row_id)
+                    )
+                else:
+                    db.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+
+        with self._stats_lock:
+            for row_id, attempts, outcome, error in outcomes:
+                if outcome == "done":
+                    self.delivered += 1
+                elif outcome == "drop":
+                    self.dropped += 1
+                    print(f"❌ Dropped callback #{row_id}: {error}")
+                else:
+                    self.failed_attempts += 1
+                    print(f"⏳ Callback #{row_id} failed ({error}), retry #{attempts + 1}")
+        return True
+
+    def _next_due(self):
+        with self._connect() as db:
+            row = db.execute("SELECT MIN(next_attempt) FROM outbox").fetchone()
+        return row[0]
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                while self._deliver_batch():
+                    if self._stop.is_set():
+                        return
+                due = self._next_due()
+            except Exception as e:
+                print(f"❌ Callback outbox error: {e}")
+                due = time.time() + 5
+
+            wait = 60.0 if due is None else max(0.05, min(60.0, due - time.time()))
+            self._wake.wait(wait)
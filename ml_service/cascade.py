@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Two-stage inference cascade: a cheap screening pass, then the full model
+only for the inputs the screen is unsure about.
+
+The screening model is the served DetectorModel at a reduced input size
+(CASCADE_IMG_SIZE, half the full size by default) or, with
+CASCADE_MODEL_PATH, a smaller checkpoint of its own (e.g. train.py
+--backbone_name mobilenetv3_small_100 --img_size 112). It gets the
+full-size input downscaled on the fly, so nothing is decoded twice.
+Inputs whose raw screening probability lies strictly inside the
+(low, high) band go on to the full model; the rest keep the screening
+verdict.
+
+The band trades accuracy for throughput. It is picked on a validation
+set and pinned to both models in cascade.json:
+
+    python cascade.py --val_dir Dataset/Validation --max_label_change 0.01
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# ---------------- CONFIG ----------------
+CASCADE = os.environ.get("CASCADE", "0") == "1"
+CASCADE_MODEL_PATH = os.environ.get("CASCADE_MODEL_PATH") or None
+# 0: half the full model's input size (or the screening checkpoint's own size)
+CASCADE_IMG_SIZE = int(os.environ.get("CASCADE_IMG_SIZE", 0))
+# Override the pinned band (raw screening probabilities)
+CASCADE_LOW = os.environ.get("CASCADE_LOW")
+CASCADE_HIGH = os.environ.get("CASCADE_HIGH")
+BAND_FILE = "cascade.json"
+# Used until a band is tuned: only very confident screens skip the full model
+DEFAULT_BAND = (0.05, 0.95)
+# label_for's bounds, for comparing served labels
+LABEL_BOUNDS = (0.15, 0.60)
+
+
+class Cascade:
+    """
+    Callable on a full-size (N, 3, S, S) batch: (logits, escalated) where
+    escalated marks the rows the full model decided
+    """
+
+    def __init__(self, screen, full, screen_size, low, high, screen_id="self"):
+        self.screen = screen
+        self.full = full
+        self.screen_size = int(screen_size)
+        self.low = float(low)
+        self.high = float(high)
+        self.screen_id = screen_id
+        self._lock = threading.Lock()
+        self.screened = 0
+        self.escalated = 0
+
+    @property
+    def version(self):
+        """Everything that changes the verdicts, part of the result cache key"""
+        return f"{self.screen_id}:{self.low:g}-{self.high:g}"
+
+    def downscale(self, x):
+        # Resizing normalized values is the same as normalizing resized pixels
+        return F.interpolate(x, size=(self.screen_size, self.screen_size), mode="bilinear",
+                             align_corners=False, antialias=True)
+
+    def screen_logits(self, x):
+        return self.screen(self.downscale(x)).float()
+
+    def __call__(self, x):
+        logits = self.screen_logits(x)
+        probs = torch.sigmoid(logits)
+        escalate = (probs > self.low) & (probs < self.high)
+        if escalate.any():
+            logits[escalate] = self.full(x[escalate]).float()
+
+        escalated = int(escalate.sum())
+        with self._lock:
+            self.screened += len(x) - escalated
+            self.escalated += escalated
+        return logits, escalate
+
+    def stats(self):
+        with self._lock:
+            total = self.screened + self.escalated
+            return {
+                "screen": self.screen_id,
+                "screen_size": self.screen_size,
+                "band": [self.low, self.high],
+                "screened": self.screened,
+                "escalated": self.escalated,
+                "escalation_rate": round(self.escalated / total, 4) if total else None
+            }
+
+
+# ---------------- LOADING ----------------
+def default_screen_size(img_size):
+    return max(64, int(img_size) // 2)
+
+
+def load_screen(eager_model, device, img_size, model_path=CASCADE_MODEL_PATH, size=CASCADE_IMG_SIZE):
+    """(screening model, its input size, id) — the served weights unless model_path is given"""
+    from model import checkpoint_id, load_checkpoint
+
+    if model_path:
+        screen, own_size, _ = load_checkpoint(Path(model_path), device)
+        return screen, size or own_size, f"{checkpoint_id(Path(model_path))}@{size or own_size}"
+    size = size or default_screen_size(img_size)
+    return eager_model, size, f"self@{size}"
+
+
+def load_cascade(full, eager_model, device, img_size, model_id, outputs_dir, enabled=CASCADE):
+    """
+    Cascade in front of full (the serving runtime), or None when disabled.
+    The band comes from CASCADE_LOW/CASCADE_HIGH, else from cascade.json if
+    it was tuned for this checkpoint and screen, else DEFAULT_BAND.
+    """
+    if not enabled:
+        return None
+
+    screen, size, screen_id = load_screen(eager_model, device, img_size)
+    band_path = Path(outputs_dir) / BAND_FILE
+    band = DEFAULT_BAND
+    if band_path.exists():
+        pinned = json.loads(band_path.read_text())
+        if pinned.get("checkpoint") == model_id and pinned.get("screen") == screen_id:
+            band = (pinned["low"], pinned["high"])
+        else:
+            print(f"⚠️ {BAND_FILE} was tuned for {pinned.get('checkpoint')} / {pinned.get('screen')} → default band")
+    low = float(CASCADE_LOW) if CASCADE_LOW is not None else band[0]
+    high = float(CASCADE_HIGH) if CASCADE_HIGH is not None else band[1]
+
+    print(f"🪜 Cascade: {screen_id} screens, full model for probabilities in ({low:g}, {high:g})")
+    return Cascade(screen, full, size, low, high, screen_id)
+
+
+# ---------------- BAND SELECTION ----------------
+def _labels(probs):
+    return np.digitize(probs, LABEL_BOUNDS)
+
+
+def evaluate_bands(screen_raw, screen_probs, full_probs, labels, screen_cost, full_cost, step=0.01):
+    """
+    Every (low, high) band on the grid: share escalated, served labels
+    changed vs the full model, accuracy at 0.5 and estimated speedup.
+    screen_raw selects (as in serving), the *_probs are calibrated.
+    """
+    full_labels = _labels(full_probs)
+    rows = []
+    for low in np.arange(0.0, 0.5, step):
+        for high in np.arange(0.5 + step, 1.0 + step / 2, step):
+            escalate = (screen_raw > low) & (screen_raw < high)
+            final = np.where(escalate, full_probs, screen_probs)
+            rate = float(escalate.mean())
+            row = {
+                "low": round(float(low), 4),
+                "high": round(float(min(high, 1.0)), 4),
+                "escalated": round(rate, 4),
+                "label_change": round(float(np.mean(_labels(final) != full_labels)), 4),
+                "speedup": round(full_cost / (screen_cost + rate * full_cost), 2)
+            }
+            if labels is not None:
+                row["accuracy"] = round(float(np.mean((final >= 0.5) == labels)), 4)
+            rows.append(row)
+    return rows
+
+
+def pick_band(rows, max_label_change):
+    """
+    Fewest escalations within the label budget (ties: more accurate, then
+    narrower); the band changing the fewest labels if none fits
+    """
+    ok = [r for r in rows if r["label_change"] <= max_label_change]
+    if not ok:
+        return min(rows, key=lambda r: (r["label_change"], r["escalated"]))
+    return min(ok, key=lambda r: (r["escalated"], -r.get("accuracy", 0), r["high"] - r["low"]))
+
+
+def main():
+    from calibration import load_calibration
+    from model import checkpoint_id, load_checkpoint
+    from optimize_model import load_validation, score, time_calls
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--checkpoint", default="outputs/best_model.pth")
+    parser.add_argument("--screen_checkpoint", default=CASCADE_MODEL_PATH,
+                        help="smaller screening checkpoint (default: the full model at --screen_size)")
+    parser.add_argument("--screen_size", type=int, default=CASCADE_IMG_SIZE)
+    parser.add_argument("--val_dir", required=True, help="images under Real/ and Fake/")
+    parser.add_argument("--max_images", type=int, default=512)
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--iters", type=int, default=10)
+    parser.add_argument("--max_label_change", type=float, default=0.01,
+                        help="share of served labels allowed to differ from the full model")
+    parser.add_argument("--output", default=None, help=f"default: {BAND_FILE} next to the checkpoint")
+    args = parser.parse_args()
+
+    device = torch.device("cpu")
+    checkpoint = Path(args.checkpoint)
+    model, img_size, meta = load_checkpoint(checkpoint, device)
+    model_id = checkpoint_id(checkpoint)
+    calibration = load_calibration(meta, model_id, checkpoint.parent)
+    screen, size, screen_id = load_screen(model, device, img_size, args.screen_checkpoint, args.screen_size)
+    cascade = Cascade(screen, model, size, *DEFAULT_BAND, screen_id)
+
+    images, labels = load_validation(args.val_dir, img_size, args.max_images)
+    print(f"🖼️ {len(images)} validation images, full model at {img_size}px, screen {screen_id}")
+
+    full_raw = score(model, images, args.batch_size)
+    screen_raw = score(cascade.screen_logits, images, args.batch_size)
+    calibrate = calibration if calibration is not None else (lambda p: p)
+    full_probs, screen_probs = np.asarray(calibrate(full_raw)), np.asarray(calibrate(screen_raw))
+
+    batch = images[:args.batch_size]
+    full_cost = time_calls(model, batch, args.iters) / len(batch)
+    screen_cost = time_calls(cascade.screen_logits, batch, args.iters) / len(batch)
+    print(f"⏱️ {full_cost * 1000:.2f} ms/img full, {screen_cost * 1000:.2f} ms/img screen")
+
+    start = time.perf_counter()
+    rows = evaluate_bands(screen_raw, screen_probs, full_probs, labels, screen_cost, full_cost)
+    best = pick_band(rows, args.max_label_change)
+    tradeoffs = [pick_band(rows, budget) for budget in (0.0, 0.005, 0.01, 0.02, 0.05, 0.1)]
+    print(f"🔎 {len(rows)} bands evaluated in {time.perf_counter() - start:.1f}s")
+
+    full_accuracy = round(float(np.mean((full_probs >= 0.5) == labels)), 4)
+    print(f"\n{'max change':>11}{'band':>14}{'escalated':>11}{'changed':>9}{'acc':>8}{'speedup':>9}")
+    for budget, r in zip((0.0, 0.005, 0.01, 0.02, 0.05, 0.1), tradeoffs):
+        print(f"{budget:>11}{r['low']:>7}-{r['high']:<6}{r['escalated']:>11}{r['label_change']:>9}"
+              f"{r['accuracy']:>8}{r['speedup']:>8}x")
+    print(f"{'full model':>11}{'':>14}{1.0:>11}{0.0:>9}{full_accuracy:>8}{1.0:>8}x")
+
+    output = Path(args.output) if args.output else checkpoint.parent / BAND_FILE
+    output.write_text(json.dumps({
+        "checkpoint": model_id,
+        "screen": screen_id,
+        **best,
+        "full_accuracy": full_accuracy,
+        "max_label_change": args.max_label_change,
+        "images": len(images),
+        "ms_per_image": {"screen": round(screen_cost * 1000, 3), "full": round(full_cost * 1000, 3)},
+        "tradeoffs": tradeoffs
+    }, indent=2))
+    print(f"\n🪜 Band ({best['low']}, {best['high']}) pinned to {checkpoint.name} in {output}")
+    if best["speedup"] <= 1.0:
+        print("⚠️ Within this label budget the cascade is not faster than the full model: keep CASCADE=0")
+
+
+if __name__ == "__main__":
+    main()
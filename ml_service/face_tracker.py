@@ -0,0 +1,168 @@
+import os
+import cv2
+import numpy as np
+
+# ---------------- CONFIG ----------------
+# "iou"  : detect every frame, associate detections to tracks by IoU
+# "flow" : detect every DETECT_EVERY frames, optical flow in between
+#          (only across consecutive source frames, else detect as "iou" does)
+TRACK_MODE = os.environ.get("VIDEO_TRACK_MODE", "iou")
+DETECT_EVERY = int(os.environ.get("VIDEO_DETECT_EVERY", 5))
+IOU_THRESHOLD = 0.3
+MIN_FLOW_CONFIDENCE = 0.5
+MAX_MISSES = 5
+
+LK_PARAMS = dict(
+    winSize=(15, 15),
+    maxLevel=2,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
+)
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0.0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0.0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class FaceTracker:
+    """
+    Assigns stable IDs to face boxes across frames.
+    update() associates fresh detections with existing tracks by IoU,
+    propagate() moves the tracks with sparse Lucas-Kanade optical flow
+    so detection can be skipped on most frames in "flow" mode.
+    """
+
+    def __init__(self, detect_every=DETECT_EVERY, iou_threshold=IOU_THRESHOLD,
+                 min_flow_confidence=MIN_FLOW_CONFIDENCE, max_misses=MAX_MISSES):
+        self.detect_every = max(1, int(detect_every))
+        self.iou_threshold = iou_threshold
+        self.min_flow_confidence = min_flow_confidence
+        self.max_misses = max_misses
+
+        self.tracks = {}    # id -> {"box": [x, y, w, h], "misses": int}
+        self._next_id = 0
+        self._since_detect = 0
+        self.confidence = 0.0
+
+        self.detections = 0
+        self.propagations = 0
+
+    def needs_detection(self, gap=1):
+        """
+        gap is the number of source frames since the last tracked one:
+        optical flow is only trusted between neighbouring frames, so any
+        skipped frame (uniform or scene sampling) means a fresh detection
+        """
+        return (
+            gap != 1
+            or not self.tracks
+            or self._since_detect >= self.detect_every
+            or self.confidence < self.min_flow_confidence
+        )
+
+    def update(self, boxes):
+        """Match detections to tracks, returns [(track_id, box)] in detection order"""
+        self.detections += 1
+        self._since_detect = 1
+        self.confidence = 1.0
+
+        pairs = []
+        for di, box in enumerate(boxes):
+            for tid, track in self.tracks.items():
+                score = iou(box, track["box"])
+                if score >= self.iou_threshold:
+                    pairs.append((score, di, tid))
+        pairs.sort(reverse=True)
+
+        assigned = {}
+        used = set()
+        for _, di, tid in pairs:
+            if di in assigned or tid in used:
+                continue
+            assigned[di] = tid
+            used.add(tid)
+
+        results = []
+        for di, box in enumerate(boxes):
+            tid = assigned.get(di)
+            if tid is None:
+                tid = self._next_id
+                self._next_id += 1
+            self.tracks[tid] = {"box": [float(v) for v in box], "misses": 0}
+            used.add(tid)
+            results.append((tid, tuple(int(v) for v in box)))
+
+        for tid in list(self.tracks):
+            if tid not in used:
+                self.tracks[tid]["misses"] += 1
+                if self.tracks[tid]["misses"] > self.max_misses:
+                    del self.tracks[tid]
+
+        return results
+
+    def propagate(self, prev_gray, gray):
+        """Shift every track by its median optical flow, returns [(track_id, box)]"""
+        self.propagations += 1
+        self._since_detect += 1
+        h, w = gray.shape[:2]
+        confidences = []
+
+        for track in self.tracks.values():
+            x, y, bw, bh = track["box"]
+            x0, y0 = max(0, int(x)), max(0, int(y))
+            x1, y1 = min(w, int(x + bw)), min(h, int(y + bh))
+            if x1 - x0 < 4 or y1 - y0 < 4:
+                confidences.append(0.0)
+                continue
+
+            mask = np.zeros_like(prev_gray)
+            mask[y0:y1, x0:x1] = 255
+            pts = cv2.goodFeaturesToTrack(prev_gray, 40, 0.01, 3, mask=mask)
+            if pts is None or len(pts) < 4:
+                confidences.append(0.0)
+                continue
+
+            nxt, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, pts, None, **LK_PARAMS)
+            ok = status.reshape(-1) == 1
+            confidences.append(ok.sum() / len(pts))
+            if ok.sum() < 4:
+                continue
+
+            old, new = pts.reshape(-1, 2)[ok], nxt.reshape(-1, 2)[ok]
+            dx, dy = np.median(new - old, axis=0)
+
+            # Scale from the spread of the points around their centers
+            old_spread = np.linalg.norm(old - old.mean(axis=0), axis=1)
+            new_spread = np.linalg.norm(new - new.mean(axis=0), axis=1)
+            valid = old_spread > 1e-3
+            scale = float(np.median(new_spread[valid] / old_spread[valid])) if valid.any() else 1.0
+
+            cx, cy = x + bw / 2 + dx, y + bh / 2 + dy
+            bw, bh = bw * scale, bh * scale
+            track["box"] = [cx - bw / 2, cy - bh / 2, bw, bh]
+
+        self.confidence = min(confidences) if confidences else 0.0
+        return self.boxes(w, h)
+
+    def boxes(self, w, h):
+        """Current tracks clipped to the frame"""
+        results = []
+        for tid, track in self.tracks.items():
+            x, y, bw, bh = track["box"]
+            x0, y0 = max(0, int(round(x))), max(0, int(round(y)))
+            x1, y1 = min(w, int(round(x + bw))), min(h, int(round(y + bh)))
+            if x1 > x0 and y1 > y0:
+                results.append((tid, (x0, y0, x1 - x0, y1 - y0)))
+        return results
+
+    def stats(self):
+        return {
+            "tracks": self._next_id,
+            "detections": self.detections,
+            "propagations": self.propagations
+        }
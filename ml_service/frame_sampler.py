@@ -0,0 +1,196 @@
+import os
+import cv2
+import numpy as np
+
+# ---------------- CONFIG ----------------
+# "head"     : the first max_frames frames (legacy behaviour)
+# "uniform"  : max_frames spread evenly over the whole video
+# "keyframe" : codec keyframes only, found without decoding
+# "scene"    : frames where the picture changes, plus a periodic minimum
+SAMPLE_MODE = os.environ.get("VIDEO_SAMPLE_MODE", "uniform")
+SAMPLE_MODES = ("head", "uniform", "keyframe", "scene")
+
+# Gaps longer than this are crossed with a seek instead of grab() calls
+SEEK_STRIDE = int(os.environ.get("VIDEO_SEEK_STRIDE", 48))
+# Mean absolute thumbnail difference (0-255) counted as a scene change
+SCENE_THRESHOLD = float(os.environ.get("VIDEO_SCENE_THRESHOLD", 12.0))
+SCENE_THUMB = (64, 36)
+
+# Early exit once the 95% confidence interval of the mean is this tight
+EARLY_EXIT = os.environ.get("VIDEO_EARLY_EXIT", "0") == "1"
+EARLY_EXIT_HALF_WIDTH = float(os.environ.get("VIDEO_EARLY_EXIT_HALF_WIDTH", 0.05))
+EARLY_EXIT_MIN_FRAMES = int(os.environ.get("VIDEO_EARLY_EXIT_MIN_FRAMES", 16))
+
+
+def confidence_half_width(values):
+    """Half width of the normal 95% confidence interval of the mean"""
+    n = len(values)
+    if n < 2:
+        return float("inf")
+    return 1.96 * float(np.std(values, ddof=1)) / np.sqrt(n)
+
+
+def spread(count, total):
+    """count frame indices spread evenly over [0, total)"""
+    if total <= 0 or count <= 0:
+        return []
+    if count >= total:
+        return list(range(total))
+    return sorted({int(round(i)) for i in np.linspace(0, total - 1, count)})
+
+
+class FrameSampler:
+    """
+    Chooses which frames of a video get analyzed.
+    Latency then follows the sampling budget (max_frames) rather than the
+    video length: skipped frames are grab()bed without color conversion,
+    and long gaps are crossed with a seek.
+    """
+
+    def __init__(self, cap, video_path, mode=SAMPLE_MODE, max_frames=120,
+                 seek_stride=SEEK_STRIDE, scene_threshold=SCENE_THRESHOLD):
+        if mode not in SAMPLE_MODES:
+            raise ValueError(f"Unknown sample mode: {mode}")
+
+        self.cap = cap
+        self.video_path = video_path
+        self.requested_mode = mode
+        self.mode = mode
+        self.max_frames = max(1, int(max_frames))
+        self.seek_stride = max(1, int(seek_stride))
+        self.scene_threshold = scene_threshold
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 1 else 25.0
+        self.total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+
+        self.targets = None
+        if mode in ("uniform", "keyframe", "scene") and self.total <= 0:
+            # Unknown length (some streams), nothing to spread over
+            self.mode = "head"
+        if self.mode == "keyframe":
+            self.targets = self._keyframes()
+            if self.targets is None:
+                self.mode = "uniform"
+        if self.mode == "uniform":
+            self.targets = spread(self.max_frames, self.total)
+
+        self.decoded = 0
+        self.grabbed = 0
+        self.seeks = 0
+
+    @property
+    def output_fps(self):
+        """Frame rate that keeps the sampled output video at real duration"""
+        if self.mode == "head" or self.total <= 0:
+            return self.fps
+        expected = len(self.targets) if self.targets is not None else self.max_frames
+        duration = self.total / self.fps
+        return max(1.0, min(self.fps, expected / duration))
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "requested_mode": self.requested_mode,
+            "total_frames": self.total,
+            "decoded": self.decoded,
+            "grabbed": self.grabbed,
+            "seeks": self.seeks
+        }
+
+    # ---------- sampling ----------
+    def frames(self):
+        """Yield (frame_index, frame) for the sampled frames, in order"""
+        if self.mode == "head":
+            yield from self._head()
+        elif self.mode == "scene":
+            yield from self._scene()
+        else:
+            yield from self.frames_at(self.targets)
+
+    def _head(self):
+        index = 0
+        while index < self.max_frames:
+            ret, frame = self.cap.read()
+            if not ret:
+                return
+            self.decoded += 1
+            yield index, frame
+            index += 1
+
+    def frames_at(self, targets):
+        """Yield (index, frame) for ascending frame indices"""
+        pos = 0
+        for target in targets:
+            gap = target - pos
+            if gap > self.seek_stride:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                self.seeks += 1
+            else:
+                for _ in range(gap):
+                    if not self.cap.grab():
+                        return
+                    self.grabbed += 1
+            ret, frame = self.cap.read()
+            if not ret:
+                return
+            self.decoded += 1
+            pos = target + 1
+            yield target, frame
+
+    def _keyframes(self):
+        """Keyframe indices from packet flags, None if the backend cannot tell"""
+        if not hasattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME"):
+            return None
+        raw = cv2.VideoCapture(self.video_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1])
+        try:
+            if not raw.isOpened():
+                return None
+            # Raw mode: grab() only demuxes packets, nothing is decoded
+            keys = []
+            index = 0
+            while raw.grab():
+                if raw.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                    keys.append(index)
+                index += 1
+        finally:
+            raw.release()
+
+        if len(keys) < 2:
+            return None   # single GOP, keyframes say nothing about coverage
+        if len(keys) > self.max_frames:
+            keys = [keys[i] for i in spread(self.max_frames, len(keys))]
+        return keys
+
+    def _scene(self):
+        # Look at a few candidates per budgeted frame, emit on visual change
+        # and at least every four strides so static shots are still covered
+        stride = max(1, self.total // self.max_frames)
+        step = max(1, stride // 4)
+        last_thumb = None
+        last_emit = None
+        emitted = 0
+        index = 0
+
+        while emitted < self.max_frames:
+            if not self.cap.grab():
+                return
+            self.grabbed += 1
+            if index % step == 0:
+                ret, frame = self.cap.retrieve()
+                if not ret:
+                    return
+                thumb = cv2.cvtColor(
+                    cv2.resize(frame, SCENE_THUMB, interpolation=cv2.INTER_AREA),
+                    cv2.COLOR_BGR2GRAY
+                ).astype(np.int16)
+                changed = (
+                    last_thumb is None
+                    or float(np.abs(thumb - last_thumb).mean()) > self.scene_threshold
+                )
+                if changed or index - last_emit >= stride * 4:
+                    self.decoded += 1
+                    emitted += 1
+                    last_thumb, last_emit = thumb, index
+                    yield index, frame
+            index += 1
@@ -0,0 +1,35 @@
+"""
+Production serving: gunicorn -c gunicorn.conf.py
+
+The app is preloaded in the master (wsgi.py loads the checkpoint), then
+forked, so all workers share one copy of the weights. Each worker gets an
+equal share of the cores for torch intra-op threads.
+"""
+import os
+
+# ---------------- CONFIG ----------------
+_cores = os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8001)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", max(1, _cores // 2)))
+# Request threads per worker; concurrent requests share the worker's
+# micro-batching inference engine
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+torch_threads = int(os.environ.get("TORCH_THREADS", max(1, _cores // workers)))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+preload_app = True
+wsgi_app = "wsgi:app"
+
+# OpenMP/MKL size their pools from these when torch is first imported,
+# which happens in the master while preloading
+for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, str(torch_threads))
+
+
+def post_fork(server, worker):
+    import app as service
+
+    service.init_worker(torch_threads)
+    server.log.info("Worker %s: %s torch threads", worker.pid, torch_threads)
@@ -0,0 +1,54 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# ---------------- CONFIG ----------------
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 16))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", 3))
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", 0.5))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# PATCHing a job result is idempotent on the backend, so it may be retried
+RETRY_METHODS = frozenset({"GET", "HEAD", "PATCH", "PUT", "DELETE", "OPTIONS"})
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def make_session(pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF):
+    """requests.Session with a keep-alive connection pool and retry/backoff"""
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=RETRY_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """
+    Shared session of this process. Keyed by pid so forked workers never
+    reuse sockets inherited from the parent.
+    """
+    pid = os.getpid()
+    session = _sessions.get(pid)
+    if session is None:
+        with _lock:
+            session = _sessions.get(pid)
+            if session is None:
+                session = _sessions[pid] = make_session()
+    return session
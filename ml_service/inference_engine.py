@@ -0,0 +1,238 @@
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import NamedTuple, Optional
+
+import torch
+
+import metrics
+
+# ---------------- CONFIG ----------------
+MAX_BATCH_SIZE = int(os.environ.get("INFER_MAX_BATCH", 16))
+MAX_WAIT_MS = float(os.environ.get("INFER_MAX_WAIT_MS", 5))
+
+# Queue depth is bucketed on powers of two so the histogram stays small
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _depth_bucket(depth):
+    for b in DEPTH_BUCKETS:
+        if depth <= b:
+            return str(b)
+    return f">{DEPTH_BUCKETS[-1]}"
+
+
+class EngineResult(NamedTuple):
+    prob: float
+    stage: str                      # "screen" or "full": which cascade stage decided
+    heatmap: Optional[object] = None   # (h, w) cell probabilities when localized
+
+
+# ---------------- ENGINE ----------------
+class InferenceEngine:
+    """
+    Dynamic micro-batching scheduler around a DetectorModel.
+    Callers submit single preprocessed tensors; one worker thread gathers
+    them into batches of up to max_batch_size (waiting at most max_wait_ms
+    after the first arrival), runs a single forward pass and resolves
+    each caller's Future with an EngineResult for its image.
+
+    With a cascade (see cascade.py) the batch is screened first and only
+    the uncertain rows take the full forward pass. Callers asking to
+    localize also get a heatmap: their images go through
+    localizer.forward_with_map (the eager DetectorModel); when that is
+    also the serving model, the whole batch shares that pass.
+    """
+
+    def __init__(self, model, device, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 calibration=None, localizer=None, cascade=None):
+        self.model = model
+        self.localizer = localizer
+        self.cascade = cascade
+        self.calibration = calibration
+        self.device = device
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._batch_hist = Counter()
+        self._depth_hist = Counter()
+        self._requests = 0
+        self._batches = 0
+        self._busy_time = 0.0
+
+    # ---------- lifecycle ----------
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="inference-engine", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    # ---------- public API ----------
+    def submit(self, tensor, localize=False):
+        """Queue one (3, H, W) or (1, 3, H, W) tensor, returns a Future[EngineResult]"""
+        if tensor.dim() == 4:
+            if tensor.size(0) != 1:
+                raise ValueError("submit() takes a single image, use predict_batch()")
+            tensor = tensor[0]
+        if localize and self.localizer is None:
+            raise ValueError("Localization needs the eager model (localizer)")
+
+        self.start()
+        fut = Future()
+        self._queue.put((tensor, fut, time.perf_counter(), localize))
+        return fut
+
+    def predict(self, tensor, timeout=None, localize=False):
+        return self.submit(tensor, localize).result(timeout)
+
+    def predict_batch(self, tensors, timeout=None, localize=False):
+        futures = [self.submit(t, localize) for t in tensors]
+        return [f.result(timeout) for f in futures]
+
+    def stats(self):
+        with self._stats_lock:
+            avg = self._requests / self._batches if self._batches else 0.0
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "requests": self._requests,
+                "batches": self._batches,
+                "avg_batch_size": round(avg, 3),
+                "busy_seconds": round(self._busy_time, 4),
+                "cascade": self.cascade.stats() if self.cascade is not None else None,
+                "batch_size_histogram": {
+                    str(k): v for k, v in sorted(self._batch_hist.items())
+                },
+                "queue_depth_histogram": {
+                    b: self._depth_hist[b]
+                    for b in [str(x) for x in DEPTH_BUCKETS] + [f">{DEPTH_BUCKETS[-1]}"]
+                    if self._depth_hist[b]
+                },
+            }
+
+    # ---------- worker ----------
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Stop sentinel: finish this batch, leave the sentinel for the loop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            first = self._queue.get()
+            if first is None:
+                continue
+            batch = self._collect(first)
+            depth = self._queue.qsize()
+            self._run_batch(batch)
+
+            with self._stats_lock:
+                self._batch_hist[len(batch)] += 1
+                self._depth_hist[_depth_bucket(depth)] += 1
+                self._requests += len(batch)
+                self._batches += 1
+
+        # Fail anything still waiting so callers never hang on shutdown
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(RuntimeError("Inference engine stopped"))
+
+    def _probs(self, logits):
+        probs = torch.sigmoid(logits.float())
+        if self.calibration is not None:
+            probs = self.calibration(probs)
+        return probs.cpu()
+
+    def _score(self, x):
+        """(logits, per-row stage) of plain rows: through the cascade when there is one"""
+        if self.cascade is None:
+            return self.model(x), ["full"] * len(x)
+        logits, escalated = self.cascade(x)
+        return logits, ["full" if e else "screen" for e in escalated.tolist()]
+
+    def _forward(self, x, localize):
+        """EngineResult per row; localize rows also get their cell maps"""
+        rows = [i for i, flag in enumerate(localize) if flag]
+        if not rows:
+            logits, stages = self._score(x)
+            return [EngineResult(p, s) for p, s in zip(self._probs(logits).tolist(), stages)]
+
+        stages = ["full"] * len(localize)
+        if self.model is self.localizer:
+            # Eager runtime: one pass scores and localizes everyone (no screening needed)
+            logits, cells = self.localizer.forward_with_map(x)
+            probs, cells = self._probs(logits), cells[rows]
+        else:
+            # Optimized runtime (or cascade) for the plain rows, eager pass for the localized ones
+            probs = torch.empty(len(localize))
+            plain = [i for i, flag in enumerate(localize) if not flag]
+            if plain:
+                logits, plain_stages = self._score(x[plain])
+                probs[plain] = self._probs(logits)
+                for i, stage in zip(plain, plain_stages):
+                    stages[i] = stage
+            logits, cells = self.localizer.forward_with_map(x[rows])
+            probs[rows] = self._probs(logits)
+
+        maps = dict(zip(rows, self._probs(cells).numpy()))
+        return [EngineResult(p, s, maps.get(i)) for i, (p, s) in enumerate(zip(probs.tolist(), stages))]
+
+    def _run_batch(self, batch):
+        futures = [item[1] for item in batch]
+        localize = [item[3] for item in batch]
+        t0 = time.perf_counter()
+        for _, _, submitted, _ in batch:
+            metrics.STAGE_SECONDS.observe(t0 - submitted, stage="inference_queue")
+        metrics.BATCH_SIZE.observe(len(batch))
+        try:
+            x = torch.stack([item[0] for item in batch]).to(self.device)
+            with torch.no_grad():
+                results = self._forward(x, localize)
+        except Exception as e:
+            for fut in futures:
+                fut.set_exception(e)
+            return
+        finally:
+            busy = time.perf_counter() - t0
+            metrics.STAGE_SECONDS.observe(busy, stage="forward")
+            with self._stats_lock:
+                self._busy_time += busy
+
+        for fut, result in zip(futures, results):
+            fut.set_result(result)
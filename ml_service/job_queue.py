@@ -0,0 +1,189 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+# ---------------- CONFIG ----------------
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 32))
+JOB_HISTORY = int(os.environ.get("JOB_HISTORY", 1000))
+IN_FLIGHT = ("queued", "running")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    result TEXT,
+    error TEXT
+)
+"""
+
+
+class QueueFull(Exception):
+    """Raised when the job queue cannot take more work (maps to HTTP 429)"""
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _record(row):
+    job_id, status, pid, submitted, started, finished, result, error = row
+    if status in IN_FLIGHT and not _process_alive(pid):
+        # Its worker exited (crash, restart) and took the in-memory queue with it
+        status, error = "failed", f"Worker {pid} exited before the job finished"
+    return {
+        "jobId": job_id,
+        "status": status,
+        "submittedAt": submitted,
+        "startedAt": started,
+        "finishedAt": finished,
+        "result": json.loads(result) if result is not None else None,
+        "error": error,
+    }
+
+
+# ---------------- JOB QUEUE ----------------
+class JobQueue:
+    """
+    Bounded background job queue with a fixed pool of worker threads.
+    handler(job_id, payload) does the actual work and returns the result;
+    any exception marks the job as failed. Job status lives in a SQLite
+    file (the callback outbox's) shared by all worker processes, so
+    /api/jobs/<id> answers from any of them and a job in flight on one
+    worker is not accepted again by another. Finished jobs are kept in a
+    capped history; the work itself runs in the accepting process.
+    """
+
+    def __init__(self, handler, db_path, workers=JOB_WORKERS, max_pending=JOB_QUEUE_SIZE, history=JOB_HISTORY):
+        self.handler = handler
+        self.db_path = str(db_path)
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.history = max(1, int(history))
+
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._lock = threading.Lock()
+        self._threads = []
+
+        with self._connect() as db:
+            db.execute(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            yield db
+        finally:
+            db.close()
+
+    # ---------- lifecycle ----------
+    def start(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.workers):
+                t = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        return self
+
+    # ---------- public API ----------
+    def submit(self, job_id, payload):
+        """Enqueue a job, returns its status record. Raises QueueFull."""
+        self.start()
+        with self._connect() as db:
+            # Check and insert atomically across processes
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                existing = db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+                if existing is not None and _record(existing)["status"] in IN_FLIGHT:
+                    # Resubmission of an in-flight job (e.g. client retry)
+                    db.execute("COMMIT")
+                    return _record(existing)
+
+                now = time.time()
+                db.execute(
+                    """INSERT OR REPLACE INTO jobs (job_id, status, pid, submitted, started, finished, result, error)
+                       VALUES (?, 'queued', ?, ?, NULL, NULL, NULL, NULL)""",
+                    (job_id, os.getpid(), now)
+                )
+                self._trim(db)
+                try:
+                    self._queue.put_nowait((job_id, payload))
+                except queue.Full:
+                    raise QueueFull(f"Job queue is full ({self.max_pending} pending)")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            # A worker picking the job up waits for this commit before marking it running
+            db.execute("COMMIT")
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return _record(row) if row is not None else None
+
+    def stats(self):
+        with self._connect() as db:
+            rows = db.execute("SELECT status, pid, COUNT(*) FROM jobs GROUP BY status, pid").fetchall()
+        counts = {}
+        for status, pid, count in rows:
+            if status in IN_FLIGHT and not _process_alive(pid):
+                status = "failed"
+            counts[status] = counts.get(status, 0) + count
+        with self._lock:
+            alive = sum(t.is_alive() for t in self._threads)
+        return {
+            "workers": self.workers,
+            "alive_workers": alive,
+            "queue_depth": self._queue.qsize(),
+            "max_pending": self.max_pending,
+            "jobs": counts,
+        }
+
+    # ---------- worker ----------
+    def _trim(self, db):
+        # Drop the oldest finished jobs, never in-flight ones
+        db.execute(
+            """DELETE FROM jobs WHERE job_id IN (
+                   SELECT job_id FROM jobs WHERE status IN ('completed', 'failed')
+                   ORDER BY finished DESC LIMIT -1 OFFSET ?)""",
+            (self.history,)
+        )
+
+    def _update(self, job_id, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as db:
+            db.execute(f"UPDATE jobs SET {columns} WHERE job_id = ? AND pid = ?",
+                       (*fields.values(), job_id, os.getpid()))
+
+    def _run(self):
+        while True:
+            job_id, payload = self._queue.get()
+            self._update(job_id, status="running", started=time.time())
+            try:
+                result = self.handler(job_id, payload)
+            except Exception as e:
+                print(f"❌ Job {job_id} failed: {e}")
+                print(traceback.format_exc())
+                self._update(job_id, status="failed", error=str(e), finished=time.time())
+            else:
+                self._update(job_id, status="completed", result=json.dumps(result), finished=time.time())
+            finally:
+                self._queue.task_done()
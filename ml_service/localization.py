@@ -0,0 +1,94 @@
+"""
+Tamper localization from the scoring forward pass.
+
+DetectorModel.forward_with_map scores every cell of the backbone's
+feature map with the classification head (7 x 7 cells at 224 px for
+EfficientNet-B0), so the heatmap costs one extra head evaluation per
+image instead of a forward pass per sliding-window crop. Cells above
+the threshold are grouped into 4-connected components and each component
+becomes one {x, y, w, h, confidence} box in source-image pixels.
+
+Boxes are as coarse as the cells (1/7 of each side at 224 px): they say
+where to look, not the exact outline of the edit.
+"""
+import os
+
+import numpy as np
+from PIL import Image
+
+# ---------------- CONFIG ----------------
+# Calibrated cell probability counted as tampered (label_for's FAKE bound)
+LOCALIZE_THRESHOLD = float(os.environ.get("LOCALIZE_THRESHOLD", 0.60))
+LOCALIZE_MIN_CELLS = int(os.environ.get("LOCALIZE_MIN_CELLS", 1))
+LOCALIZE_MAX_REGIONS = int(os.environ.get("LOCALIZE_MAX_REGIONS", 5))
+
+
+def localization_config():
+    """Settings that shape the regions, part of the result cache key"""
+    return [LOCALIZE_THRESHOLD, LOCALIZE_MIN_CELLS, LOCALIZE_MAX_REGIONS]
+
+
+def image_size(src):
+    """(width, height) of a path or binary file-like image from its header (rewound afterwards)"""
+    with Image.open(src) as img:
+        size = img.size
+    if hasattr(src, "seek"):
+        src.seek(0)
+    return size
+
+
+def _components(mask):
+    """4-connected components of a 2-D bool array, as lists of (row, col)"""
+    seen = np.zeros_like(mask, dtype=bool)
+    rows, cols = mask.shape
+    components = []
+    for r, c in zip(*np.nonzero(mask)):
+        if seen[r, c]:
+            continue
+        seen[r, c] = True
+        stack, cells = [(r, c)], []
+        while stack:
+            y, x = stack.pop()
+            cells.append((y, x))
+            for ny, nx in ((y - 1, x), (y + 1, x), (y, x - 1), (y, x + 1)):
+                if 0 <= ny < rows and 0 <= nx < cols and mask[ny, nx] and not seen[ny, nx]:
+                    seen[ny, nx] = True
+                    stack.append((ny, nx))
+        components.append(cells)
+    return components
+
+
+def heatmap_regions(heatmap, width, height, threshold=LOCALIZE_THRESHOLD,
+                    min_cells=LOCALIZE_MIN_CELLS, max_regions=LOCALIZE_MAX_REGIONS):
+    """
+    Boxes around the connected groups of cells at or above threshold,
+    scaled to a width x height image, most confident first
+    """
+    heatmap = np.asarray(heatmap, dtype=np.float32)
+    rows, cols = heatmap.shape
+    sx, sy = width / cols, height / rows
+
+    regions = []
+    for cells in _components(heatmap >= threshold):
+        if len(cells) < min_cells:
+            continue
+        ys, xs = zip(*cells)
+        x0, y0 = round(min(xs) * sx), round(min(ys) * sy)
+        x1, y1 = round((max(xs) + 1) * sx), round((max(ys) + 1) * sy)
+        regions.append({
+            "x": x0,
+            "y": y0,
+            "w": x1 - x0,
+            "h": y1 - y0,
+            "confidence": round(float(max(heatmap[y, x] for y, x in cells)), 4)
+        })
+    regions.sort(key=lambda r: r["confidence"], reverse=True)
+    return regions[:max_regions]
+
+
+def localization_result(heatmap, size):
+    """{"regions", "heatmap"} of one image; size is the source (width, height)"""
+    return {
+        "regions": heatmap_regions(heatmap, *size),
+        "heatmap": np.round(np.asarray(heatmap, dtype=np.float64), 3).tolist()
+    }
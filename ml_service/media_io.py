@@ -0,0 +1,110 @@
+import hashlib
+import os
+import uuid
+from io import BytesIO
+
+import requests
+
+# ---------------- CONFIG ----------------
+MAX_IMAGE_BYTES = int(float(os.environ.get("MAX_IMAGE_MB", 25)) * 1024 * 1024)
+MAX_VIDEO_BYTES = int(float(os.environ.get("MAX_VIDEO_MB", 500)) * 1024 * 1024)
+CHUNK_SIZE = 256 * 1024
+
+
+class DownloadTooLarge(ValueError):
+    """Remote file is bigger than the configured cap"""
+
+
+class Media:
+    """
+    A downloaded file. Images stay in memory (buffer); videos are streamed
+    to a temp file (path) because OpenCV can only open them by name.
+    sha256 is the hex digest of the bytes, computed while streaming.
+    """
+
+    def __init__(self, kind, ext, size, sha256, buffer=None, path=None):
+        self.kind = kind
+        self.ext = ext
+        self.size = size
+        self.sha256 = sha256
+        self.buffer = buffer
+        self.path = path
+
+    def cleanup(self):
+        if self.path is not None and self.path.exists():
+            self.path.unlink()
+
+
+def detect_extension(file_url, content_type, file_type):
+    url = file_url.lower()
+    content_type = (content_type or "").lower()
+
+    if '.webp' in url or 'webp' in content_type:
+        return '.webp'
+    if '.mp4' in url or 'video/mp4' in content_type:
+        return '.mp4'
+    if '.jpg' in url or '.jpeg' in url or 'jpeg' in content_type:
+        return '.jpg'
+    if '.png' in url or 'png' in content_type:
+        return '.png'
+    return f".{file_type}" if file_type else '.jpg'
+
+
+def media_kind(ext, file_type, image_exts, video_exts):
+    if file_type == 'image' or ext in image_exts:
+        return "image"
+    if file_type == 'video' or ext in video_exts:
+        return "video"
+    return None
+
+
+def _chunks(response, limit):
+    declared = response.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > limit:
+        raise DownloadTooLarge(f"File is {int(declared)} bytes, limit is {limit}")
+
+    size = 0
+    for chunk in response.iter_content(CHUNK_SIZE):
+        size += len(chunk)
+        if size > limit:
+            raise DownloadTooLarge(f"File exceeds the {limit} byte limit")
+        yield chunk
+
+
+def download_media(file_url, file_type, image_exts, video_exts, temp_dir,
+                   session=requests, timeout=30):
+    """
+    Stream file_url without holding the whole response twice.
+    Images are read into a BytesIO (capped at MAX_IMAGE_BYTES) and never
+    touch disk; videos are written chunk by chunk to temp_dir (capped at
+    MAX_VIDEO_BYTES). Bytes are hashed on the way through.
+    """
+    digest = hashlib.sha256()
+    with session.get(file_url, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        ext = detect_extension(file_url, response.headers.get('content-type', ''), file_type)
+        kind = media_kind(ext, file_type, image_exts, video_exts)
+        if kind is None:
+            raise ValueError(f"Unsupported file type: {ext}")
+
+        if kind == "image":
+            buffer = BytesIO()
+            for chunk in _chunks(response, MAX_IMAGE_BYTES):
+                digest.update(chunk)
+                buffer.write(chunk)
+            size = buffer.tell()
+            buffer.seek(0)
+            return Media(kind, ext, size, digest.hexdigest(), buffer=buffer)
+
+        path = temp_dir / f"temp_{uuid.uuid4().hex}{ext}"
+        size = 0
+        try:
+            with open(path, 'wb') as f:
+                for chunk in _chunks(response, MAX_VIDEO_BYTES):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            path.unlink(missing_ok=True)
+            raise
+        return Media(kind, ext, size, digest.hexdigest(), path=path)
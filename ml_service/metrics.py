@@ -0,0 +1,224 @@
+"""
+Latency histograms, counters and gauges, exported on /metrics in the
+Prometheus text format (no client library needed).
+
+    with metrics.stage("convert"):          # ml_stage_seconds{stage="convert"}
+        ...
+    timer = metrics.StageTimer()            # same histogram, plus a per-job breakdown
+    with timer.stage("download"):
+        ...
+    timer.breakdown()                       # {"download": 0.412, ...}
+
+Queue depths and cache hit rates already live in each component's
+stats(); register_collector() reads them at scrape time instead of
+duplicating the bookkeeping. Metrics are per process: under gunicorn
+each worker reports its own.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# ---------------- CONFIG ----------------
+# Histogram bucket upper bounds (seconds)
+LATENCY_BUCKETS = tuple(
+    float(b) for b in os.environ.get(
+        "METRICS_BUCKETS", "0.001,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60"
+    ).split(",")
+)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+# ---------------- METRIC TYPES ----------------
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def lines(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_value(v)}" for key, v in values]
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label combination"""
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def lines(self):
+        with self._lock:
+            series = sorted((key, list(counts), total, n) for key, (counts, total, n) in self._series.items())
+        out = []
+        for key, counts, total, n in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(key + (("le", _format_value(float(bound))),))
+                out.append(f"{self.name}_bucket{labels} {cumulative}")
+            out.append(f"{self.name}_sum{_format_labels(key)} {_format_value(round(total, 6))}")
+            out.append(f"{self.name}_count{_format_labels(key)} {n}")
+        return out
+
+
+# ---------------- REGISTRY ----------------
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def register_collector(self, collect):
+        """
+        collect() returns [(name, kind, help, value)] or, for labelled
+        series, [(name, kind, help, {(("label", "v"), ...): value})];
+        called on every scrape.
+        """
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.lines())
+
+        for collect in list(self._collectors):
+            try:
+                samples = collect()
+            except Exception as e:
+                # A broken collector must not take the other metrics down
+                lines.append(f"# collector {getattr(collect, '__name__', collect)} failed: {e}")
+                continue
+            for name, kind, help, value in samples:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                series = value.items() if isinstance(value, dict) else [((), value)]
+                for labels, v in series:
+                    if v is not None:
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(v)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "ml_stage_seconds", "Time spent in each processing stage", ("stage",)
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "ml_http_request_seconds", "HTTP request latency", ("endpoint", "method", "status")
+)
+BATCH_SIZE = REGISTRY.histogram(
+    "ml_inference_batch_size", "Images per forward pass of the inference engine", buckets=BATCH_BUCKETS
+)
+JOBS = REGISTRY.counter("ml_jobs_total", "Analysis jobs by media kind and outcome", ("kind", "outcome"))
+
+
+def stage(name):
+    """Context manager timing one stage into ml_stage_seconds"""
+    return STAGE_SECONDS.time(stage=name)
+
+
+class StageTimer:
+    """Per-job stage breakdown; every stage is also observed in ml_stage_seconds"""
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, observe=True):
+        """Record seconds under name (observe=False for time already counted elsewhere)"""
+        with self._lock:
+            self._stages[name] = self._stages.get(name, 0.0) + seconds
+        if observe:
+            STAGE_SECONDS.observe(seconds, stage=name)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def breakdown(self):
+        """{stage: seconds} in the order stages were first entered"""
+        with self._lock:
+            return {name: round(seconds, 4) for name, seconds in self._stages.items()}
+
+
+def render():
+    return REGISTRY.render()
+
+
+def register_collector(collect):
+    REGISTRY.register_collector(collect)
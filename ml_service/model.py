@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+
+DEFAULT_IMG_SIZE = 224
+DEFAULT_MODEL_NAME = "efficientnet_b0"
+# Memory-map checkpoint tensors and build the model without random init.
+# 0 restores the plain torch.load + load_state_dict path.
+MODEL_MMAP = os.environ.get("MODEL_MMAP", "1") == "1"
+
+
+# ---------------- MODEL ----------------
+class DetectorModel(nn.Module):
+    def __init__(self, backbone_name="efficientnet_b0", drop_rate=0.3, pretrained=False):
+        super().__init__()
+        # timm (and torchvision under it) load with the first model, not on import
+        import timm
+
+        self.backbone = timm.create_model(
+            backbone_name,
+            pretrained=pretrained,
+            num_classes=0,
+            global_pool="avg"
+        )
+        feat_dim = self.backbone.num_features
+        self.head = nn.Sequential(
+            nn.Dropout(drop_rate),
+            nn.Linear(feat_dim, 256),
+            nn.ReLU(),
+            nn.Dropout(drop_rate / 2),
+            nn.Linear(256, 1)
+        )
+
+    def forward(self, x):
+        feats = self.backbone.forward_features(x)
+        feats = torch.nn.functional.adaptive_avg_pool2d(feats, 1)
+        feats = feats.view(feats.size(0), -1)
+        return self.head(feats).squeeze(1)
+
+    def forward_with_map(self, x):
+        """
+        (logits, cell logits) from one backbone pass: the head also scores
+        every spatial cell of the feature map before pooling (CAM-style),
+        giving an (N, h, w) map at the backbone's output stride.
+        """
+        feats = self.backbone.forward_features(x)
+        pooled = torch.nn.functional.adaptive_avg_pool2d(feats, 1).flatten(1)
+        cells = self.head(feats.permute(0, 2, 3, 1)).squeeze(-1)
+        return self.head(pooled).squeeze(1), cells
+
+
+# ---------------- PREDICTIONS ----------------
+def label_for(raw_prob):
+    if raw_prob >= 0.60:
+        return "FAKE (AI-generated)"
+    if raw_prob >= 0.15:
+        return "FAKE (Edited appearance)"
+    return "REAL"
+
+
+def prediction_from_prob(raw_prob):
+    """(raw_prob, fake_percent, real_percent, label) as served by the API"""
+    fake_percent = round(raw_prob * 100, 2)
+    real_percent = round(100 - fake_percent, 2)
+    return raw_prob, fake_percent, real_percent, label_for(raw_prob)
+
+
+# ---------------- CHECKPOINTS ----------------
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _safetensors_metadata(path):
+    from safetensors import safe_open
+
+    with safe_open(str(path), framework="pt") as f:
+        return f.metadata() or {}
+
+
+def checkpoint_id(path):
+    """
+    Identity of a checkpoint file: name plus a short content hash.
+    A .safetensors conversion keeps the id of the checkpoint it came
+    from, so caches and calibration pins carry over.
+    """
+    path = Path(path)
+    if path.suffix == ".safetensors":
+        source = _safetensors_metadata(path).get("checkpoint_id")
+        if source:
+            return source
+    return f"{path.name}:{file_sha256(path)[:16]}"
+
+
+def fast_path(path):
+    """The .safetensors sibling of a checkpoint when it is at least as new"""
+    fast = Path(path).with_suffix(".safetensors")
+    if not MODEL_MMAP or not fast.exists():
+        return None
+    if Path(path).exists() and fast.stat().st_mtime < Path(path).stat().st_mtime:
+        return None
+    return fast
+
+
+def save_safetensors(checkpoint_path, out_path=None):
+    """
+    Write the weights of a .pth checkpoint as .safetensors (zero-copy,
+    mmap-able), with the other checkpoint entries as JSON metadata.
+    """
+    checkpoint_path = Path(checkpoint_path)
+    out_path = Path(out_path) if out_path else checkpoint_path.with_suffix(".safetensors")
+    from safetensors.torch import save_file
+
+    ckpt = torch.load(checkpoint_path, map_location="cpu")
+    state = ckpt.get("model_state_dict", ckpt)
+    meta = {k: v for k, v in ckpt.items() if k != "model_state_dict"} if "model_state_dict" in ckpt else {}
+    save_file(
+        {k: v.contiguous() for k, v in state.items()},
+        str(out_path),
+        metadata={"checkpoint_id": checkpoint_id(checkpoint_path), "meta": json.dumps(meta, default=str)}
+    )
+    return out_path
+
+
+def _read_checkpoint(model_path, device, mmap):
+    """(state_dict, meta) from .safetensors or .pth, memory-mapped when possible"""
+    if model_path.suffix == ".safetensors":
+        from safetensors.torch import load_file
+
+        state = load_file(str(model_path), device=str(device))
+        return state, json.loads(_safetensors_metadata(model_path).get("meta", "{}"))
+
+    try:
+        ckpt = torch.load(model_path, map_location=device, mmap=mmap)
+    except RuntimeError:
+        # Legacy (non-zipfile) pickles cannot be mapped
+        ckpt = torch.load(model_path, map_location=device)
+    if "model_state_dict" not in ckpt:
+        return ckpt, {}
+    return ckpt["model_state_dict"], {k: v for k, v in ckpt.items() if k != "model_state_dict"}
+
+
+def load_checkpoint(model_path, device, mmap=MODEL_MMAP):
+    """
+    Build an eval-mode DetectorModel from a checkpoint saved by train.py
+    ({"args": ..., "model_state_dict": ...}), a bare state dict or its
+    .safetensors conversion. Returns (model, img_size, meta); meta is
+    every other checkpoint entry (args, metrics, calibration, ...).
+
+    With mmap, tensors stay backed by the file (pages are read on first
+    use and shared between processes through the page cache) and the
+    model is built on the meta device, so no random init is computed
+    and then thrown away.
+    """
+    model_path = Path(model_path)
+    state, meta = _read_checkpoint(model_path, device, mmap)
+
+    img_size = meta.get("args", {}).get("img_size", DEFAULT_IMG_SIZE)
+    backbone = meta.get("args", {}).get("backbone_name", DEFAULT_MODEL_NAME)
+
+    if mmap:
+        with torch.device("meta"):
+            model = DetectorModel(backbone_name=backbone)
+        model.load_state_dict(state, assign=True)
+    else:
+        model = DetectorModel(backbone_name=backbone)
+        model.load_state_dict(state)
+    return model.to(device).eval(), img_size, meta
@@ -0,0 +1,224 @@
+import copy
+import json
+import os
+import time
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+
+# ---------------- CONFIG ----------------
+# Which variant of DetectorModel serves requests (see optimize_model.py)
+MODEL_RUNTIME = os.environ.get("MODEL_RUNTIME", "eager").lower()
+# A runtime whose probabilities drift further than this from eager on the
+# load-time check is rejected and the service stays on eager
+RUNTIME_TOLERANCE = float(os.environ.get("MODEL_RUNTIME_TOLERANCE", 0.05))
+
+RUNTIMES = ("eager", "int8_dynamic", "int8_static", "torchscript", "compile", "onnx")
+# Runtimes built offline by optimize_model.py; the others are built at load time
+ARTIFACTS = {
+    "int8_static": "model_int8_static.pt",
+    "torchscript": "model_torchscript.pt",
+    "onnx": "model.onnx"
+}
+CPU_ONLY = {"int8_dynamic", "int8_static", "onnx"}
+MANIFEST = "manifest.json"
+
+
+def quantized_engine():
+    engines = torch.backends.quantized.supported_engines
+    for name in ("x86", "fbgemm", "qnnpack"):
+        if name in engines:
+            return name
+    return None
+
+
+# ---------------- ADAPTERS ----------------
+class ChannelsLast(nn.Module):
+    """Feeds the wrapped model NHWC tensors (faster convolutions on CPU)"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x.contiguous(memory_format=torch.channels_last))
+
+
+class OnnxModel:
+    """Callable like DetectorModel: float NCHW tensor in, logits tensor out"""
+
+    def __init__(self, path, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or torch.get_num_threads()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x):
+        logits = self.session.run(None, {self.input_name: x.detach().cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+
+# ---------------- BUILDERS ----------------
+def quantize_dynamic(model):
+    """int8 weights for the Linear head; activations quantized on the fly"""
+    from torch.ao.quantization import quantize_dynamic as _quantize_dynamic
+    return _quantize_dynamic(copy.deepcopy(model).cpu().eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static(model, calibration_batches, img_size):
+    """
+    Post-training static int8 (FX graph mode) over the whole network,
+    calibrated on representative inputs, then traced and frozen.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    engine = quantized_engine()
+    torch.backends.quantized.engine = engine
+    example = torch.randn(1, 3, img_size, img_size)
+
+    prepared = prepare_fx(
+        copy.deepcopy(model).cpu().eval(), get_default_qconfig_mapping(engine), (example,)
+    )
+    with torch.no_grad():
+        for batch in calibration_batches:
+            prepared(batch.cpu())
+    quantized = convert_fx(prepared)
+
+    with torch.no_grad():
+        traced = torch.jit.trace(quantized, example)
+    return torch.jit.freeze(traced.eval())
+
+
+def script_model(model, img_size):
+    """channels_last, traced and frozen (conv/bn folded, weights inlined)"""
+    model = copy.deepcopy(model).cpu().eval().to(memory_format=torch.channels_last)
+    example = torch.randn(1, 3, img_size, img_size).contiguous(memory_format=torch.channels_last)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+    return torch.jit.freeze(traced.eval())
+
+
+def export_onnx(model, img_size, path):
+    model = copy.deepcopy(model).cpu().eval()
+    example = torch.randn(1, 3, img_size, img_size)
+    torch.onnx.export(
+        model,
+        (example,),
+        str(path),
+        input_names=["input"],
+        output_names=["logit"],
+        dynamic_axes={"input": {0: "batch"}, "logit": {0: "batch"}},
+        opset_version=17,
+        dynamo=False
+    )
+
+
+def build_artifact(runtime, model, img_size, runtime_dir, calibration_batches=()):
+    """Write the artifact of an offline runtime into runtime_dir, return its path"""
+    runtime_dir = Path(runtime_dir)
+    runtime_dir.mkdir(parents=True, exist_ok=True)
+    path = runtime_dir / ARTIFACTS[runtime]
+
+    if runtime == "int8_static":
+        torch.jit.save(quantize_static(model, calibration_batches, img_size), str(path))
+    elif runtime == "torchscript":
+        torch.jit.save(script_model(model, img_size), str(path))
+    elif runtime == "onnx":
+        export_onnx(model, img_size, path)
+    return path
+
+
+# ---------------- MANIFEST ----------------
+def read_manifest(runtime_dir):
+    path = Path(runtime_dir) / MANIFEST
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def write_manifest(runtime_dir, model_id, img_size, artifacts):
+    """Artifacts are only valid for the checkpoint they were built from"""
+    manifest = {
+        "checkpoint": model_id,
+        "img_size": img_size,
+        "torch": torch.__version__,
+        "quantized_engine": quantized_engine(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "artifacts": {name: Path(path).name for name, path in artifacts.items()}
+    }
+    (Path(runtime_dir) / MANIFEST).write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+# ---------------- LOADING ----------------
+def _build_runtime(runtime, model, device, img_size, runtime_dir, model_id):
+    if runtime == "eager":
+        return model
+    if runtime == "int8_dynamic":
+        return quantize_dynamic(model)
+    if runtime == "compile":
+        model = copy.deepcopy(model).to(memory_format=torch.channels_last)
+        return torch.compile(ChannelsLast(model))
+
+    manifest = read_manifest(runtime_dir)
+    if runtime not in manifest.get("artifacts", {}):
+        raise FileNotFoundError(f"no {runtime} artifact in {runtime_dir}, run optimize_model.py")
+    if manifest.get("checkpoint") != model_id:
+        raise ValueError(
+            f"{runtime} artifact was built from {manifest.get('checkpoint')}, loaded checkpoint is {model_id}"
+        )
+    path = Path(runtime_dir) / manifest["artifacts"][runtime]
+
+    if runtime == "onnx":
+        return OnnxModel(path)
+    if runtime == "int8_static" and manifest.get("quantized_engine"):
+        torch.backends.quantized.engine = manifest["quantized_engine"]
+    scripted = torch.jit.load(str(path), map_location=device)
+    return ChannelsLast(scripted) if runtime == "torchscript" else scripted
+
+
+def check_parity(reference, candidate, img_size, device, batch_size=2):
+    """Max |sigmoid difference| of the two models on a random batch"""
+    x = torch.randn(batch_size, 3, img_size, img_size, device=device)
+    with torch.no_grad():
+        expected = torch.sigmoid(reference(x).float()).cpu()
+        actual = torch.sigmoid(candidate(x).float()).cpu()
+    return float((expected - actual).abs().max())
+
+
+def load_runtime(model, device, img_size, runtime_dir, model_id, runtime=MODEL_RUNTIME):
+    """
+    Returns (callable model, runtime name). Any runtime that cannot be built,
+    does not match the checkpoint or fails the parity check falls back to
+    the eager model, so a bad artifact never takes the service down.
+    """
+    if runtime not in RUNTIMES:
+        print(f"⚠️ Unknown MODEL_RUNTIME '{runtime}', using eager")
+        return model, "eager"
+    if runtime == "eager":
+        return model, runtime
+    if runtime in CPU_ONLY and device.type != "cpu":
+        print(f"⚠️ MODEL_RUNTIME={runtime} is CPU-only, using eager on {device}")
+        return model, "eager"
+
+    try:
+        candidate = _build_runtime(runtime, model, device, img_size, runtime_dir, model_id)
+        # Also warms up lazily compiled runtimes before the first request
+        diff = check_parity(model, candidate, img_size, device)
+    except Exception as e:
+        print(f"⚠️ MODEL_RUNTIME={runtime} unavailable ({e}), using eager")
+        return model, "eager"
+
+    if diff > RUNTIME_TOLERANCE:
+        print(f"⚠️ MODEL_RUNTIME={runtime} drifts {diff:.4f} from eager, using eager")
+        return model, "eager"
+
+    print(f"⚡ Model runtime: {runtime} (max prob diff vs eager {diff:.5f})")
+    return candidate, runtime
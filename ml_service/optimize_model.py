@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Build CPU runtime variants of DetectorModel and compare them with eager.
+
+Writes the offline artifacts (static int8, frozen TorchScript, ONNX) plus a
+manifest tying them to the checkpoint into --output_dir, then scores a
+validation folder with every runtime, exactly as the service would load
+it, and reports parity with eager and latency/throughput.
+
+    python optimize_model.py --val_dir Dataset/Validation --report outputs/runtimes/report.json
+
+--val_dir holds images under Real/ and Fake/ (any case); without it,
+random inputs are used and only parity/latency are reported.
+Serve a variant with MODEL_RUNTIME=<name> (see README). --safetensors also
+writes the memory-mappable copy of the checkpoint the service prefers.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from model import DetectorModel, DEFAULT_IMG_SIZE, checkpoint_id, load_checkpoint, save_safetensors
+from model_runtime import ARTIFACTS, RUNTIMES, build_artifact, load_runtime, write_manifest
+from preprocessing import load_image_tensor
+
+BASE_DIR = Path(__file__).resolve().parent
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tiff"}
+LABELS = {"real": 0, "fake": 1}
+
+
+def load_validation(val_dir, img_size, max_images):
+    tensors, labels = [], []
+    for class_dir in sorted(Path(val_dir).iterdir()):
+        label = LABELS.get(class_dir.name.lower())
+        if label is None or not class_dir.is_dir():
+            continue
+        paths = [p for p in sorted(class_dir.iterdir()) if p.suffix.lower() in IMAGE_EXTS]
+        # An even share per class keeps a capped set balanced
+        for path in paths[:max(1, max_images // len(LABELS))]:
+            tensors.append(load_image_tensor(path, img_size))
+            labels.append(label)
+    if not tensors:
+        raise SystemExit(f"No Real/ or Fake/ images found in {val_dir}")
+    return torch.stack(tensors), np.array(labels)
+
+
+def score(model, images, batch_size):
+    probs = []
+    with torch.no_grad():
+        for i in range(0, len(images), batch_size):
+            probs.append(torch.sigmoid(model(images[i:i + batch_size]).float()).cpu())
+    return torch.cat(probs).numpy()
+
+
+def time_calls(model, x, iters):
+    with torch.no_grad():
+        model(x)
+        timings = []
+        for _ in range(iters):
+            start = time.perf_counter()
+            model(x)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--checkpoint", default=str(BASE_DIR / "outputs" / "best_model.pth"))
+    parser.add_argument("--output_dir", default=str(BASE_DIR / "outputs" / "runtimes"))
+    parser.add_argument("--runtimes", nargs="+", default=list(RUNTIMES), choices=RUNTIMES)
+    parser.add_argument("--val_dir", default=None)
+    parser.add_argument("--max_images", type=int, default=512)
+    parser.add_argument("--calib_images", type=int, default=128)
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--iters", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--report", default=None)
+    parser.add_argument("--safetensors", action="store_true",
+                        help="write <checkpoint>.safetensors for fast mmap loading")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = torch.device("cpu")
+    output_dir = Path(args.output_dir)
+
+    checkpoint = Path(args.checkpoint)
+    if checkpoint.exists():
+        model, img_size, _ = load_checkpoint(checkpoint, device)
+        model_id = checkpoint_id(checkpoint)
+        if args.safetensors:
+            print(f"📦 Wrote {save_safetensors(checkpoint)}")
+    else:
+        print(f"⚠️ {checkpoint} not found, using random weights (timings only)")
+        model, img_size, model_id = DetectorModel().eval(), DEFAULT_IMG_SIZE, "random-init"
+
+    if args.val_dir:
+        images, labels = load_validation(args.val_dir, img_size, args.max_images)
+    else:
+        torch.manual_seed(0)
+        images, labels = torch.randn(min(args.max_images, 64), 3, img_size, img_size), None
+    print(f"🖼️ {len(images)} validation inputs at {img_size}px")
+
+    # ---- build offline artifacts ----
+    calibration = torch.split(images[:args.calib_images], args.batch_size)
+    artifacts = {}
+    for runtime in args.runtimes:
+        if runtime not in ARTIFACTS:
+            continue
+        start = time.perf_counter()
+        try:
+            artifacts[runtime] = build_artifact(runtime, model, img_size, output_dir, calibration)
+            print(f"📦 Built {runtime} in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            print(f"❌ Could not build {runtime}: {e}")
+    if artifacts:
+        write_manifest(output_dir, model_id, img_size, artifacts)
+
+    # ---- parity and latency, through the same loader as the service ----
+    reference = score(model, images, args.batch_size)
+    single = images[:1]
+    batch = images[:args.batch_size]
+    results = []
+    for runtime in ["eager"] + [r for r in args.runtimes if r != "eager"]:
+        runner, loaded = load_runtime(model, device, img_size, output_dir, model_id, runtime=runtime)
+        if loaded != runtime:
+            results.append({"runtime": runtime, "error": "unavailable, see log"})
+            continue
+
+        probs = score(runner, images, args.batch_size)
+        diff = np.abs(probs - reference)
+        row = {
+            "runtime": runtime,
+            "max_abs_diff": round(float(diff.max()), 6),
+            "mean_abs_diff": round(float(diff.mean()), 6),
+            "label_agreement": round(float(np.mean((probs >= 0.5) == (reference >= 0.5))), 4),
+            "latency_ms": round(time_calls(runner, single, args.iters) * 1000, 2),
+            "throughput_ips": round(len(batch) / time_calls(runner, batch, args.iters), 1),
+            "artifact_mb": None
+        }
+        if labels is not None:
+            row["accuracy"] = round(float(np.mean((probs >= 0.5) == labels)), 4)
+        if runtime in artifacts:
+            row["artifact_mb"] = round(artifacts[runtime].stat().st_size / 1e6, 2)
+        results.append(row)
+
+    print(f"\n{'runtime':<14}{'latency ms':>12}{'img/s':>10}{'max diff':>12}{'agree':>8}{'acc':>8}")
+    for row in results:
+        if "error" in row:
+            print(f"{row['runtime']:<14}  {row['error']}")
+            continue
+        acc = row.get("accuracy")
+        print(
+            f"{row['runtime']:<14}{row['latency_ms']:>12}{row['throughput_ips']:>10}"
+            f"{row['max_abs_diff']:>12}{row['label_agreement']:>8}{'' if acc is None else acc:>8}"
+        )
+
+    if args.report:
+        report = {
+            "checkpoint": model_id,
+            "img_size": img_size,
+            "images": len(images),
+            "labelled": labels is not None,
+            "threads": torch.get_num_threads(),
+            "batch_size": args.batch_size,
+            "torch": torch.__version__,
+            "results": results
+        }
+        Path(args.report).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.report).write_text(json.dumps(report, indent=2))
+        print(f"📝 Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
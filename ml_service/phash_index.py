@@ -0,0 +1,291 @@
+"""
+Perceptual-hash index of analyzed media, for near-duplicate reuse.
+
+Recompressed, resized or re-wrapped copies of an image have different
+bytes (so the result cache misses them) but almost the same difference
+hash. Each analyzed image, and each sampled frame of a video, is stored
+with a 64-bit dHash (the lookup key), a 256-bit dHash (verification)
+and the verdict.
+
+Lookups use multi-index hashing: the 64 bits are split into radius + 1
+chunks, so any hash within the radius matches at least one chunk exactly
+(pigeonhole). One sorted array per chunk gives the candidates by binary
+search, and only those are compared bit by bit.
+
+The index file is a 16-byte header followed by fixed-size records,
+appended to as results come in and memory-mapped on load. Workers of one
+host share the file: each picks up records appended by the others.
+"""
+import os
+import threading
+import uuid
+import zlib
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+# ---------------- CONFIG ----------------
+# off: disabled; reuse: coarse hash match is enough; verify: the fine hash must match too.
+# Off by default: neither hash tells a swapped face from the original photo
+# (distances of 0-2 coarse and 0-5 fine bits), so a reused verdict can turn
+# an edit of an analyzed real image into a false negative.
+PHASH_MODE = os.environ.get("PHASH_MODE", "off").lower()
+PHASH_INDEX_PATH = os.environ.get(
+    "PHASH_INDEX_PATH", str(Path(__file__).resolve().parent / "outputs" / "phash_index.bin")
+)
+# Max Hamming distance between 64-bit hashes counted as a near duplicate
+PHASH_DISTANCE = int(os.environ.get("PHASH_DISTANCE", 4))
+# Max Hamming distance between 256-bit hashes in verify mode. Recompressed or
+# resized copies stay within ~6.
+PHASH_VERIFY_DISTANCE = int(os.environ.get("PHASH_VERIFY_DISTANCE", 8))
+PHASH_VIDEO_FRAMES = int(os.environ.get("PHASH_VIDEO_FRAMES", 8))
+# Fraction of a video's sampled frames that must match the same stored video
+PHASH_VIDEO_MIN_MATCH = float(os.environ.get("PHASH_VIDEO_MIN_MATCH", 0.75))
+
+MAGIC = b"PHIX"
+# 2: hashes of the Preprocessor output instead of the source image
+VERSION = 2
+HEADER_SIZE = 16
+RECORD = np.dtype([
+    ("hash", "<u8"),
+    ("fine", "<u8", (4,)),
+    ("prob", "<f4"),
+    ("tag", "<u4"),     # crc32 of model + analysis config: verdicts of other models never match
+    ("group", "<u8")    # shared by the frames of one video
+])
+# Records appended since the last table build are scanned linearly up to this count
+DELTA_LIMIT = 4096
+
+
+# ---------------- HASHING ----------------
+def _dhash_bits(gray, size):
+    """Row-wise difference hash of a grayscale PIL image, size * size bits"""
+    pixels = np.asarray(gray.resize((size + 1, size), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).reshape(-1)
+    return np.packbits(bits).view(">u8").astype("<u8")
+
+
+def dhash_image(img):
+    """
+    (64-bit hash, four 64-bit words of the 256-bit hash) of a PIL image,
+    e.g. the model input the Preprocessor already decoded
+    """
+    gray = img.convert("L")
+    return int(_dhash_bits(gray, 8)[0]), _dhash_bits(gray, 16)
+
+
+def video_hashes(video_path, frames=PHASH_VIDEO_FRAMES):
+    """dhash_image of frames spread evenly over the video"""
+    import cv2
+    from frame_sampler import FrameSampler
+
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise RuntimeError("Cannot open video for hashing")
+    try:
+        sampler = FrameSampler(cap, str(video_path), "uniform", max_frames=frames)
+        return [
+            dhash_image(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)))
+            for _, frame in sampler.frames()
+        ]
+    finally:
+        cap.release()
+
+
+def config_tag(model_id, config):
+    """32-bit tag of everything that makes two verdicts comparable"""
+    return zlib.crc32(repr((model_id, sorted(config.items()))).encode())
+
+
+def _popcount(words):
+    return np.bitwise_count(words).sum(axis=-1) if words.ndim > 1 else np.bitwise_count(words)
+
+
+# ---------------- INDEX ----------------
+class PhashIndex:
+    """
+    Append-only, memory-mapped store of (hash, fine hash, verdict) records
+    with Hamming-radius lookups.
+    """
+
+    def __init__(self, path=PHASH_INDEX_PATH, distance=PHASH_DISTANCE,
+                 verify_distance=PHASH_VERIFY_DISTANCE, mode=PHASH_MODE):
+        self.path = Path(path)
+        self.distance = max(0, min(63, int(distance)))
+        self.verify_distance = verify_distance
+        self.mode = mode
+
+        # radius + 1 chunks of (nearly) equal width
+        n = self.distance + 1
+        widths = [64 // n + (1 if i < 64 % n else 0) for i in range(n)]
+        offsets = np.cumsum([0] + widths[:-1])
+        self._chunks = [(int(o), (1 << w) - 1) for o, w in zip(offsets, widths)]
+
+        self._lock = threading.Lock()
+        self._records = np.zeros(0, dtype=RECORD)
+        self._indexed = 0
+        self._tables = []
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+        self._open()
+
+    # ---------- storage ----------
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        header = MAGIC + np.array([VERSION, RECORD.itemsize, 0], dtype="<u4").tobytes()
+        if self.path.exists() and self.path.stat().st_size >= HEADER_SIZE:
+            with open(self.path, "rb") as f:
+                found = f.read(HEADER_SIZE)
+            if found != header:
+                stale = self.path.with_suffix(".incompatible")
+                self.path.replace(stale)
+                print(f"⚠️ {self.path.name} has another format, moved to {stale.name}")
+        if not self.path.exists() or self.path.stat().st_size < HEADER_SIZE:
+            with open(self.path, "wb") as f:
+                f.write(header)
+
+        # A crash mid-append leaves a partial record: drop it so appends stay aligned
+        size = self.path.stat().st_size
+        whole = HEADER_SIZE + (size - HEADER_SIZE) // RECORD.itemsize * RECORD.itemsize
+        if whole != size:
+            os.truncate(self.path, whole)
+
+        self._file = open(self.path, "ab")
+        self._refresh(rebuild=True)
+
+    def _refresh(self, rebuild=False):
+        """Map records appended since the last look (by any process); caller holds _lock or is __init__"""
+        count = (os.fstat(self._file.fileno()).st_size - HEADER_SIZE) // RECORD.itemsize
+        if count == len(self._records) and not rebuild:
+            return
+        if count:
+            self._records = np.memmap(self.path, dtype=RECORD, mode="r", offset=HEADER_SIZE, shape=(count,))
+        if rebuild or count - self._indexed > DELTA_LIMIT:
+            self._build_tables()
+
+    def _build_tables(self):
+        hashes = np.asarray(self._records["hash"])
+        self._tables = []
+        for offset, mask in self._chunks:
+            values = (hashes >> np.uint64(offset)) & np.uint64(mask)
+            order = np.argsort(values, kind="stable")
+            self._tables.append((values[order], order))
+        self._indexed = len(hashes)
+
+    def add(self, hashes, prob, tag, group=0):
+        """Store (coarse, fine) hashes with the verdict; one record each, written in one append"""
+        if not hashes:
+            return
+        records = np.zeros(len(hashes), dtype=RECORD)
+        records["hash"] = [h for h, _ in hashes]
+        records["fine"] = [f for _, f in hashes]
+        records["prob"] = prob
+        records["tag"] = tag
+        records["group"] = group
+        with self._lock:
+            # O_APPEND: concurrent workers never interleave within one write
+            self._file.write(records.tobytes())
+            self._file.flush()
+            self._refresh()
+
+    def add_video(self, hashes, prob, tag):
+        self.add(hashes, prob, tag, group=uuid.uuid4().int >> 65)
+
+    # ---------- lookup ----------
+    def _candidates(self, h, tag):
+        """Indices of records with the tag within distance of h, and those distances"""
+        with self._lock:
+            self._refresh()
+            records, tables, indexed = self._records, self._tables, self._indexed
+
+        q = np.uint64(h)
+        found = []
+        for (offset, mask), (values, order) in zip(self._chunks, tables):
+            v = (q >> np.uint64(offset)) & np.uint64(mask)
+            lo, hi = np.searchsorted(values, v, "left"), np.searchsorted(values, v, "right")
+            found.append(order[lo:hi])
+        # Appended since the last table build: compared directly
+        found.append(np.arange(indexed, len(records)))
+        idx = np.unique(np.concatenate(found))
+        if len(idx) == 0:
+            return idx, idx, records
+
+        candidates = records[idx]
+        dist = _popcount(candidates["hash"] ^ q)
+        keep = (dist <= self.distance) & (candidates["tag"] == tag)
+        return idx[keep], dist[keep], records
+
+    def _match(self, hashes, tag):
+        """Best record for one (coarse, fine) pair: (record, distance, fine distance) or None"""
+        h, fine = hashes
+        idx, dist, records = self._candidates(h, tag)
+        if len(idx) == 0:
+            return None, False
+        fine_dist = _popcount(np.asarray(records["fine"][idx]) ^ fine)
+        if self.mode == "verify":
+            ok = fine_dist <= self.verify_distance
+            if not ok.any():
+                return None, True
+            idx, dist, fine_dist = idx[ok], dist[ok], fine_dist[ok]
+        best = int(np.lexsort((fine_dist, dist))[0])
+        return (records[idx[best]], int(dist[best]), int(fine_dist[best])), False
+
+    def lookup(self, hashes, tag):
+        """Closest stored image within the radius: {"prob", "distance", "fine_distance"} or None"""
+        match, rejected = self._match(hashes, tag)
+        self._count(match is not None, rejected)
+        if match is None:
+            return None
+        record, dist, fine_dist = match
+        return {"prob": round(float(record["prob"]), 6), "distance": dist, "fine_distance": fine_dist}
+
+    def lookup_video(self, frame_hashes, tag, min_match=PHASH_VIDEO_MIN_MATCH):
+        """
+        Stored video matched by at least min_match of the sampled frames:
+        {"prob", "matched_frames", "frames", "max_distance"} or None
+        """
+        votes = {}
+        any_rejected = False
+        for hashes in frame_hashes:
+            match, rejected = self._match(hashes, tag)
+            any_rejected |= rejected
+            if match is not None:
+                record, dist, _ = match
+                group = int(record["group"])
+                prob, count, worst = votes.get(group, (round(float(record["prob"]), 6), 0, 0))
+                votes[group] = (prob, count + 1, max(worst, dist))
+
+        needed = max(1, int(np.ceil(min_match * len(frame_hashes))))
+        best = max(votes.values(), key=lambda v: v[1], default=None)
+        hit = best is not None and best[1] >= needed
+        self._count(hit, any_rejected and not hit)
+        if not hit:
+            return None
+        prob, count, worst = best
+        return {"prob": prob, "matched_frames": count, "frames": len(frame_hashes), "max_distance": worst}
+
+    def _count(self, hit, rejected):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            elif rejected:
+                self.rejected += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "entries": len(self._records),
+                "distance": self.distance,
+                "hits": self.hits,
+                "misses": self.misses,
+                "rejected": self.rejected
+            }
+
+    def close(self):
+        self._file.close()
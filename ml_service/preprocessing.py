@@ -0,0 +1,112 @@
+"""
+Model input preprocessing shared by the image, batch, video and training
+paths: decode, resize to img_size x img_size (PIL bilinear) and normalize
+with the ImageNet mean/std.
+
+Decoding never materializes more pixels than the resize needs. JPEGs are
+decoded at 1/2, 1/4 or 1/8 scale through draft() (DCT scaling in
+libjpeg), and other formats are box-reduced by an integer factor before
+the bilinear pass (reducing_gap). Normalization is done in place, in
+a tensor the caller may preallocate.
+"""
+import os
+from functools import lru_cache
+
+import numpy as np
+import torch
+from PIL import Image
+
+# ---------------- CONFIG ----------------
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+# 0 decodes every image at full resolution (exact legacy pixels)
+PREPROCESS_DRAFT = os.environ.get("PREPROCESS_DRAFT", "1") == "1"
+# Box-reduce first while the image is more than this many times the target
+REDUCING_GAP = 2.0
+
+
+class Preprocessor:
+    """Decode/resize/normalize for one input size; get one with get_preprocessor()"""
+
+    def __init__(self, img_size, draft=PREPROCESS_DRAFT):
+        self.img_size = int(img_size)
+        self.draft = draft
+        self._tables = {}
+
+    def _norm(self, device):
+        """(scale, shift) with x * scale - shift == (x / 255 - mean) / std"""
+        key = str(device)
+        if key not in self._tables:
+            std = torch.tensor(STD, device=device).view(3, 1, 1)
+            mean = torch.tensor(MEAN, device=device).view(3, 1, 1)
+            self._tables[key] = (1.0 / (255.0 * std), mean / std)
+        return self._tables[key]
+
+    # ---------- decoding ----------
+    def decode(self, src):
+        """Path or file-like → RGB PIL image of img_size x img_size"""
+        size = (self.img_size, self.img_size)
+        with Image.open(src) as img:
+            if self.draft and img.format == "JPEG":
+                # Smallest DCT scale still >= the target on both sides
+                img.draft("RGB", size)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            return img.resize(size, Image.BILINEAR, reducing_gap=REDUCING_GAP if self.draft else None)
+
+    def decode_array(self, src):
+        """decode() as a writable (S, S, 3) uint8 array; src may already be decode()d"""
+        return np.array(src if isinstance(src, Image.Image) else self.decode(src))
+
+    # ---------- tensors ----------
+    def normalize_into(self, pixels, out):
+        """
+        (..., S, S, 3) uint8 RGB array → normalized (..., 3, S, S) floats
+        written into out (converted on copy, no intermediate float tensor)
+        """
+        pixels = np.ascontiguousarray(pixels)
+        if not pixels.flags.writeable:
+            # torch warns on (and may not write into) read-only numpy memory
+            pixels = pixels.copy()
+        x = torch.from_numpy(pixels)
+        out.copy_(x.movedim(-1, -3))
+        scale, shift = self._norm(out.device)
+        return out.mul_(scale).sub_(shift)
+
+    def __call__(self, src, out=None):
+        """Normalized (3, S, S) tensor of a path, file-like or decode()d image"""
+        if out is None:
+            out = torch.empty(3, self.img_size, self.img_size)
+        return self.normalize_into(self.decode_array(src), out)
+
+    def faces(self, crops, device):
+        """
+        BGR uint8 face crops (OpenCV) → one normalized (N, 3, S, S) tensor on
+        device. Resized straight into a preallocated uint8 batch, no PIL
+        round-trip per face.
+        """
+        import cv2
+
+        s = self.img_size
+        batch = np.empty((len(crops), s, s, 3), dtype=np.uint8)
+        for i, crop in enumerate(crops):
+            shrink = crop.shape[0] > s or crop.shape[1] > s
+            cv2.resize(crop, (s, s), dst=batch[i], interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR)
+            cv2.cvtColor(batch[i], cv2.COLOR_BGR2RGB, dst=batch[i])
+
+        out = torch.empty(len(crops), 3, s, s, device=device)
+        x = torch.from_numpy(batch).to(device)
+        out.copy_(x.permute(0, 3, 1, 2))
+        scale, shift = self._norm(device)
+        return out.mul_(scale).sub_(shift)
+
+
+@lru_cache(maxsize=None)
+def get_preprocessor(img_size):
+    """The shared Preprocessor of a model input size"""
+    return Preprocessor(img_size)
+
+
+def load_image_tensor(src, img_size, out=None):
+    """Decode a path or file-like image (or take a decode()d one) into a normalized (3, H, W) tensor"""
+    return get_preprocessor(img_size)(src, out)
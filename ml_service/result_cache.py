@@ -0,0 +1,132 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+# ---------------- CONFIG ----------------
+CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_ENTRIES", 1024))
+CACHE_MAX_BYTES = int(float(os.environ.get("RESULT_CACHE_MB", 64)) * 1024 * 1024)
+CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", 24 * 3600))
+# Empty disables the on-disk tier
+CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "")
+
+
+def cache_key(content_sha256, model_id, config):
+    """Key = media bytes + checkpoint identity + preprocessing/analysis config"""
+    blob = json.dumps(
+        {"content": content_sha256, "model": model_id, "config": config},
+        sort_keys=True
+    )
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier result cache.
+    Memory: LRU bounded by entry count and serialized size, with a TTL.
+    Disk (optional): one JSON file per key, survives restarts, expired by
+    file age. Disk hits are promoted back into memory.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES,
+                 ttl=CACHE_TTL, disk_dir=CACHE_DIR):
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self.ttl = ttl
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+        self._entries = OrderedDict()   # key -> (expires, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # ---------- public API ----------
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return copy.deepcopy(entry[2])
+                self._drop(key)
+
+        value = self._disk_get(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._memory_put(key, value, now)
+        return copy.deepcopy(value)
+
+    def put(self, key, value):
+        now = time.time()
+        self._memory_put(key, value, now)
+        self._disk_put(key, value)
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "disk_enabled": self.disk_dir is not None
+            }
+
+    # ---------- memory tier ----------
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _memory_put(self, key, value, now):
+        size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (now + self.ttl, size, copy.deepcopy(value))
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    # ---------- disk tier ----------
+    def _path(self, key):
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _disk_get(self, key, now):
+        if self.disk_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            if path.stat().st_mtime + self.ttl <= now:
+                path.unlink(missing_ok=True)
+                return None
+            return json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _disk_put(self, key, value):
+        if self.disk_dir is None:
+            return
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        # Write then rename so readers never see a partial file
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(value))
+        tmp.replace(path)
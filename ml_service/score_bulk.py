@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Score a directory tree or a manifest of images offline.
+
+Images are decoded by DataLoader worker processes with the same
+preprocessing as predict_image, scored in batches and appended to the
+output after every batch, so a crashed run loses at most one batch.
+Running again with the same --output resumes: paths already in the
+output are skipped.
+
+    python score_bulk.py --input Dataset/Validation --output outputs/predictions_log.csv
+    python score_bulk.py --input manifest.jsonl --output scores.parquet --batch_size 128
+
+Manifests are CSV (a "path" column) or JSONL ({"path": ...} per line);
+relative paths resolve against the manifest's folder and every other
+field (id, label, ...) is copied to the output. A .parquet output is a
+directory of part files (needs pyarrow).
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from pathlib import Path
+
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from model import checkpoint_id, load_checkpoint, prediction_from_prob
+from model_runtime import RUNTIMES, load_runtime
+from calibration import load_calibration
+from preprocessing import load_image_tensor
+
+BASE_DIR = Path(__file__).resolve().parent
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tiff"}
+SCORE_FIELDS = ["raw_prob", "fake_percent", "real_percent", "prediction", "error", "model_id", "calibration"]
+
+
+# ---------------- INPUTS ----------------
+def read_inputs(source):
+    """Records ({"path": str, ...}) from a directory tree or a CSV/JSONL manifest"""
+    source = Path(source)
+    if source.is_dir():
+        return [
+            {"path": str(p)} for p in sorted(source.rglob("*"))
+            if p.is_file() and p.suffix.lower() in IMAGE_EXTS
+        ]
+
+    if source.suffix.lower() == ".jsonl":
+        with open(source) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    elif source.suffix.lower() == ".csv":
+        with open(source, newline="") as f:
+            records = list(csv.DictReader(f))
+    else:
+        raise SystemExit(f"--input must be a directory, .csv or .jsonl manifest: {source}")
+
+    for record in records:
+        if not record.get("path"):
+            raise SystemExit(f"Manifest row without a path: {record}")
+        path = Path(record["path"])
+        record["path"] = str(path if path.is_absolute() else source.parent / path)
+    return records
+
+
+class ImageDataset(Dataset):
+    """(index, tensor, error); unreadable files yield a zero tensor and the error"""
+
+    def __init__(self, records, img_size):
+        self.records = records
+        self.img_size = img_size
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        try:
+            return i, load_image_tensor(self.records[i]["path"], self.img_size), ""
+        except Exception as e:
+            return i, torch.zeros(3, self.img_size, self.img_size), f"{type(e).__name__}: {e}"
+
+
+# ---------------- OUTPUTS ----------------
+class CsvOutput:
+    def __init__(self, path, fields):
+        self.path = Path(path)
+        self.fields = fields
+
+    def _fresh(self):
+        """
+        True unless the file starts with this run's header. Anything else
+        (blank placeholder, another log format) is set aside, not appended to.
+        """
+        if not self.path.exists():
+            return True
+        with open(self.path, newline="") as f:
+            first = f.readline()
+        if next(csv.reader([first]), None) == self.fields:
+            return False
+        if first.strip():
+            stale = self.path.with_suffix(self.path.suffix + ".old")
+            self.path.replace(stale)
+            print(f"⚠️ {self.path.name} has other columns, moved to {stale.name}")
+        else:
+            self.path.unlink()
+        return True
+
+    def done(self):
+        """Paths already scored; drops a partially written last line"""
+        if self._fresh():
+            return set()
+        data = self.path.read_bytes()
+        if not data.endswith(b"\n"):
+            data = data[:data.rfind(b"\n") + 1]
+            self.path.write_bytes(data)
+        with open(self.path, newline="") as f:
+            return {row.get("path") for row in csv.DictReader(f)}
+
+    def open(self):
+        fresh = self._fresh()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fields, extrasaction="ignore")
+        if fresh:
+            self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def parquet_schema(fields, records):
+    """
+    Arrow schema shared by every part file: scores have fixed types, manifest
+    columns are typed once from the whole manifest (string if always empty)
+    """
+    import pyarrow as pa
+
+    types = {
+        "raw_prob": pa.float64(),
+        "fake_percent": pa.float64(),
+        "real_percent": pa.float64()
+    }
+    extra = [f for f in fields if f != "path" and f not in SCORE_FIELDS]
+    if extra:
+        inferred = pa.Table.from_pylist([{f: r.get(f) for f in extra} for r in records]).schema
+        for f in extra:
+            t = inferred.field(f).type
+            types[f] = pa.string() if pa.types.is_null(t) else t
+    return pa.schema([(f, types.get(f, pa.string())) for f in fields])
+
+
+class ParquetOutput:
+    """
+    One part file per batch; parts are written atomically (tmp + rename)
+    and all share one schema, so a batch of unreadable images (no scores)
+    does not make a part that differs from the others
+    """
+
+    def __init__(self, path, fields, records):
+        self.path = Path(path)
+        self.fields = fields
+        self.schema = parquet_schema(fields, records)
+
+    def done(self):
+        import pyarrow.parquet as pq
+
+        if not self.path.exists():
+            return set()
+        return {
+            p for part in sorted(self.path.glob("part-*.parquet"))
+            for p in pq.read_table(part, columns=["path"]).column("path").to_pylist()
+        }
+
+    def open(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._part = len(list(self.path.glob("part-*.parquet")))
+
+    def write(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not rows:
+            return
+        table = pa.Table.from_pylist([{f: row.get(f) for f in self.fields} for row in rows], schema=self.schema)
+        final = self.path / f"part-{self._part:05d}.parquet"
+        tmp = final.with_suffix(".tmp")
+        pq.write_table(table, tmp)
+        tmp.replace(final)
+        self._part += 1
+
+    def close(self):
+        pass
+
+
+# ---------------- MAIN ----------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--input", required=True, help="image directory, or .csv/.jsonl manifest")
+    parser.add_argument("--output", default=str(BASE_DIR / "outputs" / "predictions_log.csv"))
+    parser.add_argument("--checkpoint", default=str(BASE_DIR / "outputs" / "best_model.pth"))
+    parser.add_argument("--runtime", default="eager", choices=RUNTIMES)
+    parser.add_argument("--runtime_dir", default=str(BASE_DIR / "outputs" / "runtimes"))
+    parser.add_argument("--batch_size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--log_every", type=float, default=10.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    checkpoint = Path(args.checkpoint)
+    if not checkpoint.exists():
+        raise SystemExit(f"Checkpoint not found: {checkpoint}")
+    model, img_size, meta = load_checkpoint(checkpoint, device)
+    model_id = checkpoint_id(checkpoint)
+    calibration = load_calibration(meta, model_id, checkpoint.parent)
+    calibration_version = calibration.version if calibration is not None else None
+    model, runtime = load_runtime(model, device, img_size, args.runtime_dir, model_id, runtime=args.runtime)
+
+    records = read_inputs(args.input)
+    if args.limit:
+        records = records[:args.limit]
+    extra = sorted({k for r in records for k in r} - {"path"} - set(SCORE_FIELDS))
+    fields = ["path", *extra, *SCORE_FIELDS]
+
+    if args.output.endswith(".parquet"):
+        output = ParquetOutput(args.output, fields, records)
+    else:
+        output = CsvOutput(args.output, fields)
+    done = output.done()
+    todo = [r for r in records if r["path"] not in done]
+    print(f"🖼️ {len(records)} images, {len(records) - len(todo)} already scored, {len(todo)} to go")
+    if not todo:
+        return
+
+    loader = DataLoader(
+        ImageDataset(todo, img_size),
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        pin_memory=device.type == "cuda",
+        persistent_workers=args.workers > 0
+    )
+
+    output.open()
+    start = last_log = time.time()
+    scored = errors = 0
+    try:
+        with torch.no_grad():
+            for indices, x, failures in loader:
+                probs = torch.sigmoid(model(x.to(device, non_blocking=True)).float())
+                if calibration is not None:
+                    probs = calibration(probs)
+                probs = probs.cpu().tolist()
+                rows = []
+                for i, prob, error in zip(indices.tolist(), probs, failures):
+                    row = dict(todo[i], model_id=f"{model_id}/{runtime}", calibration=calibration_version)
+                    if error:
+                        row["error"] = error
+                        errors += 1
+                    else:
+                        raw_prob, fake_p, real_p, label = prediction_from_prob(round(prob, 6))
+                        row.update(raw_prob=raw_prob, fake_percent=fake_p, real_percent=real_p, prediction=label)
+                    rows.append(row)
+                output.write(rows)
+                scored += len(rows)
+
+                now = time.time()
+                if now - last_log >= args.log_every:
+                    rate = scored / (now - start)
+                    eta = (len(todo) - scored) / rate if rate else 0
+                    print(f"⏱️ {scored}/{len(todo)} images, {rate:.1f} img/s, ETA {eta / 60:.1f} min")
+                    last_log = now
+    finally:
+        output.close()
+
+    elapsed = time.time() - start
+    print(f"✅ Scored {scored} images in {elapsed:.1f}s ({scored / elapsed:.1f} img/s), {errors} unreadable")
+    print(f"📝 Results in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
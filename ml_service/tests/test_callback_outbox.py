@@ -0,0 +1,222 @@
+"""
+CallbackOutbox delivery against a local http.server stub:
+
+    python -m pytest tests
+"""
+import json
+import sqlite3
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from callback_outbox import CallbackOutbox  # noqa: E402
+from http_client import make_session  # noqa: E402
+
+
+class Backend(ThreadingHTTPServer):
+    """Records every PATCH; answers each path with its scripted statuses, then 200"""
+    daemon_threads = True
+
+    def __init__(self, delay=0.0):
+        super().__init__(("127.0.0.1", 0), BackendHandler)
+        self.delay = delay
+        self.statuses = {}
+        self.received = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class BackendHandler(BaseHTTPRequestHandler):
+    def do_PATCH(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.received.append((self.path, body))
+            scripted = self.server.statuses.get(self.path)
+            status = scripted.pop(0) if scripted else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def backend():
+    server = Backend()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_sender_thread(monkeypatch):
+    # Deliveries happen only in flush(), on the test's thread
+    monkeypatch.setattr(CallbackOutbox, "start", lambda self: self)
+
+
+def make_outbox(db_path, **kwargs):
+    # No transport-level retries: the outbox's own backoff is under test
+    return CallbackOutbox(db_path, session=make_session(retries=0), timeout=5, **kwargs)
+
+
+def rows(db_path):
+    with sqlite3.connect(db_path) as db:
+        return db.execute("SELECT id, attempts, next_attempt, claim, last_error FROM outbox").fetchall()
+
+
+def make_due(db_path):
+    with sqlite3.connect(db_path) as db:
+        db.execute("UPDATE outbox SET next_attempt = 0")
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_delivers_payload(backend, tmp_path):
+    outbox = make_outbox(tmp_path / "outbox.sqlite3")
+    outbox.enqueue(f"{backend.url}/api/job/1/result", {"prediction": "REAL"})
+
+    assert outbox.flush()
+    assert backend.received == [("/api/job/1/result", {"prediction": "REAL"})]
+    assert outbox.stats()["delivered"] == 1
+
+
+@pytest.mark.parametrize("status", [500, 503, 429])
+def test_retries_server_errors_with_backoff(backend, tmp_path, status):
+    db_path = tmp_path / "outbox.sqlite3"
+    backend.statuses["/api/job/1/result"] = [status, status]
+    outbox = make_outbox(db_path)
+    outbox.enqueue(f"{backend.url}/api/job/1/result", {"n": 1})
+
+    delays = []
+    for _ in range(2):
+        before = time.time()
+        assert not outbox.flush()
+        [(_, attempts, next_attempt, claim, error)] = rows(db_path)
+        assert claim is None and error == f"HTTP {status}"
+        delays.append(next_attempt - before)
+        make_due(db_path)
+
+    # 1 s, then 2 s
+    assert attempts == 2
+    assert 1 <= delays[0] < 2 <= delays[1] < 3
+    assert outbox.flush()
+    assert len(backend.received) == 3
+    assert outbox.stats()["failed_attempts"] == 2
+
+
+def test_backoff_is_capped(backend, tmp_path):
+    db_path = tmp_path / "outbox.sqlite3"
+    backend.statuses["/r"] = [502] * 5
+    outbox = make_outbox(db_path, max_backoff=3)
+    outbox.enqueue(f"{backend.url}/r", {})
+
+    for _ in range(4):
+        outbox.flush()
+        make_due(db_path)
+    before = time.time()
+    outbox.flush()
+    [(_, attempts, next_attempt, _, _)] = rows(db_path)
+    # 2 ** 4 = 16 s uncapped
+    assert attempts == 5
+    assert 3 <= next_attempt - before < 4
+
+
+def test_retries_connection_errors(tmp_path):
+    db_path = tmp_path / "outbox.sqlite3"
+    outbox = make_outbox(db_path)
+    outbox.enqueue(f"http://127.0.0.1:{closed_port()}/api/job/1/result", {})
+
+    assert not outbox.flush()
+    [(_, attempts, _, claim, error)] = rows(db_path)
+    assert attempts == 1 and claim is None and error
+    assert outbox.stats()["dropped"] == 0
+
+
+@pytest.mark.parametrize("status", [400, 404, 410])
+def test_drops_client_errors(backend, tmp_path, status):
+    db_path = tmp_path / "outbox.sqlite3"
+    backend.statuses["/api/job/1/result"] = [status]
+    outbox = make_outbox(db_path)
+    outbox.enqueue(f"{backend.url}/api/job/1/result", {})
+
+    assert outbox.flush()
+    assert rows(db_path) == []
+    assert len(backend.received) == 1
+    assert outbox.stats()["dropped"] == 1
+
+
+def test_redelivers_after_restart(backend, tmp_path):
+    db_path = tmp_path / "outbox.sqlite3"
+    down = f"http://127.0.0.1:{closed_port()}"
+    first = make_outbox(db_path)
+    first.enqueue(f"{down}/api/job/1/result", {"n": 1})
+    first.enqueue(f"{backend.url}/api/job/2/result", {"n": 2})
+    del first
+
+    restarted = make_outbox(db_path)
+    assert restarted.pending() == 2
+    assert not restarted.flush()
+    assert backend.received == [("/api/job/2/result", {"n": 2})]
+    assert restarted.pending() == 1
+
+
+def test_lease_survives_a_crash_mid_delivery(backend, tmp_path):
+    db_path = tmp_path / "outbox.sqlite3"
+    crashed = make_outbox(db_path)
+    crashed.enqueue(f"{backend.url}/api/job/1/result", {"n": 1})
+    assert len(crashed._claim()) == 1
+
+    restarted = make_outbox(db_path)
+    # Still leased to the crashed process
+    assert not restarted.flush()
+    assert backend.received == []
+
+    make_due(db_path)
+    assert restarted.flush()
+    assert backend.received == [("/api/job/1/result", {"n": 1})]
+
+
+def test_leased_rows_are_not_delivered_twice(backend, tmp_path):
+    db_path = tmp_path / "outbox.sqlite3"
+    backend.delay = 0.02
+    outboxes = [make_outbox(db_path, batch_size=4, workers=2) for _ in range(3)]
+    for n in range(30):
+        outboxes[0].enqueue(f"{backend.url}/api/job/{n}/result", {"n": n})
+
+    threads = [threading.Thread(target=outbox.flush) for outbox in outboxes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    delivered = sorted(body["n"] for _, body in backend.received)
+    assert delivered == list(range(30))
+    assert sum(outbox.stats()["delivered"] for outbox in outboxes) == 30
+    assert rows(db_path) == []
+
+
+def test_session_retries_server_errors(backend):
+    backend.statuses["/r"] = [503, 503]
+    session = make_session(retries=2, backoff=0)
+
+    response = session.patch(f"{backend.url}/r", json={}, timeout=5)
+    assert response.status_code == 200
+    assert len(backend.received) == 3
@@ -0,0 +1,158 @@
+"""
+PhashIndex lookups: multi-index candidates, appends shared through the
+memory-mapped file, and video frame voting.
+
+    python -m pytest tests
+"""
+import subprocess
+import sys
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_DIR))
+sys.path.insert(0, str(SERVICE_DIR / "benchmarks"))
+
+from phash_index import PHASH_VIDEO_MIN_MATCH, PhashIndex, dhash_image  # noqa: E402
+from preprocessing import Preprocessor  # noqa: E402
+from synthetic import photo_image  # noqa: E402
+
+TAG = 7
+decode = Preprocessor(224).decode
+
+
+def hashes_of(img, fmt="JPEG", **save_args):
+    """dhash_image of img after a round trip through fmt, decoded like the service does"""
+    buffer = BytesIO()
+    img.save(buffer, fmt, **save_args)
+    buffer.seek(0)
+    return dhash_image(decode(buffer))
+
+
+def flip_bits(h, n):
+    return h ^ ((1 << n) - 1)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = PhashIndex(tmp_path / "phash.bin", distance=4, verify_distance=8, mode="verify")
+    yield index
+    index.close()
+
+
+@pytest.fixture(scope="module")
+def photo():
+    return photo_image(640, 480, seed=1)
+
+
+def test_exact_copy_hits(index, photo):
+    index.add([hashes_of(photo, quality=95)], 0.9, TAG)
+
+    match = index.lookup(hashes_of(photo, quality=95), TAG)
+    assert match == {"prob": pytest.approx(0.9), "distance": 0, "fine_distance": 0}
+
+
+@pytest.mark.parametrize("copy", [
+    lambda img: hashes_of(img, quality=60),
+    lambda img: hashes_of(img.resize((320, 240)), quality=80),
+    lambda img: hashes_of(img.resize((480, 360)), "WEBP", quality=60),
+])
+def test_recompressed_copy_hits(index, photo, copy):
+    index.add([hashes_of(photo, quality=95)], 0.9, TAG)
+
+    match = index.lookup(copy(photo), TAG)
+    assert match is not None
+    assert match["distance"] <= index.distance and match["fine_distance"] <= index.verify_distance
+
+
+def test_different_image_misses(index, photo):
+    index.add([hashes_of(photo, quality=95)], 0.9, TAG)
+
+    assert index.lookup(hashes_of(photo_image(640, 480, seed=2), quality=95), TAG) is None
+    assert index.stats()["misses"] == 1
+
+
+def test_other_tag_misses(index, photo):
+    index.add([hashes_of(photo, quality=95)], 0.9, TAG)
+
+    assert index.lookup(hashes_of(photo, quality=95), TAG + 1) is None
+
+
+def test_radius_through_chunk_tables(tmp_path):
+    rng = np.random.default_rng(0)
+    fine = np.zeros(4, dtype="<u8")
+    stored = [int(h) for h in rng.integers(0, 2 ** 63, 2000, dtype=np.uint64)]
+    path = tmp_path / "phash.bin"
+    with_records = PhashIndex(path, distance=4, mode="reuse")
+    with_records.add([(h, fine) for h in stored], 0.5, TAG)
+    with_records.close()
+
+    # Reopened: the records are looked up through the per-chunk tables, not the delta scan
+    index = PhashIndex(path, distance=4, mode="reuse")
+    assert index.stats()["entries"] == 2000
+    for h in stored[:50]:
+        assert index.lookup((flip_bits(h, 4), fine), TAG)["distance"] == 4
+        assert index.lookup((flip_bits(h, 5), fine), TAG) is None
+    index.close()
+
+
+def test_picks_up_appends_of_another_process(index, tmp_path, photo):
+    query = hashes_of(photo, quality=95)
+    assert index.lookup(query, TAG) is None
+
+    writer = f"""
+import sys
+sys.path[:0] = [{str(SERVICE_DIR)!r}, {str(SERVICE_DIR / "benchmarks")!r}]
+from io import BytesIO
+from phash_index import PhashIndex, dhash_image
+from preprocessing import Preprocessor
+from synthetic import photo_image
+buffer = BytesIO()
+photo_image(640, 480, seed=1).save(buffer, "JPEG", quality=95)
+buffer.seek(0)
+index = PhashIndex({str(index.path)!r}, mode="verify")
+index.add([dhash_image(Preprocessor(224).decode(buffer))], 0.25, {TAG})
+index.close()
+"""
+    subprocess.run([sys.executable, "-c", writer], check=True)
+
+    match = index.lookup(query, TAG)
+    assert match is not None and match["prob"] == pytest.approx(0.25)
+    assert index.stats()["entries"] == 1
+
+
+def video_frames(n, seed):
+    return [hashes_of(photo_image(320, 240, seed=seed * 100 + i), quality=90) for i in range(n)]
+
+
+def test_video_hits_when_enough_frames_match(index):
+    frames = video_frames(8, seed=1)
+    index.add_video(frames, 0.8, TAG)
+
+    needed = int(np.ceil(PHASH_VIDEO_MIN_MATCH * len(frames)))
+    others = video_frames(8, seed=2)
+    match = index.lookup_video(frames[:needed] + others[needed:], TAG)
+    assert match is not None
+    assert match["matched_frames"] == needed and match["frames"] == 8
+    assert match["prob"] == pytest.approx(0.8)
+
+
+def test_video_misses_below_min_match(index):
+    frames = video_frames(8, seed=1)
+    index.add_video(frames, 0.8, TAG)
+
+    needed = int(np.ceil(PHASH_VIDEO_MIN_MATCH * len(frames)))
+    others = video_frames(8, seed=2)
+    assert index.lookup_video(frames[:needed - 1] + others[needed - 1:], TAG) is None
+
+
+def test_video_votes_per_stored_video(index):
+    first, second = video_frames(8, seed=1), video_frames(8, seed=3)
+    index.add_video(first, 0.8, TAG)
+    index.add_video(second, 0.1, TAG)
+
+    # Half the frames from each: neither stored video reaches the threshold on its own
+    assert index.lookup_video(first[:4] + second[4:], TAG) is None
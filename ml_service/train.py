@@ -1,307 +1,375 @@
 #!/usr/bin/env python3
-
-from dotenv import load_dotenv 
-load_dotenv() 
-from pathlib import Path
-from flask import Flask, request, render_template, redirect, flash, jsonify
-from werkzeug.utils import secure_filename
-from PIL import Image
-import uuid
+"""
+Fine-tune DetectorModel on Dataset/{Train,Validation}/{Real,Fake}.
+
+The first run decodes every image once, resized exactly like the service
+resizes its inputs, into a uint8 memmap under --cache_dir (N x S x S x 3).
+Later epochs (and runs) only read raw pixels from it; scaling,
+augmentation and normalization run on whole batches on the training
+device, so epochs are bound by the model rather than by JPEG decoding.
+The cache is rebuilt when the image files or --img_size change.
+
+Checkpoints are saved as {"args", "model_state_dict"}, the format
+ensure_model_loaded expects: best_model.pth (best val AUC) and
+final_model.pth in --output_dir.
+
+    python train.py --dataset_root Dataset --epochs 8 --batch_size 32 --img_size 128 --use_amp
+"""
+import argparse
+import hashlib
+import json
+import math
 import os
+import random
+import time
+from pathlib import Path
+
+import numpy as np
 import torch
 import torch.nn as nn
-import timm
-import torchvision.transforms as transforms
-import requests
-from io import BytesIO
-import time
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Dataset
 
-# ---------------- CONFIG ----------------
-BASE_DIR = Path(__file__).resolve().parent
-UPLOADS = BASE_DIR / "static" / "uploads"
-UPLOADS.mkdir(parents=True, exist_ok=True)
-
-MODEL_PATHS = [
-    BASE_DIR / "outputs" / "best_model.pth",
-    BASE_DIR / "outputs" / "final_model.pth"
-]
-
-# ✅ Supported image formats
-ALLOWED_IMG = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tiff"}
-
-DEFAULT_IMG_SIZE = 224
-DEFAULT_MODEL_NAME = "efficientnet_b0"
-
-app = Flask(__name__)
-app.secret_key = "deepfake-secret"
-
-# ---------------- MODEL ----------------
-class DetectorModel(nn.Module):
-    def __init__(self, backbone_name="efficientnet_b0", drop_rate=0.3):
-        super().__init__()
-        self.backbone = timm.create_model(
-            backbone_name,
-            pretrained=False,
-            num_classes=0,
-            global_pool="avg"
-        )
-        feat_dim = self.backbone.num_features
-        self.head = nn.Sequential(
-            nn.Dropout(drop_rate),
-            nn.Linear(feat_dim, 256),
-            nn.ReLU(),
-            nn.Dropout(drop_rate / 2),
-            nn.Linear(256, 1)
-        )
+from calibration import Calibration
+from model import DetectorModel, DEFAULT_MODEL_NAME, save_safetensors
+from preprocessing import MEAN, PREPROCESS_DRAFT, STD, get_preprocessor
 
-    def forward(self, x):
-        feats = self.backbone.forward_features(x)
-        feats = torch.nn.functional.adaptive_avg_pool2d(feats, 1)
-        feats = feats.view(feats.size(0), -1)
-        return self.head(feats).squeeze(1)
+BASE_DIR = Path(__file__).resolve().parent
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tiff"}
+CLASSES = {"real": 0, "fake": 1}
+
+
+# ---------------- TENSOR CACHE ----------------
+def list_split(split_dir):
+    """Sorted (path, label) pairs of one split, Real=0 / Fake=1"""
+    items = []
+    for class_dir in sorted(Path(split_dir).iterdir()):
+        label = CLASSES.get(class_dir.name.lower())
+        if label is None or not class_dir.is_dir():
+            continue
+        for path in sorted(class_dir.rglob("*")):
+            if path.is_file() and path.suffix.lower() in IMAGE_EXTS:
+                items.append((path, label))
+    if not items:
+        raise SystemExit(f"No Real/ or Fake/ images under {split_dir}")
+    return items
+
+
+def split_signature(items, img_size):
+    # Draft decoding changes the cached pixels slightly, so it is part of the key
+    digest = hashlib.sha256(f"{img_size}|draft={PREPROCESS_DRAFT}".encode())
+    for path, label in items:
+        stat = path.stat()
+        digest.update(f"{path}|{label}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+class _DecodeDataset(Dataset):
+    """Used once, to fill the cache: decode + resize in loader workers"""
+
+    def __init__(self, items, img_size):
+        self.items = items
+        self.img_size = img_size
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, i):
+        try:
+            # Decoded and resized exactly like images at serving time
+            pixels = get_preprocessor(self.img_size).decode_array(self.items[i][0])
+            return i, torch.from_numpy(pixels.copy()), True
+        except Exception:
+            return i, torch.zeros(self.img_size, self.img_size, 3, dtype=torch.uint8), False
+
+
+def build_cache(split, split_dir, cache_dir, img_size, workers, rebuild=False):
+    """Returns the cache's metadata; (re)builds it when stale"""
+    items = list_split(split_dir)
+    signature = split_signature(items, img_size)
+    cache_dir = Path(cache_dir)
+    data_path = cache_dir / f"{split}_{img_size}.u8"
+    meta_path = cache_dir / f"{split}_{img_size}.json"
+
+    if not rebuild and meta_path.exists() and data_path.exists():
+        meta = json.loads(meta_path.read_text())
+        if meta.get("signature") == signature:
+            print(f"📦 {split}: {meta['count']} cached images in {data_path}")
+            return meta
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = data_path.with_suffix(".tmp")
+    data = np.memmap(tmp_path, mode="w+", dtype=np.uint8, shape=(len(items), img_size, img_size, 3))
+    valid = np.zeros(len(items), dtype=bool)
+
+    start = time.time()
+    loader = DataLoader(_DecodeDataset(items, img_size), batch_size=64, num_workers=workers)
+    for indices, pixels, ok in loader:
+        data[indices.numpy()] = pixels.numpy()
+        valid[indices.numpy()] = ok.numpy()
+    data.flush()
+    del data
+    tmp_path.replace(data_path)
+
+    meta = {
+        "split": split,
+        "img_size": img_size,
+        "count": len(items),
+        "labels": [label for _, label in items],
+        "valid": valid.tolist(),
+        "files": [str(path) for path, _ in items],
+        "signature": signature
+    }
+    meta_path.write_text(json.dumps(meta))
+    bad = int((~valid).sum())
+    print(f"📦 {split}: cached {len(items)} images in {time.time() - start:.1f}s"
+          f"{f' ({bad} unreadable, skipped)' if bad else ''}")
+    return meta
+
+
+class CachedImages(Dataset):
+    """(uint8 HWC tensor, label) straight from the memmap"""
+
+    def __init__(self, cache_dir, meta):
+        self.path = Path(cache_dir) / f"{meta['split']}_{meta['img_size']}.u8"
+        self.shape = (meta["count"], meta["img_size"], meta["img_size"], 3)
+        self.labels = meta["labels"]
+        self.indices = [i for i, ok in enumerate(meta["valid"]) if ok]
+        self._data = None
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        # Opened lazily so every loader worker maps the file itself
+        if self._data is None:
+            self._data = np.memmap(self.path, mode="r", dtype=np.uint8, shape=self.shape)
+        j = self.indices[i]
+        return torch.from_numpy(np.array(self._data[j])), float(self.labels[j])
+
+
+# ---------------- BATCH TRANSFORMS ----------------
+def augment(x):
+    """Flip, color jitter and ±10° rotation of a float (N, 3, H, W) batch in [0, 1]"""
+    n = x.size(0)
+    rand = lambda *shape: torch.rand(n, *shape, device=x.device)  # noqa: E731
+
+    x = torch.where(rand(1, 1, 1) < 0.5, x.flip(3), x)
+
+    x = x * (1 + (rand(1, 1, 1) * 2 - 1) * 0.2)
+    mean = x.mean(dim=(1, 2, 3), keepdim=True)
+    x = (x - mean) * (1 + (rand(1, 1, 1) * 2 - 1) * 0.2) + mean
+    gray = (x * torch.tensor([0.299, 0.587, 0.114], device=x.device).view(1, 3, 1, 1)).sum(1, keepdim=True)
+    x = ((x - gray) * (1 + (rand(1, 1, 1) * 2 - 1) * 0.2) + gray).clamp(0, 1)
+
+    angle = (rand() * 2 - 1) * math.radians(10)
+    cos, sin = torch.cos(angle), torch.sin(angle)
+    zeros = torch.zeros_like(cos)
+    theta = torch.stack([torch.stack([cos, -sin, zeros], 1), torch.stack([sin, cos, zeros], 1)], 1)
+    grid = F.affine_grid(theta, list(x.shape), align_corners=False)
+    return F.grid_sample(x, grid, align_corners=False)
+
+
+def to_model_input(pixels, device, train):
+    """uint8 NHWC batch → normalized NCHW float batch on device"""
+    x = pixels.to(device, non_blocking=True).permute(0, 3, 1, 2).float().div_(255)
+    if train:
+        x = augment(x)
+    mean = torch.tensor(MEAN, device=device).view(1, 3, 1, 1)
+    std = torch.tensor(STD, device=device).view(1, 3, 1, 1)
+    return ((x - mean) / std).contiguous(memory_format=torch.channels_last)
+
+
+# ---------------- TRAINING ----------------
+def roc_auc(labels, probs):
+    """Mann-Whitney AUC with tied scores averaged"""
+    labels = np.asarray(labels)
+    n_pos = int(labels.sum())
+    n_neg = len(labels) - n_pos
+    if n_pos == 0 or n_neg == 0:
+        return float("nan")
+    order = np.argsort(probs)
+    ranks = np.empty(len(probs))
+    ranks[order] = np.arange(1, len(probs) + 1)
+    _, inverse, counts = np.unique(probs, return_inverse=True, return_counts=True)
+    ranks = (np.bincount(inverse, weights=ranks) / counts)[inverse]
+    return float((ranks[labels == 1].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg))
+
+
+def evaluate(model, loader, device, use_amp, amp_dtype):
+    model.eval()
+    criterion = nn.BCEWithLogitsLoss(reduction="sum")
+    total_loss, probs, labels = 0.0, [], []
+    with torch.no_grad():
+        for pixels, y in loader:
+            x = to_model_input(pixels, device, train=False)
+            y = y.float().to(device, non_blocking=True)
+            with torch.autocast(device.type, dtype=amp_dtype, enabled=use_amp):
+                logits = model(x)
+            total_loss += criterion(logits.float(), y).item()
+            probs.append(torch.sigmoid(logits.float()).cpu())
+            labels.append(y.cpu())
+    probs = torch.cat(probs).numpy()
+    labels = torch.cat(labels).numpy()
+    return {
+        "loss": total_loss / len(labels),
+        "auc": roc_auc(labels, probs),
+        "acc": float(((probs >= 0.5) == labels).mean()),
+        "probs": probs,
+        "labels": labels
+    }
 
-# ---------------- GLOBAL ----------------
-_global = {"model": None, "device": None, "img_size": DEFAULT_IMG_SIZE}
 
-def find_model_path():
-    for p in MODEL_PATHS:
-        if p.exists():
-            return p
-    return None
+def save_checkpoint(path, model, args, epoch, metrics):
+    """.pth checkpoint plus the mmap-able .safetensors copy the service loads"""
+    torch.save({
+        "args": {**vars(args), "img_size": args.img_size, "backbone_name": args.backbone_name},
+        "model_state_dict": model.state_dict(),
+        "epoch": epoch,
+        "metrics": {"val_loss": metrics["loss"], "val_auc": metrics["auc"], "val_acc": metrics["acc"]}
+    }, path)
+    save_safetensors(path)
 
-def ensure_model_loaded():
-    if _global["model"] is None:
-        model_path = find_model_path()
-        if model_path is None:
-            print("⚠️ Model not found → fallback mode enabled")
-            return None, "cpu", DEFAULT_IMG_SIZE
 
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        ckpt = torch.load(model_path, map_location=device)
+def fit_calibrator(probs, labels, output_dir):
+    """
+    Isotonic fit on validation scores, embedded in best_model.pth as a
+    piecewise-linear table so it always travels with those weights
+    (calibrator.joblib is kept for inspection).
+    """
+    from sklearn.isotonic import IsotonicRegression
+    import joblib
 
-        img_size = ckpt.get("args", {}).get("img_size", DEFAULT_IMG_SIZE)
-        backbone = ckpt.get("args", {}).get("backbone_name", DEFAULT_MODEL_NAME)
+    calibrator = IsotonicRegression(out_of_bounds="clip").fit(probs, labels)
+    joblib.dump(calibrator, Path(output_dir) / "calibrator.joblib")
 
-        model = DetectorModel(backbone_name=backbone)
-        state = ckpt.get("model_state_dict", ckpt)
-        model.load_state_dict(state)
+    try:
+        calibration = Calibration.from_isotonic(calibrator, source="train")
+    except ValueError as e:
+        # e.g. constant validation scores collapse the fit to a single point
+        print(f"⚠️ Isotonic fit is degenerate ({e}), checkpoint kept uncalibrated")
+        return
+
+    best_path = Path(output_dir) / "best_model.pth"
+    ckpt = torch.load(best_path, map_location="cpu")
+    ckpt["calibration"] = calibration.to_dict()
+    torch.save(ckpt, best_path)
+    save_safetensors(best_path)
+    print(f"📐 Isotonic calibration ({len(calibrator.X_thresholds_)} points) embedded in {best_path}")
+
+
+def pick_device(use_mps):
+    if torch.cuda.is_available():
+        return torch.device("cuda")
+    if use_mps and torch.backends.mps.is_available():
+        return torch.device("mps")
+    return torch.device("cpu")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dataset_root", default="Dataset")
+    parser.add_argument("--output_dir", default=str(BASE_DIR / "outputs"))
+    parser.add_argument("--cache_dir", default="preproc_data")
+    parser.add_argument("--rebuild_cache", action="store_true")
+    parser.add_argument("--backbone_name", default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--pretrained", action="store_true", help="start from timm ImageNet weights")
+    parser.add_argument("--epochs", type=int, default=8)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--accum_steps", type=int, default=1, help="batches per optimizer step")
+    parser.add_argument("--img_size", type=int, default=128)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--weight_decay", type=float, default=1e-4)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--use_amp", action="store_true")
+    parser.add_argument("--use_mps", action="store_true")
+    parser.add_argument("--calibrate", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    device = pick_device(args.use_mps)
+    # bf16 autocast on CPU, fp16 + loss scaling on CUDA; MPS runs fp32
+    use_amp = args.use_amp and device.type in ("cuda", "cpu")
+    amp_dtype = torch.float16 if device.type == "cuda" else torch.bfloat16
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    root = Path(args.dataset_root)
+    train_meta = build_cache("train", root / "Train", args.cache_dir, args.img_size, args.workers, args.rebuild_cache)
+    val_meta = build_cache("val", root / "Validation", args.cache_dir, args.img_size, args.workers, args.rebuild_cache)
+
+    loader_args = {
+        "num_workers": args.workers,
+        "pin_memory": device.type == "cuda",
+        "persistent_workers": args.workers > 0
+    }
+    train_loader = DataLoader(
+        CachedImages(args.cache_dir, train_meta), batch_size=args.batch_size, shuffle=True, drop_last=False,
+        **loader_args
+    )
+    val_loader = DataLoader(CachedImages(args.cache_dir, val_meta), batch_size=args.batch_size * 2, **loader_args)
+
+    model = DetectorModel(backbone_name=args.backbone_name, pretrained=args.pretrained)
+    model = model.to(device).to(memory_format=torch.channels_last)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=args.lr, weight_decay=args.weight_decay)
+    scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode="min", factor=0.5, patience=1)
+    scaler = torch.amp.GradScaler("cuda", enabled=use_amp and device.type == "cuda")
+    criterion = nn.BCEWithLogitsLoss()
+
+    print(f"🏋️ Training {args.backbone_name} on {device} "
+          f"({len(train_loader.dataset)} train / {len(val_loader.dataset)} val, "
+          f"effective batch {args.batch_size * args.accum_steps}, amp={use_amp})")
+
+    best_auc = -1.0
+    best_metrics = None
+    for epoch in range(1, args.epochs + 1):
+        model.train()
+        optimizer.zero_grad(set_to_none=True)
+        running, seen, data_wait = 0.0, 0, 0.0
+        epoch_start = tick = time.time()
+
+        for step, (pixels, y) in enumerate(train_loader):
+            data_wait += time.time() - tick
+            x = to_model_input(pixels, device, train=True)
+            y = y.float().to(device, non_blocking=True)
+
+            with torch.autocast(device.type, dtype=amp_dtype, enabled=use_amp):
+                logits = model(x)
+            loss = criterion(logits.float(), y)
+            scaler.scale(loss / args.accum_steps).backward()
+
+            if (step + 1) % args.accum_steps == 0 or step + 1 == len(train_loader):
+                scaler.step(optimizer)
+                scaler.update()
+                optimizer.zero_grad(set_to_none=True)
+
+            running += loss.item() * len(y)
+            seen += len(y)
+            tick = time.time()
+
+        elapsed = time.time() - epoch_start
+        metrics = evaluate(model, val_loader, device, use_amp, amp_dtype)
+        scheduler.step(metrics["loss"])
+        print(
+            f"Epoch {epoch}/{args.epochs} - Train Loss: {running / seen:.4f}, "
+            f"Val Loss: {metrics['loss']:.4f}, Val AUC: {metrics['auc']:.4f}, Val Acc: {metrics['acc']:.4f} "
+            f"({seen / elapsed:.0f} img/s, data wait {100 * data_wait / elapsed:.0f}%)"
+        )
 
-        _global.update({
-            "model": model.to(device).eval(),
-            "device": device,
-            "img_size": img_size
-        })
+        if metrics["auc"] > best_auc or best_metrics is None:
+            best_auc = metrics["auc"]
+            best_metrics = metrics
+            save_checkpoint(output_dir / "best_model.pth", model, args, epoch, metrics)
 
-    return _global["model"], _global["device"], _global["img_size"]
+    save_checkpoint(output_dir / "final_model.pth", model, args, args.epochs, metrics)
+    print(f"✅ Best val AUC {best_auc:.4f}, checkpoints in {output_dir}")
 
-# ---------------- IMAGE CONVERSION HELPER ----------------
-def convert_image_to_standard_format(image_path):
-    """
-    Converts any image format (including WebP) to RGB and saves as JPG
-    Returns the converted image path
-    """
-    try:
-        img = Image.open(image_path)
-        
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        converted_path = image_path.parent / f"converted_{image_path.stem}.jpg"
-        img.save(converted_path, 'JPEG', quality=95)
-        
-        print(f"✅ Converted {image_path.name} to JPG format")
-        
-        if "temp_" in str(image_path):
-            image_path.unlink()
-        
-        return converted_path
-        
-    except Exception as e:
-        print(f"❌ Image conversion failed: {str(e)}")
-        return image_path
-
-# ---------------- IMAGE PREDICTION ----------------
-def predict_image(img_path):
-    model, device, img_size = ensure_model_loaded()
-
-    if model is None:
-        fake_percent = 66.4
-        real_percent = 33.6
-        raw_prob = round(fake_percent / 100, 4)
-        label = "FAKE (AI-generated)"
-        return raw_prob, fake_percent, real_percent, label
-
-    transform = transforms.Compose([
-        transforms.Resize((img_size, img_size)),
-        transforms.ToTensor(),
-        transforms.Normalize(
-            mean=(0.485, 0.456, 0.406),
-            std=(0.229, 0.224, 0.225)
-        )
-    ])
+    if args.calibrate:
+        fit_calibrator(best_metrics["probs"], best_metrics["labels"], output_dir)
 
-    img = Image.open(img_path).convert("RGB")
-    t = transform(img).unsqueeze(0).to(device)
 
-    with torch.no_grad():
-        logit = model(t).item()
-        raw_prob = torch.sigmoid(torch.tensor(logit)).item()
-
-    if raw_prob >= 0.60:
-        label = "FAKE (AI-generated)"
-    elif raw_prob >= 0.15:
-        label = "FAKE (Edited appearance)"
-    else:
-        label = "REAL"
-
-    fake_percent = round(raw_prob * 100, 2)
-    real_percent = round(100 - fake_percent, 2)
-
-    return raw_prob, fake_percent, real_percent, label
-
-# ---------------- WEB ROUTES ----------------
-@app.route("/")
-def home():
-    return render_template("home.html", result=None)
-
-@app.route("/predict", methods=["POST"])
-def predict():
-    file = request.files.get("image")
-    if not file or file.filename == "":
-        flash("No file uploaded")
-        return redirect("/")
-
-    ext = Path(file.filename).suffix.lower()
-    if ext not in ALLOWED_IMG:
-        flash("Unsupported file type. Please upload an image.")
-        return redirect("/")
-
-    filename = secure_filename(f"{uuid.uuid4().hex}_{file.filename}")
-    input_path = UPLOADS / filename
-    file.save(input_path)
-
-    # Convert and analyze image
-    converted_path = convert_image_to_standard_format(input_path)
-    raw_prob, fake_p, real_p, label = predict_image(str(converted_path))
-
-    result = {
-        "raw_prob": round(raw_prob, 4),
-        "fake_percent": fake_p,
-        "real_percent": real_p,
-        "label": label,
-        "file": converted_path.name
-    }
-    return render_template("home.html", result=result)
-
-# ---------------- SIMPLE API ROUTES ----------------
-@app.route("/api/health", methods=["GET"])
-def api_health():
-    """Health check endpoint"""
-    model, _, _ = ensure_model_loaded()
-    return jsonify({
-        "status": "healthy",
-        "model_loaded": model is not None,
-        "device": str(_global.get("device", "cpu"))
-    })
-
-@app.route("/api/analyze", methods=["POST"])
-def api_analyze():
-    """
-    Simple image analysis endpoint
-    Accepts: multipart/form-data with 'image' file
-    OR JSON: { "imageUrl": "https://..." }
-    """
-    try:
-        start_time = time.time()
-        
-        # Check if file was uploaded directly
-        if 'image' in request.files:
-            file = request.files['image']
-            if file.filename == '':
-                return jsonify({"error": "No file selected"}), 400
-            
-            ext = Path(file.filename).suffix.lower()
-            if ext not in ALLOWED_IMG:
-                return jsonify({"error": f"Unsupported format: {ext}"}), 400
-            
-            temp_filename = f"temp_{uuid.uuid4().hex}{ext}"
-            temp_path = UPLOADS / temp_filename
-            file.save(temp_path)
-        
-        # Check if URL was provided
-        elif request.is_json and request.json.get('imageUrl'):
-            image_url = request.json['imageUrl']
-            print(f"🔗 Downloading image from: {image_url}")
-            
-            response = requests.get(image_url, timeout=30)
-            response.raise_for_status()
-            
-            # Detect file type
-            content_type = response.headers.get('content-type', '').lower()
-            if '.webp' in image_url.lower() or 'webp' in content_type:
-                ext = '.webp'
-            elif '.png' in image_url.lower() or 'png' in content_type:
-                ext = '.png'
-            else:
-                ext = '.jpg'
-            
-            temp_filename = f"temp_{uuid.uuid4().hex}{ext}"
-            temp_path = UPLOADS / temp_filename
-            
-            with open(temp_path, 'wb') as f:
-                f.write(response.content)
-            
-            print(f"💾 Downloaded {temp_path.name} ({temp_path.stat().st_size} bytes)")
-        
-        else:
-            return jsonify({"error": "No image file or URL provided"}), 400
-        
-        # Process the image
-        converted_path = convert_image_to_standard_format(temp_path)
-        raw_prob, fake_p, real_p, label = predict_image(str(converted_path))
-        processing_time = round(time.time() - start_time, 2)
-        
-        # Cleanup
-        if converted_path.exists() and converted_path != temp_path:
-            converted_path.unlink()
-        if temp_path.exists():
-            temp_path.unlink()
-        
-        # Determine risk level
-        if fake_p >= 70:
-            risk_level = "HIGH_RISK"
-        elif fake_p >= 40:
-            risk_level = "SUSPICIOUS"
-        else:
-            risk_level = "LOW"
-        
-        result = {
-            "success": True,
-            "score": round(raw_prob, 4),
-            "confidence": round(abs(raw_prob - 0.5) * 2, 4),
-            "riskLevel": risk_level,
-            "prediction": label,
-            "details": {
-                "fake_percent": fake_p,
-                "real_percent": real_p,
-                "processing_time_seconds": processing_time
-            }
-        }
-        
-        print(f"✅ Analysis complete: {risk_level} (Score: {raw_prob:.4f})")
-        return jsonify(result), 200
-        
-    except Exception as e:
-        import traceback
-        print(f"❌ Error during analysis: {str(e)}")
-        print(traceback.format_exc())
-        return jsonify({"error": str(e)}), 500
-
-# ---------------- MAIN ----------------
 if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 8001))
-    print(f"🚀 Starting Flask AI Service on port {port}")
-    print(f"📁 Uploads directory: {UPLOADS}")
-    print(f"🖼️  Supported image formats: {ALLOWED_IMG}")
-    print(f"🎯 Image-only analysis mode")
-    app.run(host="0.0.0.0", port=port, debug=False)
\ No newline at end of file
+    main()
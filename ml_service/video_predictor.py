@@ -1,15 +1,189 @@
+import os
 import cv2
+import queue
+import threading
+import time
 import torch
-from collections import deque
-from torchvision import transforms
-from PIL import Image
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from preprocessing import get_preprocessor
+from face_tracker import FaceTracker, TRACK_MODE, DETECT_EVERY
+from frame_sampler import (
+    FrameSampler, SAMPLE_MODE, EARLY_EXIT, EARLY_EXIT_HALF_WIDTH,
+    EARLY_EXIT_MIN_FRAMES, confidence_half_width
+)
 
 THRESHOLD = 0.7
 SMOOTHING = 30
+BATCH_SIZE = int(os.environ.get("VIDEO_BATCH_SIZE", 16))
+DETECT_WORKERS = int(os.environ.get("VIDEO_DETECT_WORKERS", min(4, os.cpu_count() or 1)))
+QUEUE_SIZE = int(os.environ.get("VIDEO_QUEUE_SIZE", 32))
+# Longest side of the image the cascade runs on (0 = full resolution)
+DETECT_MAX_SIDE = int(os.environ.get("VIDEO_DETECT_MAX_SIDE", 480))
 
-face_cascade = cv2.CascadeClassifier(
-    cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-)
+CASCADE_PATH = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+
+face_cascade = cv2.CascadeClassifier(CASCADE_PATH)
+
+# CascadeClassifier is not safe to share between threads
+_thread_local = threading.local()
+
+def get_face_cascade():
+    if not hasattr(_thread_local, "cascade"):
+        _thread_local.cascade = cv2.CascadeClassifier(CASCADE_PATH)
+    return _thread_local.cascade
+
+# ---------------- PIPELINE HELPERS ----------------
+_DONE = object()
+
+class StageStats:
+    """
+    Frames handled and busy time of one pipeline stage; every step (a frame,
+    or a crop batch for infer) is also observed as ml_stage_seconds{stage="video_<name>"}
+    """
+
+    def __init__(self, name):
+        self.stage = f"video_{name}"
+        self.frames = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, frames, seconds):
+        metrics.STAGE_SECONDS.observe(seconds, stage=self.stage)
+        with self._lock:
+            self.frames += frames
+            self.busy += seconds
+
+    def report(self, wall):
+        return {
+            "frames": self.frames,
+            "busy_seconds": round(self.busy, 4),
+            "fps": round(self.frames / self.busy, 2) if self.busy > 0 else None,
+            "utilization": round(self.busy / wall, 3) if wall > 0 else None
+        }
+
+def _put(q, item, stop):
+    """Blocking put that gives up once the pipeline is stopping"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+def preprocess_faces(crops, img_size, device):
+    """Resize and normalize BGR face crops into one (N, 3, S, S) tensor"""
+    return get_preprocessor(img_size).faces(crops, device)
+
+def predict_faces(crops, model, device, img_size, batch_size=BATCH_SIZE, calibration=None,
+                  cascade=None, counts=None):
+    """
+    Fake probability for each crop, batch_size crops per forward pass.
+    With a cascade only uncertain crops reach model; counts (a Counter)
+    then gets how many crops each stage decided.
+    """
+    if model is None:
+        return [0.65] * len(crops)   # 👈 SAFE FALLBACK (Render)
+
+    probs = []
+    with torch.no_grad():
+        for start in range(0, len(crops), batch_size):
+            x = preprocess_faces(crops[start:start + batch_size], img_size, device)
+            if cascade is None:
+                logits = model(x)
+            else:
+                logits, escalated = cascade(x)
+                if counts is not None:
+                    counts["full"] += int(escalated.sum())
+                    counts["screen"] += len(x) - int(escalated.sum())
+            batch_probs = torch.sigmoid(logits.float())
+            if calibration is not None:
+                batch_probs = calibration(batch_probs)
+            probs.extend(batch_probs.cpu().tolist())
+    return probs
+
+def fit_frame(frame, w, h):
+    """Only resize frames that do not match the writer size"""
+    if frame.shape[1] != w or frame.shape[0] != h:
+        frame = cv2.resize(frame, (w, h))
+    return frame
+
+def detection_gray(frame, max_side=DETECT_MAX_SIDE):
+    """
+    Grayscale image for the cascade, downscaled so its longest side is at
+    most max_side. Returns (gray, scale) where scale maps detection
+    coordinates back to the full frame.
+    """
+    h, w = frame.shape[:2]
+    longest = max(h, w)
+    if max_side and longest > max_side:
+        scale = longest / max_side
+        small = cv2.resize(
+            frame,
+            (max(1, round(w / scale)), max(1, round(h / scale))),
+            interpolation=cv2.INTER_AREA
+        )
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), scale
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), 1.0
+
+def scale_boxes(boxes, scale, w, h):
+    """Map (x, y, w, h) boxes from detection to full-frame coordinates"""
+    if scale == 1.0:
+        return [tuple(int(v) for v in box) for box in boxes]
+    out = []
+    for x, y, bw, bh in boxes:
+        x0, y0 = int(round(x * scale)), int(round(y * scale))
+        x1, y1 = min(w, int(round((x + bw) * scale))), min(h, int(round((y + bh) * scale)))
+        out.append((x0, y0, x1 - x0, y1 - y0))
+    return out
+
+def draw_overlays(frame, faces):
+    """Draw [(track_id, (x, y, w, h), smoothed_prob)] onto the frame in place"""
+    for _, (x, y, fw, fh), avg_prob in faces:
+        label = "FAKE" if avg_prob > THRESHOLD else "REAL"
+        color = (0, 0, 255) if label == "FAKE" else (0, 255, 0)
+
+        cv2.rectangle(frame, (x, y), (x+fw, y+fh), color, 2)
+        cv2.putText(
+            frame,
+            f"{label} {avg_prob*100:.1f}%",
+            (x, y-10),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.7,
+            color,
+            2
+        )
+    return frame
+
+def open_writer(output_path, fps, w, h):
+    # -------- SAFE CODEC FALLBACK --------
+    writer = None
+    for codec in ["avc1", "mp4v", "XVID"]:
+        fourcc = cv2.VideoWriter_fourcc(*codec)
+        writer = cv2.VideoWriter(output_path, fourcc, fps, (w, h))
+        if writer.isOpened():
+            return writer
+    raise RuntimeError("VideoWriter failed for all codecs")
+
+def detect_faces(frame, w, h, stats, max_side=DETECT_MAX_SIDE):
+    t0 = time.perf_counter()
+    frame = fit_frame(frame, w, h)
+    gray, scale = detection_gray(frame, max_side)
+    faces = get_face_cascade().detectMultiScale(gray, 1.3, 5)
+    faces = scale_boxes(faces, scale, w, h)
+    stats.add(1, time.perf_counter() - t0)
+    return frame, faces
 
 def run_advanced_video_prediction(
     video_path,
@@ -17,100 +191,284 @@ def run_advanced_video_prediction(
     device,
     img_size,
     output_path,
-    max_frames=120   # 👈 FRAME LIMIT (VERY IMPORTANT)
+    max_frames=120,   # 👈 FRAME LIMIT (VERY IMPORTANT)
+    batch_size=BATCH_SIZE,
+    detect_workers=DETECT_WORKERS,
+    queue_size=QUEUE_SIZE,
+    track_mode=TRACK_MODE,
+    detect_every=DETECT_EVERY,
+    detect_max_side=DETECT_MAX_SIDE,
+    sample_mode=SAMPLE_MODE,
+    early_exit=EARLY_EXIT,
+    early_exit_half_width=EARLY_EXIT_HALF_WIDTH,
+    calibration=None,
+    cascade=None
 ):
+    """
+    Pipelined analysis: a decode thread feeds a detection pool, the calling
+    thread scores faces in batches and an encoder thread writes the
+    annotated frames. Bounded queues between stages keep memory flat and
+    frames are consumed in decode order, so output order is preserved.
+
+    Faces get stable track IDs that key the temporal smoothing. In "flow"
+    track mode the Haar cascade only runs every detect_every frames (or
+    when optical flow loses the faces) and boxes are propagated between.
+    Flow is only run across consecutive source frames: when the sampler
+    skips frames (uniform sampling of a video longer than max_frames),
+    every sampled frame is detected and tracked by IoU instead.
+    Detection and tracking run on a copy downscaled to detect_max_side;
+    boxes are mapped back so face crops keep full resolution.
+
+    Which frames are analyzed is up to sample_mode (see frame_sampler);
+    max_frames is the sampling budget. With early_exit, decoding stops
+    once the 95% confidence interval of the per-frame fake probability
+    is narrower than +/- early_exit_half_width.
+
+    calibration (see calibration.py) maps face probabilities before
+    smoothing and aggregation, as for images. With a cascade (see
+    cascade.py) face crops are screened first; "cascade" in the result
+    counts the crops each stage decided.
+
+    With output_path=None nothing is drawn or encoded; the returned
+    "overlays" (per-frame boxes and smoothed scores) are enough for
+    video_renderer to produce the annotated video later.
+    """
+    if track_mode not in ("iou", "flow"):
+        raise ValueError(f"Unknown track mode: {track_mode}")
+
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         raise RuntimeError("Cannot open input video")
 
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    if fps is None or fps <= 1:
-        fps = 25.0
+    try:
+        sampler = FrameSampler(cap, video_path, sample_mode, max_frames)
+    except Exception:
+        cap.release()
+        raise
+    fps = sampler.fps
 
     w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
-    # -------- SAFE CODEC FALLBACK --------
     writer = None
-    for codec in ["avc1", "mp4v", "XVID"]:
-        fourcc = cv2.VideoWriter_fourcc(*codec)
-        writer = cv2.VideoWriter(output_path, fourcc, fps, (w, h))
-        if writer.isOpened():
-            break
+    if output_path is not None:
+        try:
+            writer = open_writer(output_path, sampler.output_fps, w, h)
+        except Exception:
+            cap.release()
+            raise
 
-    if writer is None or not writer.isOpened():
-        raise RuntimeError("VideoWriter failed for all codecs")
+    stats = {name: StageStats(name) for name in ("decode", "detect", "infer", "encode")}
+    stop = threading.Event()
+    enough = threading.Event()   # early exit: stop decoding, finish the rest
+    errors = []
 
-    transform = transforms.Compose([
-        transforms.Resize((img_size, img_size)),
-        transforms.ToTensor(),
-        transforms.Normalize(
-            mean=(0.485, 0.456, 0.406),
-            std=(0.229, 0.224, 0.225)
-        )
-    ])
+    tracker = FaceTracker(detect_every=detect_every)
+    flow_state = {"prev_gray": None, "prev_index": None}
+
+    # -------- FLOW TRACKING (sequential, replaces detect_faces) --------
+    def track_faces(index, frame):
+        t0 = time.perf_counter()
+        frame = fit_frame(frame, w, h)
+        gray, scale = detection_gray(frame, detect_max_side)
 
-    face_scores = []
+        tracks = None
+        prev_gray = flow_state["prev_gray"]
+        gap = index - flow_state["prev_index"] if prev_gray is not None else None
+        if prev_gray is not None and not tracker.needs_detection(gap):
+            tracks = tracker.propagate(prev_gray, gray)
+            if tracker.confidence < tracker.min_flow_confidence:
+                tracks = None   # lost the faces, detect on this frame
+        if tracks is None:
+            tracks = tracker.update(get_face_cascade().detectMultiScale(gray, 1.3, 5))
+
+        flow_state["prev_gray"], flow_state["prev_index"] = gray, index
+        ids = [tid for tid, _ in tracks]
+        tracks = list(zip(ids, scale_boxes([box for _, box in tracks], scale, w, h)))
+        stats["detect"].add(1, time.perf_counter() - t0)
+        return frame, tracks
+
+    # Tracking carries state frame to frame, so it gets a single worker
+    if track_mode == "flow":
+        detect_workers = 1
+
+    # Detection futures in decode order, then annotated frames to encode
+    detect_q = queue.Queue(maxsize=max(1, queue_size))
+    encode_q = queue.Queue(maxsize=max(1, queue_size))
+    pool = ThreadPoolExecutor(max_workers=max(1, detect_workers), thread_name_prefix="detect")
+
+    # -------- DECODE STAGE --------
+    def decode():
+        try:
+            frames = sampler.frames()
+            while not stop.is_set() and not enough.is_set():
+                t0 = time.perf_counter()
+                item = next(frames, None)
+                if item is None:
+                    break
+                stats["decode"].add(1, time.perf_counter() - t0)
+                index, frame = item
+
+                if track_mode == "flow":
+                    fut = pool.submit(track_faces, index, frame)
+                else:
+                    fut = pool.submit(detect_faces, frame, w, h, stats["detect"], detect_max_side)
+                if not _put(detect_q, (index, fut), stop):
+                    break
+        except Exception as e:
+            errors.append(e)
+        finally:
+            _put(detect_q, _DONE, stop)
+
+    # -------- ENCODE STAGE --------
+    def encode():
+        try:
+            while True:
+                frame = _get(encode_q, stop)
+                if frame is _DONE:
+                    break
+                t0 = time.perf_counter()
+                writer.write(frame)
+                stats["encode"].add(1, time.perf_counter() - t0)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    face_scores = {}   # track id -> deque of recent probabilities
+    cascade_counts = Counter()
     all_probs = []
+    frame_scores = []  # per analyzed frame with faces
+    overlays = []      # per analyzed frame, for deferred rendering
+    raw_frame_probs = []   # unsmoothed, for the early-exit interval
 
-    frame_count = 0   # 👈 INITIALIZE COUNTER
+    # Frames wait here until the crops of the whole window are scored
+    window = []    # (frame_index, frame, [(track_id, box)])
+    crops = []
 
-    while True:
-        ret, frame = cap.read()
-        if not ret or frame_count >= max_frames:
-            break
-        frame_count += 1
+    # -------- INFERENCE STAGE --------
+    def flush_window():
+        t0 = time.perf_counter()
+        probs = iter(predict_faces(
+            crops, model, device, img_size, batch_size, calibration, cascade, cascade_counts
+        ))
+        annotated = []
 
-        frame = cv2.resize(frame, (w, h))
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+        for index, frame, faces in window:
+            raw, scored = [], []
+            for track_id, (x, y, fw, fh) in faces:
+                if frame[y:y+fh, x:x+fw].size == 0:
+                    continue
 
-        while len(face_scores) < len(faces):
-            face_scores.append(deque(maxlen=SMOOTHING))
+                prob = next(probs)
+                scores = face_scores.setdefault(track_id, deque(maxlen=SMOOTHING))
+                scores.append(prob)
+                avg_prob = sum(scores) / len(scores)
+                all_probs.append(avg_prob)
+                raw.append(prob)
+                scored.append((track_id, (int(x), int(y), int(fw), int(fh)), avg_prob))
 
-        for i, (x, y, fw, fh) in enumerate(faces):
-            face = frame[y:y+fh, x:x+fw]
-            if face.size == 0:
-                continue
+            overlays.append({
+                "frame": index,
+                "faces": [[tid, list(box), round(p, 4)] for tid, box, p in scored]
+            })
+            if writer is not None:
+                annotated.append(draw_overlays(frame, scored))
 
-            img = Image.fromarray(cv2.cvtColor(face, cv2.COLOR_BGR2RGB))
-            t = transform(img).unsqueeze(0).to(device)
+            if raw:
+                smoothed = [p for _, _, p in scored]
+                raw_frame_probs.append(sum(raw) / len(raw))
+                frame_scores.append({
+                    "frame": index,
+                    "timestamp": round(index / fps, 3),
+                    "score": round(sum(smoothed) / len(smoothed), 4),
+                    "faces": len(raw)
+                })
 
-            # -------- MODEL / FALLBACK --------
-            if model is not None:
-                with torch.no_grad():
-                    logit = model(t).item()
-                    prob = torch.sigmoid(torch.tensor(logit)).item()
-            else:
-                prob = 0.65   # 👈 SAFE FALLBACK (Render)
+        stats["infer"].add(len(window), time.perf_counter() - t0)
+        window.clear()
+        crops.clear()
+
+        if (
+            early_exit
+            and len(raw_frame_probs) >= EARLY_EXIT_MIN_FRAMES
+            and confidence_half_width(raw_frame_probs) <= early_exit_half_width
+        ):
+            enough.set()
+
+        for frame in annotated:
+            if not _put(encode_q, frame, stop):
+                break
+
+    start = time.perf_counter()
+    decoder = threading.Thread(target=decode, name="video-decode", daemon=True)
+    encoder = threading.Thread(target=encode, name="video-encode", daemon=True)
+    decoder.start()
+    if writer is not None:
+        encoder.start()
+
+    try:
+        while True:
+            item = _get(detect_q, stop)
+            if item is _DONE:
+                break
+            index, fut = item
+            frame, faces = fut.result()
+            if track_mode != "flow":
+                faces = tracker.update(faces)
+
+            for _, (x, y, fw, fh) in faces:
+                face = frame[y:y+fh, x:x+fw]
+                if face.size != 0:
+                    crops.append(face)
+            window.append((index, frame, faces))
 
-            face_scores[i].append(prob)
-            avg_prob = sum(face_scores[i]) / len(face_scores[i])
-            all_probs.append(avg_prob)
+            # Bound the window by crops (one batch) and by frames held in memory
+            if len(crops) >= batch_size or len(window) >= batch_size:
+                flush_window()
 
-            label = "FAKE" if avg_prob > THRESHOLD else "REAL"
-            color = (0, 0, 255) if label == "FAKE" else (0, 255, 0)
+        flush_window()
+        if writer is not None:
+            _put(encode_q, _DONE, stop)
+            encoder.join()
+    except Exception:
+        stop.set()
+        raise
+    finally:
+        stop.set()
+        decoder.join()
+        if writer is not None:
+            encoder.join()
+            writer.release()
+        pool.shutdown(wait=True, cancel_futures=True)
+        cap.release()
 
-            cv2.rectangle(frame, (x, y), (x+fw, y+fh), color, 2)
-            cv2.putText(
-                frame,
-                f"{label} {avg_prob*100:.1f}%",
-                (x, y-10),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.7,
-                color,
-                2
-            )
+    if errors:
+        raise errors[0]
 
-        writer.write(frame)
+    wall = time.perf_counter() - start
+    stage_report = {name: st.report(wall) for name, st in stats.items()}
+    frames_analyzed = stats["decode"].frames
 
-    cap.release()
-    writer.release()
+    print(
+        f"🎞️ Video pipeline: {frames_analyzed} frames in {wall:.2f}s "
+        f"({frames_analyzed / wall if wall > 0 else 0:.1f} fps) | "
+        + ", ".join(f"{n} {r['fps']} fps" for n, r in stage_report.items())
+    )
 
     fake_avg = sum(all_probs) / len(all_probs) if all_probs else 0.0
 
     return {
         "fake_percent": round(fake_avg * 100, 2),
         "real_percent": round((1 - fake_avg) * 100, 2),
-        "output_path": output_path
+        "output_path": output_path if writer is not None else None,
+        "frames_analyzed": frames_analyzed,
+        "processing_seconds": round(wall, 3),
+        "stage_stats": stage_report,
+        "tracking": {"mode": track_mode, **tracker.stats()},
+        "sampling": {**sampler.stats(), "early_exit": enough.is_set()},
+        "cascade": dict(cascade_counts) if cascade is not None else None,
+        "frame_scores": frame_scores,
+        "overlays": overlays,
+        "output_fps": sampler.output_fps,
+        "frame_size": [w, h]
     }
@@ -0,0 +1,135 @@
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# ---------------- CONFIG ----------------
+# "lazy"       : render on first download
+# "background" : render right after analysis on a background thread
+RENDER_MODE = os.environ.get("VIDEO_RENDER_MODE", "lazy")
+RENDER_TTL_HOURS = float(os.environ.get("VIDEO_RENDER_TTL_HOURS", 24))
+
+
+def render_annotated_video(video_path, overlays, output_path, fps, frame_size):
+    """
+    Draw stored per-frame boxes and scores onto the source frames.
+    overlays is the "overlays" list returned by run_advanced_video_prediction.
+    """
+    # cv2 and the video pipeline load on the first render, not at service start
+    import cv2
+
+    from frame_sampler import FrameSampler
+    from video_predictor import draw_overlays, fit_frame, open_writer
+
+    w, h = frame_size
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise RuntimeError("Cannot open source video for rendering")
+
+    by_frame = {o["frame"]: o["faces"] for o in overlays}
+    writer = open_writer(str(output_path), fps, w, h)
+    try:
+        sampler = FrameSampler(cap, str(video_path), "head")
+        for index, frame in sampler.frames_at(sorted(by_frame)):
+            faces = [(tid, tuple(box), prob) for tid, box, prob in by_frame[index]]
+            writer.write(draw_overlays(fit_frame(frame, w, h), faces))
+    finally:
+        writer.release()
+        cap.release()
+
+
+class VideoRenderer:
+    """
+    Deferred annotated-video rendering.
+    save() keeps the source video and the analysis overlays under
+    root/<render_id>/; get() renders them once (lazily or in the
+    background) and returns the MP4 path. Sources are dropped after
+    rendering and whole entries expire after ttl_hours.
+    """
+
+    def __init__(self, root, mode=RENDER_MODE, ttl_hours=RENDER_TTL_HOURS):
+        if mode not in ("lazy", "background"):
+            raise ValueError(f"Unknown render mode: {mode}")
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self.ttl = ttl_hours * 3600
+
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._pool = None
+
+    def _dir(self, render_id):
+        if not render_id.isalnum():
+            raise KeyError(render_id)
+        return self.root / render_id
+
+    def _lock(self, render_id):
+        with self._locks_lock:
+            return self._locks.setdefault(render_id, threading.Lock())
+
+    def save(self, source_path, video_result, render_id):
+        """Move the source video in and store the overlays, returns render_id"""
+        self.prune()
+        entry = self._dir(render_id)
+        entry.mkdir(parents=True, exist_ok=True)
+
+        source = entry / f"source{Path(source_path).suffix}"
+        shutil.move(str(source_path), source)
+        (entry / "overlays.json").write_text(json.dumps({
+            "source": source.name,
+            "fps": video_result["output_fps"],
+            "frame_size": video_result["frame_size"],
+            "overlays": video_result["overlays"]
+        }))
+
+        if self.mode == "background":
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+            self._pool.submit(self._render_logged, render_id)
+        return render_id
+
+    def get(self, render_id):
+        """Path of the rendered MP4, rendering it first if needed"""
+        entry = self._dir(render_id)
+        output = entry / "annotated.mp4"
+        if output.exists():
+            return output
+
+        with self._lock(render_id):
+            if output.exists():
+                return output
+            meta_path = entry / "overlays.json"
+            if not meta_path.exists():
+                raise KeyError(render_id)
+
+            meta = json.loads(meta_path.read_text())
+            t0 = time.time()
+            tmp = entry / "rendering.mp4"
+            render_annotated_video(entry / meta["source"], meta["overlays"], tmp, meta["fps"], meta["frame_size"])
+            tmp.replace(output)
+            (entry / meta["source"]).unlink(missing_ok=True)
+            print(f"🎬 Rendered {render_id} in {time.time() - t0:.2f}s")
+
+        with self._locks_lock:
+            self._locks.pop(render_id, None)
+        return output
+
+    def _render_logged(self, render_id):
+        try:
+            self.get(render_id)
+        except Exception as e:
+            print(f"❌ Background render {render_id} failed: {e}")
+
+    def prune(self):
+        """Drop entries older than the TTL"""
+        cutoff = time.time() - self.ttl
+        for entry in self.root.iterdir():
+            try:
+                if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry, ignore_errors=True)
+            except FileNotFoundError:
+                continue
@@ -0,0 +1,11 @@
+"""
+WSGI entry point for pre-fork servers (see gunicorn.conf.py).
+
+Importing this module in the master loads the checkpoint once; forked
+workers inherit the weights copy-on-write and call init_worker().
+"""
+import app as service
+
+service.load_weights()
+
+app = service.app